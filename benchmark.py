@@ -0,0 +1,192 @@
+import io
+import time
+import calendar
+import tempfile
+import contextlib
+from collections import Counter
+from datetime import date
+import click
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.event_template import EventTemplate
+from calendar_manager.batch_writer import MAX_BATCH_SIZE
+from calendar_manager.fake_google import FakeCalendarService, FakeSpreadsheet, FakeSession
+from calendar_manager.rate_limit import TokenBucket, DEFAULT_RATE
+from calendar_manager.read_gspread import SheetIndex, MONTH_ROWS, TEMPLATE_HEADERS, read_months, get_event_templates, get_caregivers
+from calendar_manager.read_gspread import get_all_cells_from_spreadsheet, get_cells_from_ranges
+from calendar_manager.sheet_cache import get_cached_cells
+from calendar_manager import session
+
+# Benchmarks scheduling and sheet parsing against the in-process fake Google backend,
+# reporting API calls and wall time, so that changes can be compared without network.
+
+DATE_TYPES = {
+    "A" : { "name": "Weekday A", "color": "1" },
+    "AWE" : { "name": "Weekend A", "color": "2" },
+    "B" : { "name": "Weekday B", "color": "3" },
+    "BWE" : { "name": "Weekend B", "color": "4" },
+}
+
+MONTH_NAMES = list(calendar.month_name)[1:]
+
+
+def make_templates(count):
+    "Returns `count` event templates, alternating all day and timed ones on different weekdays"
+    templates = []
+    for i in range(count):
+        weekdays = [wk for wk in range(7) if (wk + i) % 3 != 0]
+        datetypes = ["A", "B"] if i % 2 == 0 else ["AWE", "BWE", "A"]
+        start, end = ('', '') if i % 3 == 0 else ('{:02}:00'.format(8 + i % 12), '{:02}:30'.format(8 + i % 12))
+        templates.append(EventTemplate(f'template{i}', f'Event {i}', '', datetypes, weekdays, start, end))
+    return templates
+
+
+def get_datetype(day):
+    "Alternates A and B weeks, with weekend datetypes on weekends"
+    letter = "A" if day.isocalendar()[1] % 2 == 0 else "B"
+    return letter + "WE" if day.weekday() >= 5 else letter
+
+
+def make_month(year, month):
+    "Returns month data as read by `read_month`"
+    days = { str(d): get_datetype(date(year, month, d)) for d in range(1, calendar.monthrange(year, month)[1] + 1) }
+    caregivers = { datetype: list(days.values()).count(datetype) for datetype in DATE_TYPES }
+    return { 'month': month, 'year': year, 'weeks': [], 'days': days, 'caregivers': caregivers }
+
+
+def get_next_months(count):
+    "Returns (year, month) for `count` months starting next month, so that no day is in the past"
+    today = date.today()
+    return [(today.year + (today.month + i - 1) // 12, (today.month + i - 1) % 12 + 1) for i in range(1, count + 1)]
+
+
+def make_sheet(years, templates, filler_cols=30):
+    """Returns the cells of a worksheet with the caregivers and templates tables, and
+    a block per month of `years` school years, with month names suffixed by the year
+    after the first one so they can all be found. Filler columns make rows as wide
+    as real workbooks.
+    """
+    width = 8 * 12 + filler_cols
+    rows = [['Caregivers', 'Name', 'Color']] + [[code, info['name'], info['color']] for code, info in DATE_TYPES.items()] + [['']]
+    rows.append(list(TEMPLATE_HEADERS))
+    for i, tmpl in enumerate(templates):
+        rows.append([tmpl.name, tmpl.summary, '', '' if tmpl.all_day else tmpl.start_time.strftime('%H:%M'),
+                     '' if tmpl.all_day else tmpl.end_time.strftime('%H:%M'), ",".join(tmpl.datetypes), ",".join(str(wk) for wk in tmpl.weekdays)])
+    rows.append([''])
+
+    month_names = []
+    for year_idx in range(years):
+        block = [[] for i in range(MONTH_ROWS)]
+        for month in range(1, 13):
+            month_name = MONTH_NAMES[month - 1] if year_idx == 0 else f"{MONTH_NAMES[month - 1]} {year_idx}"
+            month_names.append(month_name)
+            days = list(make_month(2000, month)['days'].items())
+            block[0] += [month_name, 'Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su']
+            for week_idx in range(5):
+                week = days[week_idx * 7:week_idx * 7 + 7]
+                week += [(' ', ' ')] * (7 - len(week))
+                block[week_idx * 2 + 1] += [str(week_idx + 1)] + [d for d, t in week]
+                block[week_idx * 2 + 2] += [''] + [t for d, t in week]
+        rows += block
+
+    for row in rows:
+        row += [''] * (width - len(row))
+        row[-filler_cols:] = ['x'] * filler_cols
+    return rows, month_names
+
+
+def run_timed(function):
+    "Returns the result and wall time of `function`, hiding what it prints"
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function()
+        return result, time.perf_counter() - start
+
+
+def benchmark_scheduler(months, templates, latency, rate):
+    months_data = [make_month(year, month) for year, month in get_next_months(months)]
+    scenarios = [
+        ('sequential', {}),
+        ('batch', { 'batch_size': MAX_BATCH_SIZE }),
+        ('4 workers', { 'workers': 4 }),
+        ('recurrence', { 'recurrence': True }),
+    ]
+
+    print(f"Scheduling {months} months with {templates} templates, {latency * 1000:.0f} ms latency per HTTP request, {rate} requests/s")
+    print("{:<24} {:>8} {:>8} {:>10} {:>12}  {}".format('scenario', 'calls', 'http', 'time (s)', 'per month', 'calls by operation'))
+    for name, options in scenarios:
+        service = FakeCalendarService(latency=latency)
+        scheduler = EventScheduler(None, 'benchmark@group.calendar.google.com', 'Europe/Madrid', make_templates(templates), DATE_TYPES,
+                                   months_data, calendar_service=service)
+        scheduler.rate_limiter = TokenBucket(rate, rate)
+        for run in ['first run', 'rerun']:
+            service.reset_counters()
+            summary, elapsed = run_timed(lambda: scheduler.schedule_events(**options))
+            print("{:<24} {:>8} {:>8} {:>10.3f} {:>12.3f}  {}".format(f"{name}, {run}", sum(service.calls.values()), service.http_requests,
+                                                                 elapsed, elapsed / months, dict(sorted(service.calls.items()))))
+
+
+def benchmark_readers(years, templates, latency):
+    """Reads a worksheet from the fake Google backend with every reader: all values,
+    the ranges around anchors (--ranges) and the local snapshot (--cache), reporting
+    Sheets and Drive API calls of a first run and a rerun.
+    """
+    all_cells, month_names = make_sheet(years, make_templates(templates))
+    spreadsheet = FakeSpreadsheet({ '2000-2001': all_cells }, latency=latency)
+    fake_session = FakeSession({ 'Benchmark': spreadsheet }, latency=latency)
+    # readers get their clients from the session of the credentials file
+    session.sessions['benchmark.json'] = fake_session
+    read_month_names = month_names[:3]
+
+    print(f"\nReading {len(read_month_names)} months from a {len(all_cells)}x{len(all_cells[0])} sheet, "
+          f"{latency * 1000:.0f} ms latency per HTTP request")
+    print("{:<24} {:>8} {:>8} {:>10}  {}".format('reader', 'calls', 'http', 'time (s)', 'calls by operation'))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        anchors = {}
+        readers = [
+            ('all values', lambda: get_all_cells_from_spreadsheet('benchmark.json', 'Benchmark', '2000-2001')),
+            ('ranges', lambda: anchors.update(get_cells_from_ranges('benchmark.json', 'Benchmark', '2000-2001', read_month_names,
+                                                                  anchors or None)[1])),
+            ('cache', lambda: get_cached_cells('benchmark.json', 'Benchmark', '2000-2001', cache_dir)),
+        ]
+        for name, function in readers:
+            for run in ['first run', 'rerun']:
+                backends = [spreadsheet, fake_session.drive_service]
+                for backend in backends:
+                    backend.reset_counters()
+                result, elapsed = run_timed(function)
+                calls = sum((backend.calls for backend in backends), Counter())
+                print("{:<24} {:>8} {:>8} {:>10.3f}  {}".format(f"{name}, {run}", sum(calls.values()),
+                                                                sum(backend.http_requests for backend in backends), elapsed, dict(sorted(calls.items()))))
+    del session.sessions['benchmark.json']
+
+
+def benchmark_parsers(years, templates, repeat):
+    all_cells, month_names = make_sheet(years, make_templates(templates))
+    print(f"\nParsing {len(month_names)} months and {templates} templates from a {len(all_cells)}x{len(all_cells[0])} sheet, best of {repeat}")
+
+    def parse(cells):
+        read_months(cells, '2000-2001', month_names)
+        get_event_templates(cells)
+        get_caregivers(cells)
+
+    for name, function in [('SheetIndex', lambda: SheetIndex(all_cells)),
+                           ('parse all cells', lambda: parse(all_cells)),
+                           ('parse with index', lambda: parse(SheetIndex(all_cells)))]:
+        elapsed = min(run_timed(function)[1] for i in range(repeat))
+        print("{:<24} {:>10.4f} s {:>10.3f} ms per month".format(name, elapsed, elapsed * 1000 / len(month_names)))
+
+
+@click.command()
+@click.option('--months', default=12, type=click.IntRange(min=1), help='Number of months to schedule.')
+@click.option('--templates', default=10, type=click.IntRange(min=1), help='Number of event templates.')
+@click.option('--latency', default=0.0, type=float, help='Simulated latency per HTTP request, in seconds.')
+@click.option('--rate', default=DEFAULT_RATE, type=click.FloatRange(min=0, min_open=True), help='Requests per second allowed by the rate limiter.')
+@click.option('--years', default=5, type=click.IntRange(min=1), help='School years on the parsed worksheet.')
+@click.option('--repeat', default=3, type=click.IntRange(min=1), help='Parser runs, the best one is reported.')
+def main(months, templates, latency, rate, years, repeat):
+    benchmark_scheduler(months, templates, latency, rate)
+    benchmark_readers(years, templates, latency)
+    benchmark_parsers(years, templates, repeat)
+
+if __name__ == '__main__':
+    main()
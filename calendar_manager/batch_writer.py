@@ -0,0 +1,141 @@
+import time
+from googleapiclient.errors import HttpError
+from calendar_manager import profiler
+from calendar_manager.rate_limit import is_retryable, backoff_delay
+
+
+# Google Calendar API does not accept more than 50 calls in a single batch request
+MAX_BATCH_SIZE = 50
+
+
+class BatchSummary():
+    """Collects per-item results and failures of batched or concurrent Calendar API calls.
+    """
+    def __init__(self):
+        self.results = []
+        self.failures = []
+
+    def add_result(self, kind, description, response):
+        self.results.append((kind, description, response))
+
+    def add_failure(self, kind, description, exception):
+        self.failures.append((kind, description, exception))
+
+    def count(self, kind):
+        "Returns the number of successful operations of type `kind` (insert, update, delete...)"
+        return len([r for r in self.results if r[0] == kind])
+
+    def print_summary(self):
+        print(f"\nWrite summary:\n")
+        for kind in sorted(set(r[0] for r in self.results)):
+            print(f" * {self.count(kind)} {kind} operations succeeded")
+        print(f" * {len(self.failures)} operations failed")
+        for kind, description, exception in self.failures:
+            print(f"   - {kind} {description}: {exception}")
+
+
+class BatchWriter():
+    """BatchWriter groups Calendar API write requests (insert, update, delete...)
+    and sends them as batch requests of up to `batch_size` calls each, instead
+    of one HTTP round trip per call.
+
+    Requests are flushed automatically when `batch_size` requests are pending,
+    call `flush()` to send the remaining ones. Results and failures for every
+    single request are collected in `summary`.
+
+    Every request in a batch counts against the quota, so a token is taken from
+    `rate_limiter` for each of them. Requests failing with rate limit or server
+    errors, alone or with the whole batch, are sent again on a following batch
+    after a backoff delay, up to `max_retries` times.
+
+    Requests failing with 409 Conflict, or with 404 Not Found or 410 Gone, may be
+    given a fallback, called once the batch is answered, which may queue requests
+    to be sent on a following batch.
+    """
+    def __init__(self, calendar_service, batch_size=MAX_BATCH_SIZE, rate_limiter=None, max_retries=5, sleep=time.sleep):
+        if batch_size < 1 or batch_size > MAX_BATCH_SIZE:
+            raise ValueError(f"Batch size must be between 1 and {MAX_BATCH_SIZE}, got {batch_size}")
+
+        self.calendar_service = calendar_service
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self.pending = []
+        self.summary = BatchSummary()
+
+
+    def add(self, request, kind, description, on_success=None, on_conflict=None, on_missing=None):
+        """Queues `request` to be sent on next batch. `kind` and `description`
+        identify the request on the summary. `on_success(response)` is called
+        once the request succeeded, if given. `on_conflict()` is called instead
+        of reporting a failure when the request fails with 409 Conflict, to queue
+        a fallback request, if given, and `on_missing()` likewise when it fails
+        with 404 Not Found or 410 Gone.
+        """
+        fallbacks = {409: on_conflict, 404: on_missing, 410: on_missing}
+        self.pending.append((request, kind, description, on_success, fallbacks, 0))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """Sends all pending requests, and the fallbacks queued for conflicts.
+        """
+        while self.pending:
+            self.send_batch()
+
+
+    def send_batch(self):
+        """Sends pending requests in a single batch request.
+        """
+        in_flight = {str(idx): item for idx, item in enumerate(self.pending)}
+        pending_fallbacks = []
+        retries = []
+
+        def fail(item, exception):
+            request, kind, description, on_success, fallbacks, attempt = item
+            if attempt < self.max_retries and is_retryable(exception):
+                retries.append(item)
+            else:
+                self.summary.add_failure(kind, description, exception)
+
+        def callback(request_id, response, exception):
+            item = in_flight.pop(request_id)
+            request, kind, description, on_success, fallbacks, attempt = item
+            if exception is not None:
+                fallback = fallbacks.get(exception.resp.status) if isinstance(exception, HttpError) else None
+                if fallback is not None:
+                    pending_fallbacks.append(fallback)
+                else:
+                    fail(item, exception)
+            else:
+                self.summary.add_result(kind, description, response)
+                if on_success is not None:
+                    on_success(response)
+
+        batch = self.calendar_service.new_batch_http_request(callback=callback)
+        for idx, (request, kind, description, on_success, fallbacks, attempt) in enumerate(self.pending):
+            # every call in the batch counts against the quota
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            batch.add(request, request_id=str(idx))
+
+        print(f"Sending batch of {len(self.pending)} requests ...")
+        self.pending = []
+
+        try:
+            profiler.profile_call('calendar.batch', batch.execute)
+        except Exception as e:
+            # The whole batch failed, so every request not answered failed with it
+            for item in in_flight.values():
+                fail(item, e)
+
+        if retries:
+            delay = backoff_delay(max(item[-1] for item in retries))
+            print(f"{len(retries)} requests failed with rate limit or server errors, retrying in {delay:.1f}s ...")
+            self.sleep(delay)
+            self.pending.extend(item[:-1] + (item[-1] + 1,) for item in retries)
+
+        for fallback in pending_fallbacks:
+            fallback()
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+from googleapiclient.errors import HttpError
+from calendar_manager.rate_limit import execute_with_backoff
+from calendar_manager.event_fields import SYNC_FIELDS
+
+
+DEFAULT_MIRROR_FILENAME = 'calendar_mirror.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    status TEXT,
+    template_name TEXT,
+    event_date TEXT,
+    start TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE INDEX IF NOT EXISTS events_by_template ON events (calendar_id, template_name, event_date);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (calendar_id, start);
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT
+);
+"""
+
+
+class CalendarMirror():
+    """Local copy of the events of calendar `calendar_id` stored in SQLite database
+    `database_filename`, indexed by template name and date.
+
+    The first `sync` lists every event of the calendar, later ones only fetch the
+    events changed since the previous sync using Google Calendar sync tokens.
+    """
+    def __init__(self, calendar_service, calendar_id, database_filename=DEFAULT_MIRROR_FILENAME):
+        self.calendar_service = calendar_service
+        self.calendar_id = calendar_id
+        self.connection = sqlite3.connect(database_filename)
+        self.connection.executescript(SCHEMA)
+
+
+    def get_sync_token(self):
+        row = self.connection.execute("SELECT sync_token FROM sync_state WHERE calendar_id = ?", (self.calendar_id,)).fetchone()
+        return row[0] if row else None
+
+
+    def clear(self):
+        "Removes every event and the sync token of the calendar, so that next sync is a full one"
+        with self.connection:
+            self.connection.execute("DELETE FROM events WHERE calendar_id = ?", (self.calendar_id,))
+            self.connection.execute("DELETE FROM sync_state WHERE calendar_id = ?", (self.calendar_id,))
+
+
+    def store_event(self, event):
+        if event.get('status') == 'cancelled' and 'start' not in event:
+            # deleted events may come with only their id, keep what we knew about them
+            updated = self.connection.execute("UPDATE events SET status = 'cancelled' WHERE calendar_id = ? AND id = ?",
+                                              (self.calendar_id, event['id']))
+            if updated.rowcount:
+                return
+
+        start = event.get('start', {})
+        start_value = start.get('dateTime', start.get('date'))
+        template_name = event.get('extendedProperties', {}).get('private', {}).get('template_name')
+        self.connection.execute("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            self.calendar_id,
+            event['id'],
+            event.get('status'),
+            template_name,
+            start_value[:10] if start_value else None,
+            start_value,
+            json.dumps(event),
+        ))
+
+
+    def sync(self):
+        """Fetches the events changed since last sync (every event on first sync) and
+        stores them. When Google Calendar no longer accepts the sync token (410 Gone),
+        the mirror is cleared and fully synced again. Returns the number of changes.
+        """
+        sync_token = self.get_sync_token()
+        print(f"{'Incremental' if sync_token else 'Full'} sync of calendar mirror ...")
+
+        changes = 0
+        page_token = None
+        try:
+            while True:
+                request = self.calendar_service.events().list(calendarId=self.calendar_id,
+                                                    maxResults=2500, singleEvents=True, showDeleted=True,
+                                                    syncToken=sync_token, pageToken=page_token, fields=SYNC_FIELDS)
+                events_result = execute_with_backoff(request)
+                with self.connection:
+                    for event in events_result.get('items', []):
+                        self.store_event(event)
+                        changes += 1
+
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status != 410 or sync_token is None:
+                raise
+            print("Sync token is no longer valid, doing a full sync ...")
+            self.clear()
+            return self.sync()
+
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                                    (self.calendar_id, events_result.get('nextSyncToken')))
+
+        print(f"Calendar mirror synced with {changes} changes.")
+        return changes
+
+
+    def get_events(self, start_date, end_date, include_cancelled=False):
+        """Returns the events starting between `start_date` and `end_date` (both included).
+        With `include_cancelled`, deleted events are also returned, even those with unknown date.
+        """
+        query = "SELECT body, status FROM events WHERE calendar_id = ? AND (event_date BETWEEN ? AND ?"
+        if include_cancelled:
+            query += " OR (status = 'cancelled' AND event_date IS NULL))"
+        else:
+            query += ") AND (status IS NULL OR status != 'cancelled')"
+        rows = self.connection.execute(query + " ORDER BY start", (self.calendar_id, start_date.isoformat(), end_date.isoformat()))
+        return [dict(json.loads(body), status=status) if status else json.loads(body) for body, status in rows]
+
+
+    def find_template_event(self, template_name, event_date):
+        "Returns the first event created from `template_name` on `event_date`, None if there is none"
+        row = self.connection.execute(
+            "SELECT body FROM events WHERE calendar_id = ? AND template_name = ? AND event_date = ? "
+            "AND (status IS NULL OR status != 'cancelled') ORDER BY start LIMIT 1",
+            (self.calendar_id, template_name, event_date.isoformat())).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+    def get_upcoming_events(self, start_datetime, max_results):
+        "Returns up to `max_results` events starting from `start_datetime` (ISO format), sorted by start"
+        # all day events only have a date, which must be compared with the date of `start_datetime`
+        rows = self.connection.execute(
+            "SELECT body FROM events WHERE calendar_id = ? AND (start >= ? OR (length(start) = 10 AND start >= ?)) "
+            "AND (status IS NULL OR status != 'cancelled') ORDER BY start LIMIT ?",
+            (self.calendar_id, start_datetime, start_datetime[:10], max_results))
+        return [json.loads(row[0]) for row in rows]
@@ -1,61 +1,440 @@
 import click
 import json
 import sys
-from calendar_manager.read_gspread import get_all_cells_from_spreadsheet, read_month, get_event_templates, get_caregivers
-from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.reconcile import Operation
+from calendar_manager.read_gspread import hash_cells, get_all_cells_from_spreadsheet, get_cells_from_ranges, load_anchors, save_anchors, SheetIndex, get_school_year_months, read_months, get_event_templates, get_caregivers
+from calendar_manager.event_scheduler import EventScheduler, get_today
+from calendar_manager.event_iterator import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from calendar_manager.event_fields import LIST_FIELDS, UPCOMING_FIELDS
+from calendar_manager.batch_writer import MAX_BATCH_SIZE
+from calendar_manager.sheet_cache import get_cached_cells, DEFAULT_CACHE_DIR
+from calendar_manager.calendar_mirror import DEFAULT_MIRROR_FILENAME
+from calendar_manager import profiler
+from calendar_manager.rate_limit import TokenBucket
+from calendar_manager.watcher import DEFAULT_INTERVAL, SheetWatcher, start_webhook
+from calendar_manager.tenants import DEFAULT_JOBS, find_settings_files, run_tenants, print_tenants_summary
+from calendar_manager.pipeline import get_months_range, run_export
+from calendar_manager.plan_file import DEFAULT_PLAN_FILENAME, SavedPlan, save_plan, load_plan
+from calendar_manager.journal import DEFAULT_JOURNAL_FILENAME, Journal
 
 
-@click.command()
-@click.option('--settings-filename', '-f', default="settings.json", show_default=True,
-    help="File containing settings such as calendar_id, spreadsheet_filename and spreadsheet_tab")
-@click.option('--credentials-filename', '-c', default="creds.json", show_default=True,
-    help="File containing the credentials necessary to access Google APIs")
-@click.option('--month', '-m', default=None, help="Month for which to export events to Google calendar")
-@click.option('--preview/--no-preview', default=True, show_default=True, help="Whether to preview events to be scheduled or not")
-@click.option('--schedule/--no-schedule', default=False, show_default=True, help="Whether to actually schedule events on Google Calendar or not")
-def cli(settings_filename, credentials_filename, month, preview, schedule):
-    settings_file = None
-    if settings_filename:
+def read_settings(settings_filename):
+    try:
+        with open(settings_filename) as settings_file:
+            return json.load(settings_file)
+    except Exception:
+        raise click.ClickException(f"Could not open or read file {settings_filename}")
+
+
+def get_month_names(month, from_month, to_month, year):
+    "Returns the months to export as given by cli options, None if none was given"
+    if month and (from_month or to_month or year):
+        raise click.UsageError("--month can not be combined with --from, --to or --year")
+
+    try:
+        if year or from_month or to_month:
+            return get_school_year_months(from_month, to_month)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    return [month] if month else None
+
+
+def require_months(month_names):
+    if not month_names:
+        raise click.UsageError("must pass month, range of months or year for which to export events")
+
+
+def read_spreadsheet(settings, credentials_filename, month_names, ranges, anchors_filename, cache, offline, cache_dir):
+    "Returns the cells read from the spreadsheet tab in settings, as requested by cli options"
+    if cache or offline:
         try:
-            settings_file = open(settings_filename)
-            settings = json.load(settings_file)
-        except Exception:
-            print(f"Could not open or read file {settings_filename}")
-            sys.exit(1)
+            all_cells = get_cached_cells(credentials_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'], cache_dir, offline)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    elif ranges:
+        anchors = load_anchors(anchors_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'])
+        all_cells, anchors = get_cells_from_ranges(credentials_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'], month_names, anchors)
+        save_anchors(anchors_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'], anchors)
     else:
-        raise click.UsageError("must pass settings filename")
+        all_cells = get_all_cells_from_spreadsheet(credentials_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'])
+    return all_cells
+
+
+def run(settings_filename, credentials_filename, month_names, year, preview, schedule, sweep, batch, workers, recurrence,
+        ranges, anchors_filename, cache, offline, cache_dir, mirror, mirror_filename, pipeline=False, resume=False,
+        journal_filename=DEFAULT_JOURNAL_FILENAME, rate_limiter=None):
+    """Exports events for `month_names` with the settings in `settings_filename`, as the
+    cli options tell. Returns the number of months read and of calendar writes by kind.
+    """
+    settings = read_settings(settings_filename)
+    print_settings(settings_filename, settings)
+    print(f"Months to export:    \t{', '.join(month_names)}\n")
+
+    def read_cells():
+        return read_spreadsheet(settings, credentials_filename, month_names, ranges, anchors_filename, cache, offline, cache_dir)
+
+    if pipeline and (schedule or sweep):
+        return export_pipelined(settings, read_cells, month_names, credentials_filename, year, preview, schedule, sweep, workers, recurrence,
+                                mirror, mirror_filename, resume, journal_filename, rate_limiter)
+
+    # Read spreadsheet
+    with profiler.phase('sheet fetch'):
+        all_cells = read_cells()
 
-    if not month:
-        raise click.UsageError("must pass month for which to export events")
+    return export(settings, all_cells, month_names, credentials_filename, year, preview, schedule, sweep, batch, workers, recurrence,
+                  mirror, mirror_filename, pipeline, resume, journal_filename, rate_limiter)
 
+
+def print_settings(settings_filename, settings):
     print(f"=== Settings read from {settings_filename} ===")
     print(f"Calendar ID:         \t{settings['calendar_id']}")
     print(f"Calendar timezone:   \t{settings['calendar_timezone']}")
     print(f"Spreadsheet filename:\t{settings['spreadsheet_filename']}")
     print(f"Spreadsheet tab:     \t{settings['spreadsheet_tab']}\n")
 
-    print(f"Month to export:     \t{month}\n")
 
-    # Read spreadsheet
-    all_cells = get_all_cells_from_spreadsheet(credentials_filename, settings['spreadsheet_filename'], settings['spreadsheet_tab'])
+def parse_spreadsheet(settings, all_cells, month_names, year):
+    "Returns the event templates, caregivers and data of `month_names` read on the spreadsheet cells"
+    sheet = SheetIndex(all_cells)
 
     calendar_school_period = settings['spreadsheet_tab']
-    month_data = read_month(all_cells, calendar_school_period, month)
-    #print(json.dumps(month_data, sort_keys=True, indent=4))
+    # months missing on the worksheet are only skipped when exporting the whole year
+    months_data = read_months(sheet, calendar_school_period, month_names, skip_missing=year)
+
+    caregivers = get_caregivers(sheet)
+    event_templates = get_event_templates(sheet)
+    return event_templates, caregivers, months_data
+
+
+def create_scheduler(settings, credentials_filename, event_templates, caregivers, months_data, mirror, mirror_filename,
+                     resume=False, journal_filename=DEFAULT_JOURNAL_FILENAME, rate_limiter=None):
+    scheduler = EventScheduler(credentials_filename, settings['calendar_id'], settings['calendar_timezone'], event_templates, caregivers, months_data,
+                               mirror_filename=mirror_filename if mirror else None)
+    if rate_limiter is not None:
+        scheduler.rate_limiter = rate_limiter
+    # confirmed writes are always journaled, so that a run which died halfway can be resumed
+    scheduler.journal = Journal(journal_filename)
+    scheduler.resume = resume
+    return scheduler
+
 
-    caregivers = get_caregivers(all_cells)
-    event_templates = get_event_templates(all_cells)
+def export(settings, all_cells, month_names, credentials_filename, year, preview, schedule, sweep, batch, workers, recurrence,
+           mirror, mirror_filename, pipeline=False, resume=False, journal_filename=DEFAULT_JOURNAL_FILENAME, rate_limiter=None):
+    "Exports events for `month_names` from the cells read on the spreadsheet, see `run`"
+    if pipeline and (schedule or sweep):
+        return export_pipelined(settings, lambda: all_cells, month_names, credentials_filename, year, preview, schedule, sweep, workers,
+                                recurrence, mirror, mirror_filename, resume, journal_filename, rate_limiter)
 
-    scheduler = EventScheduler(credentials_filename, settings['calendar_id'], settings['calendar_timezone'], event_templates, caregivers, month_data)
+    with profiler.phase('parse'):
+        event_templates, caregivers, months_data = parse_spreadsheet(settings, all_cells, month_names, year)
+
+    scheduler = create_scheduler(settings, credentials_filename, event_templates, caregivers, months_data, mirror, mirror_filename,
+                                 resume, journal_filename, rate_limiter)
+    counts = { 'months': len(months_data) }
 
     if preview:
         scheduler.list_events_to_be_scheduled()
 
     if schedule:
-        scheduler.schedule_events()
-        
+        plan = scheduler.plan_changes(recurrence)
+        plan.print_plan()
+        summary = scheduler.apply_plan(plan, batch_size=MAX_BATCH_SIZE if batch else None, workers=workers)
+        counts.update((kind, plan.count(kind)) for kind in (Operation.INSERT, Operation.PATCH, Operation.DELETE))
+        counts['failed'] = len(summary.failures) if summary else 0
+
+    if sweep:
+        counts['swept'] = scheduler.sweep_stale_events(batch_size=MAX_BATCH_SIZE if batch else None, workers=workers)
+
+    if schedule or sweep:
+        scheduler.compact_journal()
+
     scheduler.print_datetype_distribution()
+    return counts
+
+
+def export_pipelined(settings, read_cells, month_names, credentials_filename, year, preview, schedule, sweep, workers, recurrence,
+                     mirror, mirror_filename, resume=False, journal_filename=DEFAULT_JOURNAL_FILENAME, rate_limiter=None):
+    """Exports events for `month_names` from the cells returned by `read_cells` with the
+    asyncio pipeline, prefetching existing events while the spreadsheet is read and
+    writing day plans as soon as they are computed. Preview is printed at the end.
+    """
+    scheduler = create_scheduler(settings, credentials_filename, [], {}, [], mirror, mirror_filename, resume, journal_filename, rate_limiter)
+    prefetch_range = get_months_range(settings['spreadsheet_tab'], month_names)
+    plan, summary, swept = run_export(scheduler, read_cells, lambda all_cells: parse_spreadsheet(settings, all_cells, month_names, year),
+                                      prefetch_range, schedule, sweep, recurrence, workers)
+
+    counts = { 'months': len(scheduler.months) }
+    if plan is not None:
+        counts.update((kind, plan.count(kind)) for kind in (Operation.INSERT, Operation.PATCH, Operation.DELETE))
+        counts['failed'] = len(summary.failures)
+    if swept is not None:
+        counts['swept'] = swept
+    scheduler.compact_journal()
+
+    if preview:
+        scheduler.list_events_to_be_scheduled()
+    scheduler.print_datetype_distribution()
+    return counts
+
+
+@click.group(invoke_without_command=True)
+@click.option('--settings-filename', '-f', default="settings.json", show_default=True,
+    help="File containing settings such as calendar_id, spreadsheet_filename and spreadsheet_tab")
+@click.option('--credentials-filename', '-c', default="creds.json", show_default=True,
+    help="File containing the credentials necessary to access Google APIs")
+@click.option('--month', '-m', default=None, help="Month for which to export events to Google calendar")
+@click.option('--from', 'from_month', default=None, help="First month of a range of months for which to export events")
+@click.option('--to', 'to_month', default=None, help="Last month of a range of months for which to export events")
+@click.option('--year', is_flag=True, default=False, help="Export events for every month of the school period on the spreadsheet tab")
+@click.option('--preview/--no-preview', default=True, show_default=True, help="Whether to preview events to be scheduled or not")
+@click.option('--schedule/--no-schedule', default=False, show_default=True, help="Whether to actually schedule events on Google Calendar or not")
+@click.option('--sweep/--no-sweep', default=False, show_default=True,
+    help="Whether to delete events created from templates which are no longer expected on scheduled days, even from removed templates")
+@click.option('--batch/--no-batch', default=False, show_default=True, help=f"Whether to group calendar writes in batch requests of up to {MAX_BATCH_SIZE} calls or not")
+@click.option('--workers', '-w', default=1, show_default=True, type=click.IntRange(min=1),
+    help="Number of threads sending calendar writes concurrently, within Google Calendar API quota")
+@click.option('--recurrence/--no-recurrence', default=False, show_default=True,
+    help="Whether to write the occurrences of every event template as a single recurring event or one event per day")
+@click.option('--ranges/--no-ranges', default=False, show_default=True,
+    help="Whether to fetch only the month, event templates and caregivers blocks from the spreadsheet or the whole tab")
+@click.option('--anchors-filename', default="anchors.json", show_default=True,
+    help="File where the position of the blocks on the spreadsheet is kept when using --ranges")
+@click.option('--cache/--no-cache', default=False, show_default=True,
+    help="Whether to keep a local snapshot of the spreadsheet tab, downloaded again only when the spreadsheet is modified")
+@click.option('--offline', is_flag=True, default=False, help="Use the cached snapshot of the spreadsheet tab without contacting Google Sheets")
+@click.option('--cache-dir', default=DEFAULT_CACHE_DIR, show_default=True, help="Directory where spreadsheet snapshots are cached")
+@click.option('--mirror/--no-mirror', default=False, show_default=True,
+    help="Whether to read existing events from a local mirror of the calendar, synced incrementally, or from Google Calendar")
+@click.option('--mirror-filename', default=DEFAULT_MIRROR_FILENAME, show_default=True, help="SQLite database where the calendar mirror is kept")
+@click.option('--pipeline/--no-pipeline', default=False, show_default=True,
+    help="Whether to overlap spreadsheet reads, prefetch of existing events and calendar writes, with --workers concurrent writes")
+@click.option('--resume/--no-resume', default=False, show_default=True,
+    help="Whether to skip calendar writes confirmed by a previous run which did not finish, as recorded on the journal")
+@click.option('--journal-filename', default=DEFAULT_JOURNAL_FILENAME, show_default=True,
+    help="File where confirmed calendar writes are recorded on every run, removed once a run succeeds")
+@click.option('--profile/--no-profile', default=False, show_default=True,
+    help="Whether to record Google API calls and phase timings, printing a report at the end of the run")
+@click.option('--profile-filename', default="profile.json", show_default=True,
+    help="File where the profile report is written, as JSON if it ends with .json or as text otherwise")
+@click.pass_context
+def cli(ctx, settings_filename, credentials_filename, month, from_month, to_month, year, preview, schedule, sweep, batch, workers, recurrence, ranges, anchors_filename, cache, offline, cache_dir, mirror, mirror_filename,
+        pipeline, resume, journal_filename, profile, profile_filename):
+    """Exports events for the months given to Google Calendar, from the spreadsheet
+    in settings, or runs one of the commands below with the options given.
+    """
+    if profile:
+        run_profiler = profiler.start_profiling()
+
+        def write_profile():
+            profiler.stop_profiling()
+            print("\n" + run_profiler.format_report())
+            run_profiler.write_report(profile_filename)
+            print(f"\nProfile report written to {profile_filename}")
+
+        # report is written however the run ends
+        ctx.call_on_close(write_profile)
+
+    if not settings_filename:
+        raise click.UsageError("must pass settings filename")
+
+    month_names = get_month_names(month, from_month, to_month, year)
+
+    if batch and workers > 1:
+        raise click.UsageError("--batch and --workers can not be combined")
+
+    if pipeline and batch:
+        raise click.UsageError("--pipeline and --batch can not be combined, use --workers instead")
+
+    if ranges and (cache or offline):
+        raise click.UsageError("--ranges can not be combined with --cache or --offline, which keep the whole tab")
+
+    # options are kept for the command invoked, if any
+    ctx.obj = dict(credentials_filename=credentials_filename, month_names=month_names, year=year, preview=preview, schedule=schedule,
+                   sweep=sweep, batch=batch, workers=workers, recurrence=recurrence, ranges=ranges, anchors_filename=anchors_filename,
+                   cache=cache, offline=offline, cache_dir=cache_dir, mirror=mirror, mirror_filename=mirror_filename, pipeline=pipeline,
+                   resume=resume, journal_filename=journal_filename)
+    if ctx.invoked_subcommand is not None:
+        return
+
+    require_months(month_names)
+    run(settings_filename, **ctx.obj)
+
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--jobs', '-j', default=DEFAULT_JOBS, show_default=True, type=click.IntRange(min=1), help="Number of tenants run concurrently")
+@click.option('--log-dir', default=None, help="Directory where the output of every tenant is written, instead of printing it")
+@click.pass_obj
+def tenants(options, path, jobs, log_dir):
+    """Runs every tenant, a settings file, in directory PATH or listed on manifest
+    file PATH, with the options given before the command. Tenants share credentials
+    and the Calendar API rate limiter, and a failing tenant does not stop the others.
+
+    Example: calendar-manager --year --schedule --batch tenants households/
+    """
+    require_months(options['month_names'])
+    settings_filenames = find_settings_files(path)
+    if not settings_filenames:
+        raise click.UsageError(f"no settings files found on {path}")
+
+    rate_limiter = TokenBucket()
+    results = run_tenants(settings_filenames, lambda settings_filename: run(settings_filename, rate_limiter=rate_limiter, **options),
+                          jobs, log_dir)
+    print_tenants_summary(results)
+    if not all(result.succeeded() for result in results):
+        sys.exit(1)
+
+
+@cli.command('plan')
+@click.option('--plan-filename', '-p', default=DEFAULT_PLAN_FILENAME, show_default=True, help="File where the plan is written")
+@click.pass_context
+def plan_command(ctx, plan_filename):
+    """Plans the inserts, patches and deletes that --schedule would send for the months
+    given, and those of --sweep when given, and writes them to a plan file along with
+    the hash of the spreadsheet and the version of the calendar, without writing to
+    the calendar. Review the plan and run it later with apply.
+
+    Example: calendar-manager --year --sweep plan -p plan.json
+    """
+    options = ctx.obj
+    month_names = options['month_names']
+    require_months(month_names)
+    settings_filename = ctx.parent.params['settings_filename']
+    settings = read_settings(settings_filename)
+    print_settings(settings_filename, settings)
+
+    with profiler.phase('sheet fetch'):
+        all_cells = read_spreadsheet(settings, options['credentials_filename'], month_names, options['ranges'], options['anchors_filename'],
+                                     options['cache'], options['offline'], options['cache_dir'])
+    with profiler.phase('parse'):
+        event_templates, caregivers, months_data = parse_spreadsheet(settings, all_cells, month_names, options['year'])
+
+    scheduler = create_scheduler(settings, options['credentials_filename'], event_templates, caregivers, months_data,
+                                 options['mirror'], options['mirror_filename'])
+    plan = scheduler.plan_changes(options['recurrence'])
+    if options['sweep']:
+        deleted_ids = set(op.event_id for op in plan.operations if op.kind == Operation.DELETE)
+        plan.operations.extend(op for op in scheduler.plan_sweep().operations if op.event_id not in deleted_ids)
+    plan.print_plan()
+
+    save_plan(plan_filename, SavedPlan(plan, settings['calendar_id'], hash_cells(all_cells), scheduler.prefetched_range, scheduler.calendar_version))
+    print(f"\nPlan written to {plan_filename}, run it with: apply -p {plan_filename}")
+
+
+@cli.command('apply')
+@click.option('--plan-filename', '-p', default=DEFAULT_PLAN_FILENAME, show_default=True, help="File where the plan was written")
+@click.pass_obj
+def apply_command(options, plan_filename):
+    """Sends the operations of a plan written by plan to the calendar, without reading
+    the spreadsheet again, with the --batch or --workers options given before the
+    command. Refuses to run when events on the calendar changed since the plan was made.
+
+    Example: calendar-manager --batch apply -p plan.json
+    """
+    try:
+        saved_plan = load_plan(plan_filename)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(f"Could not read plan: {e}")
+
+    print(f"=== Plan read from {plan_filename} ===")
+    print(f"Calendar ID:         \t{saved_plan.calendar_id}")
+    print(f"Planned at:          \t{saved_plan.created}")
+    print(f"Spreadsheet hash:    \t{saved_plan.sheet_hash}")
+    saved_plan.plan.print_plan()
+    if saved_plan.plan.is_empty():
+        print("Nothing to apply.")
+        return
+
+    scheduler = EventScheduler(options['credentials_filename'], saved_plan.calendar_id, None, [], {}, [],
+                               mirror_filename=options['mirror_filename'] if options['mirror'] else None)
+    scheduler.journal = Journal(options['journal_filename'])
+    scheduler.resume = options['resume']
+
+    # a plan applied halfway changed the calendar itself, so it is only checked before its first write
+    partially_applied = len(scheduler.get_pending_operations(saved_plan.plan.operations)) < len(saved_plan.plan.operations)
+    if saved_plan.calendar_range is not None and not partially_applied:
+        scheduler.prefetch_events(*saved_plan.calendar_range)
+        if scheduler.calendar_version != saved_plan.calendar_version:
+            raise click.ClickException("Events on the calendar changed since the plan was made, plan it again")
+
+    summary = scheduler.apply_plan(saved_plan.plan, batch_size=MAX_BATCH_SIZE if options['batch'] else None, workers=options['workers'])
+    scheduler.compact_journal()
+    if summary is not None and summary.failures:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--start', 'start_date', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help="First day of events listed  [default: today]")
+@click.option('--end', 'end_date', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help="Last day of events listed, all upcoming events when not given")
+@click.option('--page-size', default=DEFAULT_PAGE_SIZE, show_default=True, type=click.IntRange(1, MAX_PAGE_SIZE),
+    help="Events requested to Google Calendar per page")
+@click.option('--format', 'output_format', default='text', show_default=True, type=click.Choice(['text', 'json']),
+    help="Whether to print the start and summary of events, or their fields as JSON lines")
+@click.option('--output', '-o', default='-', show_default=True, help="File where events are written, - for standard output")
+@click.pass_context
+def events(ctx, start_date, end_date, page_size, output_format, output):
+    """Lists the events on the calendar in settings between two dates, streaming them
+    page by page as they are listed, so that long date ranges are not held in memory.
+
+    Example: calendar-manager events --start 2021-09-01 --end 2022-06-30 --format json -o events.jsonl
+    """
+    settings = read_settings(ctx.parent.params['settings_filename'])
+    start_date = start_date.date() if start_date else get_today()
+    end_date = end_date.date() if end_date else None
+    if end_date is not None and end_date < start_date:
+        raise click.UsageError("--end can not be before --start")
+
+    scheduler = EventScheduler(ctx.obj['credentials_filename'], settings['calendar_id'], settings['calendar_timezone'], [], {}, [])
+    listed = 0
+    with click.open_file(output, 'w') as output_file:
+        for event in scheduler.iter_events(start_date, end_date, page_size, LIST_FIELDS if output_format == 'json' else UPCOMING_FIELDS,
+                                           orderBy='startTime'):
+            if output_format == 'json':
+                output_file.write(json.dumps(event) + "\n")
+            else:
+                start = event['start'].get('dateTime', event['start'].get('date'))
+                output_file.write(f"{start} {event.get('summary', '')}\n")
+            listed += 1
+    click.echo(f"{listed} events listed.", err=True)
+
+
+@cli.command()
+@click.option('--interval', default=DEFAULT_INTERVAL, show_default=True, type=click.IntRange(min=1),
+    help="Seconds between checks of the spreadsheet modification time")
+@click.option('--webhook-port', default=None, type=int,
+    help="Port of a local HTTP endpoint making the watcher check right away when it receives a POST notification")
+@click.pass_context
+def watch(ctx, interval, webhook_port):
+    """Keeps running, checking the spreadsheet in settings for changes with a cheap
+    Google Drive metadata call, and exports only the months whose cells changed,
+    with the options given before the command. Stop it with Ctrl+C.
+
+    Example: calendar-manager --year --schedule --batch watch --interval 300
+    """
+    options = dict(ctx.obj)
+    require_months(options['month_names'])
+    if options['ranges'] or options['cache'] or options['offline']:
+        raise click.UsageError("watch reads the whole tab when modified, it can not be combined with --ranges, --cache or --offline")
+    watched_months = options['month_names']
+    for option in ('month_names', 'year', 'ranges', 'anchors_filename', 'cache', 'offline', 'cache_dir'):
+        del options[option]
+
+    settings_filename = ctx.parent.params['settings_filename']
+    settings = read_settings(settings_filename)
+    print_settings(settings_filename, settings)
+
+    def on_change(all_cells, month_names):
+        export(settings, all_cells, month_names, year=False, **options)
+
+    watcher = SheetWatcher(options['credentials_filename'], settings['spreadsheet_filename'], settings['spreadsheet_tab'],
+                           watched_months, on_change, interval)
+    if webhook_port is not None:
+        start_webhook(watcher, webhook_port)
+    try:
+        watcher.watch()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 
 if __name__ == '__main__':
-    cli()
\ No newline at end of file
+    cli()
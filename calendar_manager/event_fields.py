@@ -0,0 +1,25 @@
+# Partial response selectors (`fields=`) for Google Calendar API calls, so that only
+# the fields read are sent by Google Calendar and parsed, however many fields the
+# events on the calendar have (attendees, conference data, attachments...).
+
+# Fields of an event read to reconcile it: template, date, managed fields, and etag
+# so that versions of the calendar state change with any change of its events
+EVENT_FIELDS = 'id,etag,status,summary,description,colorId,start,end,recurringEventId,extendedProperties/private/template_name'
+
+# Listing events to reconcile, page by page
+LIST_FIELDS = f'items({EVENT_FIELDS}),nextPageToken'
+
+# Syncing the calendar mirror, which keeps the sync token for next sync
+SYNC_FIELDS = f'{LIST_FIELDS},nextSyncToken'
+
+# Looking up the event created from a template on a date
+LOOKUP_FIELDS = 'items(id,summary,creator/email,extendedProperties/private/template_name)'
+
+# Reading the occurrences of a recurring event before patching it
+SERIES_FIELDS = 'id,status,start,recurrence'
+
+# Listing events to print them
+UPCOMING_FIELDS = 'items(id,summary,start),nextPageToken'
+
+# Responses to inserts, patches and updates, only checked for success
+WRITE_FIELDS = 'id'
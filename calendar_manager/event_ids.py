@@ -0,0 +1,19 @@
+import base64
+import hashlib
+
+
+# base32 to base32hex alphabet, as base64.b32hexencode is only available from Python 3.10
+BASE32HEX_TABLE = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', b'0123456789ABCDEFGHIJKLMNOPQRSTUV')
+
+
+def make_event_id(calendar_id, template_name, event_date):
+    """Returns the event id to use for the event created from template `template_name`
+    on `event_date` in calendar `calendar_id`, always the same for the same values.
+
+    Google Calendar accepts client supplied ids made of base32hex characters
+    (lowercase letters a-v and digits 0-9) between 5 and 1024 characters long,
+    so the SHA-1 digest of those values is encoded in base32hex (32 characters).
+    """
+    key = f"{calendar_id}|{template_name}|{event_date.isoformat()}"
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return base64.b32encode(digest).translate(BASE32HEX_TABLE).decode('ascii').lower().rstrip('=')
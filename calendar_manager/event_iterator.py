@@ -0,0 +1,41 @@
+from datetime import datetime, time
+from calendar_manager.rate_limit import execute_with_backoff
+from calendar_manager.event_fields import UPCOMING_FIELDS
+
+
+# Events per page when listing, as Google Calendar does by default (max 2500)
+DEFAULT_PAGE_SIZE = 250
+MAX_PAGE_SIZE = 2500
+
+
+def get_time_min(start_date):
+    return datetime.combine(start_date, time(0,0)).isoformat() + 'Z'
+
+
+def get_time_max(end_date):
+    return datetime.combine(end_date, time(23,59)).isoformat() + 'Z'
+
+
+def iter_events(calendar_service, calendar_id, time_min=None, time_max=None, page_size=DEFAULT_PAGE_SIZE, fields=UPCOMING_FIELDS,
+                rate_limiter=None, **params):
+    """Yields the events of `calendar_id` starting between `time_min` and `time_max`
+    (RFC3339 timestamps, both optional) one at a time, listing them page by page.
+
+    Pages of up to `page_size` events are only requested when the events of the
+    previous one were consumed, so that memory use does not grow with the number
+    of events, and stopping early saves the remaining calls. `fields` must select
+    nextPageToken, and `params` are passed on to `events().list`.
+    """
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"Page size must be between 1 and {MAX_PAGE_SIZE}, got {page_size}")
+
+    page_token = None
+    while True:
+        request = calendar_service.events().list(calendarId=calendar_id, timeMin=time_min, timeMax=time_max, maxResults=page_size,
+                                                 pageToken=page_token, fields=fields, **params)
+        events_result = execute_with_backoff(request, rate_limiter)
+        yield from events_result.get('items', [])
+
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return
@@ -1,8 +1,23 @@
 import json
+import hashlib
 import calendar
+import threading
+import contextvars
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, date, time
-from googleapiclient.discovery import build
-from oauth2client.service_account import ServiceAccountCredentials
+from googleapiclient.errors import HttpError
+from calendar_manager.batch_writer import BatchWriter, BatchSummary
+from calendar_manager.rate_limit import TokenBucket, execute_with_backoff
+from calendar_manager.reconcile import Operation, ReconcilePlan, reconcile, diff_event
+from calendar_manager.event_fields import LIST_FIELDS, LOOKUP_FIELDS, SERIES_FIELDS, UPCOMING_FIELDS, WRITE_FIELDS
+from calendar_manager.event_iterator import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, iter_events, get_time_min, get_time_max
+from calendar_manager.event_ids import make_event_id
+from calendar_manager.recurrence import compress_events, reconcile_series, group_instances, get_series_dates, get_school_period_start
+from calendar_manager.calendar_mirror import CalendarMirror
+from calendar_manager.month_data import get_month_data
+from calendar_manager import profiler
+from calendar_manager.session import get_session
 
 
 # Test helper
@@ -10,6 +25,30 @@ def get_today():
    return date.today()
 
 
+def get_template_name(event):
+    "Returns the template name an event was created from, None for manually created events"
+    return event.get('extendedProperties', {}).get('private', {}).get('template_name')
+
+
+def get_event_date(event):
+    "Returns the date an event starts on, for both all day and timed events"
+    start = event['start']
+    return date.fromisoformat(start['date'] if 'date' in start else start['dateTime'][:10])
+
+
+def get_events_version(events):
+    """Returns a fingerprint of `events`, which changes whenever one of them is
+    inserted, modified or deleted, used as version of the calendar state.
+    """
+    events = sorted(events, key=lambda event: event['id'])
+    return hashlib.sha1(json.dumps(events, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_restore_body(event_body):
+    "Returns the patch body writing every field of `event_body` on an existing event, restoring it if it was deleted"
+    return dict(event_body, status='confirmed')
+
+
 class EventScheduler():
     """EventScheduler connects to Google Calendar service using credentials 
     from `credentials_filename`.
@@ -25,31 +64,230 @@ class EventScheduler():
     Date types are keywords used to distinguish different kind of dates: holidays,
     weekends, custody days with dad, custody days with mum... Whatever you can imagine.
 
-    Event data is currently a dictionary with year, month, and days which are
-    associated to a date type.
-    """
-    def __init__(self, credentials_filename, calendar_id, calendar_timezone, event_templates, date_types, event_data):
+    Event data is the `MonthData` of a month, with the date type of every day, or
+    a list of them to schedule several months at once. Dictionaries as returned
+    by `read_month` are accepted too.
+
+    When `mirror_filename` is given, existing events are read from a local SQLite
+    mirror of the calendar, kept up to date with incremental syncs.
 
-        scope = ['https://www.googleapis.com/auth/calendar']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_filename, scope)
-        self.calendar_service = build('calendar', 'v3', credentials=creds)
+    The Calendar service is only built, and credentials only loaded, when Google
+    Calendar is first called, so that preview only runs do not pay for it. An
+    already built `calendar_service` can be given instead, as the fake one from
+    `fake_google` used by tests and benchmarks.
+    """
+    def __init__(self, credentials_filename, calendar_id, calendar_timezone, event_templates, date_types, event_data, mirror_filename=None,
+                 calendar_service=None):
 
+        self.credentials_filename = credentials_filename
+        self.session = None
+        self.service = calendar_service
         self.calendar_id = calendar_id
         self.calendar_timezone = calendar_timezone
+        self.load_data(event_templates, date_types, event_data)
+        self.batch_writer = None
+        self.rate_limiter = TokenBucket()
+        self.thread_local = threading.local()
+        self.event_index = {}
+        self.template_events = []
+        self.cancelled_ids = set()
+        self.prefetched_range = None
+        self.calendar_version = None
+        self.journal = None
+        self.resume = False
+        self.failed = 0
+        self.mirror_filename = mirror_filename
+        self.calendar_mirror = None
+        self.mirror_synced = False
+
+
+    def load_data(self, event_templates, date_types, event_data):
+        """Sets the event templates, date types and event data to schedule, so that
+        they can be given once read while existing events are already prefetched.
+        """
         self.event_templates = event_templates
         self.date_types = date_types
         self.event_data = event_data
+        self.months = [get_month_data(month) for month in (event_data if isinstance(event_data, list) else [event_data])]
+        self.template_table = self.build_template_table()
+
+
+    @property
+    def calendar_service(self):
+        "Google Calendar service, built on first use"
+        if self.service is None:
+            self.service = self.build_calendar_service()
+        return self.service
+
+
+    @calendar_service.setter
+    def calendar_service(self, calendar_service):
+        self.service = calendar_service
+
+
+    def build_calendar_service(self):
+        "Builds the Calendar service on the session shared with the other Google API clients"
+        self.session = get_session(self.credentials_filename)
+        return self.session.build('calendar', 'v3')
+
+
+    @property
+    def mirror(self):
+        "Local mirror of the calendar when a `mirror_filename` was given, None otherwise"
+        if self.mirror_filename is not None and self.calendar_mirror is None:
+            self.calendar_mirror = CalendarMirror(self.calendar_service, self.calendar_id, self.mirror_filename)
+        return self.calendar_mirror
+
+
+    def build_template_table(self):
+        """Returns a lookup table with the (matched, unmatched) templates for every
+        (weekday, datetype), so that templates are matched once and not for every day.
+        """
+        return {(weekday, datetype): self.match_templates(weekday, datetype)
+                for weekday in range(7) for datetype in self.date_types.keys()}
+
+
+    def match_templates(self, weekday, datetype):
+        matched = tuple(tmpl for tmpl in self.event_templates if tmpl.applies_to(weekday, datetype))
+        unmatched = tuple(tmpl for tmpl in self.event_templates if not tmpl.applies_to(weekday, datetype))
+        return matched, unmatched
+
+
+    def get_templates_for_day(self, weekday, datetype):
+        "Returns (matched, unmatched) templates for `weekday` and `datetype`"
+        templates = self.template_table.get((weekday, datetype))
+        if templates is None:
+            # datetype not declared on date types
+            templates = self.template_table[(weekday, datetype)] = self.match_templates(weekday, datetype)
+        return templates
+
+
+    def execute_request(self, request, kind, description, on_success=None, on_conflict=None, on_missing=None):
+        """Executes a Calendar API write `request` right away, or queues it
+        on the current batch when scheduling in batched mode (returns None then).
+        `on_success(response)` is called once the request succeeded, if given,
+        `on_conflict()` sends a fallback when it fails with 409 Conflict, and
+        `on_missing()` when it fails with 404 Not Found or 410 Gone.
+        """
+        # calendar is going to change, so the mirror will need to sync again
+        self.mirror_synced = False
+        if self.batch_writer is not None:
+            self.batch_writer.add(request, kind, description, on_success, on_conflict, on_missing)
+            return None
+        try:
+            response = execute_with_backoff(request, self.rate_limiter)
+        except HttpError as e:
+            if on_conflict is not None and e.resp.status == 409:
+                return on_conflict()
+            if on_missing is not None and e.resp.status in (404, 410):
+                return on_missing()
+            raise
+        if on_success is not None:
+            on_success(response)
+        return response
+
+
+    def get_thread_http(self):
+        "Returns an authorized HTTP client for the current thread, as httplib2 is not thread safe"
+        if self.calendar_service is not None and self.session is None:
+            # given service is used with its own transport
+            return None
+        if not hasattr(self.thread_local, 'http'):
+            self.thread_local.http = self.session.new_http()
+        return self.thread_local.http
+
+
+    def sync_mirror(self):
+        "Syncs the local mirror of the calendar, once until the calendar is written again"
+        if not self.mirror_synced:
+            self.mirror.sync()
+            self.mirror_synced = True
+
+
+    def get_events_in_range(self, start_date, end_date):
+        """Returns every event between `start_date` and `end_date` (both included),
+        deleted ones included, from the local mirror or listing them with a single
+        paginated query.
+        """
+        if self.mirror is not None:
+            self.sync_mirror()
+            return self.mirror.get_events(start_date, end_date, include_cancelled=True)
+
+        return list(self.iter_events(start_date, end_date, MAX_PAGE_SIZE, LIST_FIELDS, showDeleted=True))
+
+
+    def iter_events(self, start_date=None, end_date=None, page_size=DEFAULT_PAGE_SIZE, fields=UPCOMING_FIELDS, **params):
+        """Yields the events of the calendar between `start_date` and `end_date` (both
+        included and optional) one at a time, as `event_iterator.iter_events` does.
+        Recurring events are expanded to their instances.
+        """
+        return iter_events(self.calendar_service, self.calendar_id, get_time_min(start_date) if start_date else None,
+                           get_time_max(end_date) if end_date else None, page_size, fields, self.rate_limiter,
+                           singleEvents=True, **params)
+
+
+    def prefetch_events(self, start_date, end_date):
+        """Lists every event created from a template between `start_date` and
+        `end_date` (both included) with a single paginated query, and indexes
+        them by (template_name, date) so that `get_event_id` does not need to
+        query Google Calendar for dates within that range.
+
+        Ids of deleted events are kept on `cancelled_ids`, as those ids cannot
+        be used again to insert events, every event created from a template,
+        duplicates included, on `template_events`, and the version of the events
+        listed on `calendar_version` (see `get_events_version`).
+        """
+        print(f"Prefetching existing events from {start_date} to {end_date} ...")
+        self.event_index = {}
+        self.template_events = []
+        self.cancelled_ids = set()
+
+        with profiler.phase('prefetch'):
+            events = self.get_events_in_range(start_date, end_date)
+        self.calendar_version = get_events_version(events)
+
+        for event in events:
+            if event.get('status') == 'cancelled':
+                self.cancelled_ids.add(event['id'])
+                continue
+            template_name = get_template_name(event)
+            # skip manually created events which will not have the extendedProperty template_name
+            if template_name is None:
+                continue
+            self.template_events.append(event)
+            # keep the first ocurrence as `get_event_id` always did
+            self.event_index.setdefault((template_name, get_event_date(event)), event)
+
+        self.prefetched_range = (start_date, end_date)
+        print(f"Found {len(self.event_index)} events created from templates.")
+        return self.event_index
+
+
+    def is_prefetched(self, event_date):
+        return self.prefetched_range is not None and self.prefetched_range[0] <= event_date <= self.prefetched_range[1]
 
 
     def get_event_id(self, event_template, event_date):
         """Look for existing events with same `event_template`.
-        We assume a maximum of 10 events per date and we return the first ocurrence.
+        Events prefetched with `prefetch_events` are looked up on the index,
+        or on the local mirror when used. Otherwise we query the calendar assuming
+        a maximum of 10 events per date and we return the first ocurrence.
         """
-        events_result = self.calendar_service.events().list(calendarId=self.calendar_id,
+        if self.is_prefetched(event_date):
+            event = self.event_index.get((event_template.name, event_date))
+            return event['id'] if event else None
+
+        if self.mirror is not None:
+            self.sync_mirror()
+            event = self.mirror.find_template_event(event_template.name, event_date)
+            return event['id'] if event else None
+
+        request = self.calendar_service.events().list(calendarId=self.calendar_id,
                                             timeMin=datetime.combine(event_date, time(0,0)).isoformat() + 'Z',
                                             timeMax=datetime.combine(event_date, time(23,59)).isoformat() + 'Z',
                                             maxResults=10, singleEvents=True,
-                                            orderBy='startTime').execute()
+                                            orderBy='startTime', fields=LOOKUP_FIELDS)
+        events_result = execute_with_backoff(request, self.rate_limiter)
         events = events_result.get('items', [])
 
         for event in events:
@@ -65,7 +303,8 @@ class EventScheduler():
         return None
 
 
-    def create_event(self, event_template, event_date, event_color):
+    def build_event_body(self, event_template, event_date, event_color):
+        "Returns the body of the event to schedule on `event_date` based on `event_template`"
 
         def all_day_event(event_date):
             return { "date": event_date.isoformat(), "timeZone": self.calendar_timezone }
@@ -73,7 +312,8 @@ class EventScheduler():
         def event_datetime(event_date, event_time):
             return { "dateTime": datetime.combine(event_date, event_time).isoformat(), "timeZone": self.calendar_timezone }
 
-        event_body={
+        return {
+            "id": make_event_id(self.calendar_id, event_template.name, event_date),
             "extendedProperties": { "private": { "template_name": event_template.name } }, # needed to overwrite existing events
             "summary": event_template.summary,
             "description": event_template.description,
@@ -82,15 +322,69 @@ class EventScheduler():
             "colorId": event_color,
         }
 
+
+    def upsert_event(self, event_body, description, on_success=None):
+        """Inserts the event in `event_body` with its own id, or patches it when
+        Google Calendar already has an event with that id, even a deleted one, in
+        batched mode too. Only the id of the event is returned.
+        """
+        request = self.calendar_service.events().insert(calendarId=self.calendar_id, body=event_body, fields=WRITE_FIELDS)
+        return self.execute_request(request, 'insert', description, on_success,
+                                    on_conflict=lambda: self.patch_event(event_body, description, on_success))
+
+
+    def patch_event(self, event_body, description, on_success=None, existing_event=None):
+        """Patches the event with the id of `event_body`, sending only the fields which
+        differ from `existing_event` when given, or every field otherwise, restoring the
+        event if it was deleted. Only the id of the event is returned.
+        """
+        if existing_event is not None:
+            body = diff_event(event_body, existing_event)
+            if not body:
+                print("Event {} is up to date.".format(event_body['id']))
+                return { 'id': event_body['id'] }
+        else:
+            body = get_restore_body(event_body)
+        print("Updating existing event {}: {} ...".format(event_body['id'], ", ".join(sorted(body.keys()))))
+        request = self.calendar_service.events().patch(calendarId=self.calendar_id, eventId=event_body['id'], body=body, fields=WRITE_FIELDS)
+        return self.execute_request(request, 'patch', description, on_success)
+
+
+    def create_event(self, event_template, event_date, event_color):
+        """Creates or updates the event on `event_date` based on `event_template`.
+
+        Events get an id derived from calendar, template and date, so no lookup is
+        needed before writing. Events created before ids were deterministic are only
+        found on prefetched dates, and are migrated to the new id.
+        """
+        event_body = self.build_event_body(event_template, event_date, event_color)
+        key = (event_template.name, event_date)
+        description = "'{}' on {}".format(event_template.name, event_date)
+
         print("Scheduling event '{}' ...".format(event_template.summary))
-        event_id = self.get_event_id(event_template, event_date)
+        existing_event = self.event_index.get(key) if self.is_prefetched(event_date) else None
 
-        if event_id:
-            print("Updating existing event {} ...".format(event_id))
-            event_result = self.calendar_service.events().update(calendarId=self.calendar_id, eventId=event_id, body=event_body).execute()
+        if existing_event and existing_event['id'] != event_body['id']:
+            print("Migrating existing event {} to id {} ...".format(existing_event['id'], event_body['id']))
+            request = self.calendar_service.events().delete(calendarId=self.calendar_id, eventId=existing_event['id'])
+            self.execute_request(request, 'delete', description)
+            existing_event = None
+
+        if existing_event or event_body['id'] in self.cancelled_ids:
+            event_result = self.patch_event(event_body, description, existing_event=existing_event)
         else:
             print("Creating new event ...")
-            event_result = self.calendar_service.events().insert(calendarId=self.calendar_id, body=event_body).execute()
+            event_result = self.upsert_event(event_body, description)
+
+        if event_result is None:
+            # queued on current batch
+            return None
+
+        # responses only have the event id
+        event_result = dict(event_body, **event_result)
+
+        if self.is_prefetched(event_date):
+            self.event_index[key] = event_result
 
         print("id: ", event_result['id'])
         print("summary: ", event_result['summary'])
@@ -102,47 +396,361 @@ class EventScheduler():
 
     def delete_event(self, event_template, event_date):
         """Delete event created on `event_date` based on `event_template`.
+
+        On prefetched dates the event id is taken from the index, otherwise the
+        event is deleted straight by its deterministic id. If there is no such
+        event, it is looked up in case it was created before ids were deterministic.
         """
-        event_id = self.get_event_id(event_template, event_date)
+        key = (event_template.name, event_date)
+        description = "'{}' on {}".format(event_template.name, event_date)
+
+        if self.is_prefetched(event_date):
+            event = self.event_index.pop(key, None)
+            event_id = event['id'] if event else None
+            if event:
+                self.template_events.remove(event)
+        else:
+            event_id = make_event_id(self.calendar_id, event_template.name, event_date)
+            request = self.calendar_service.events().delete(calendarId=self.calendar_id, eventId=event_id)
+            # 410 Gone is returned for events already deleted, in batches too
+            on_missing = lambda: self.delete_event_by_id(self.get_event_id(event_template, event_date), event_template, description)
+            return self.execute_request(request, 'delete', description, on_missing=on_missing)
+
+        return self.delete_event_by_id(event_id, event_template, description)
 
+
+    def delete_event_by_id(self, event_id, event_template, description):
+        "Deletes event `event_id` created from `event_template`, if any"
         if event_id:
             print("Deleting event '{}' with id {} ...".format(event_template.summary, event_id))
-            return self.calendar_service.events().delete(calendarId=self.calendar_id, eventId=event_id).execute()
+            request = self.calendar_service.events().delete(calendarId=self.calendar_id, eventId=event_id)
+            return self.execute_request(request, 'delete', description)
         else:
         #    print("DEBUG: Event '{}' not found. Not deleted.".format(event_template.summary))
             return None
 
 
-    def schedule_events(self):
+    def get_scheduled_days(self):
+        "Returns a list of (date, datetype) for days on event data from today on"
+        scheduled_days = []
+        today = get_today()
 
-        year = self.event_data['year']
-        month = self.event_data['month']
-        custody_days = self.event_data['days']
+        for month_data in self.months:
+            for day, datetype in month_data.iter_days():
+                event_date = date(month_data.year, month_data.month, day)
+                if event_date >= today:
+                    scheduled_days.append((event_date, datetype))
 
-        for day, datetype in custody_days.items():
-            event_date = date(year, month, int(day))
-            datetype_desc = self.date_types[datetype]['name']
-            color = self.date_types[datetype]['color']
-            weekday = event_date.weekday()
+        return scheduled_days
 
-            if event_date >= get_today():
-                print(f"Scheduling events for {calendar.day_abbr[weekday]} {event_date} ({datetype_desc}) ...")
-            else:
-                print(f"Skipping passed events for {calendar.day_abbr[weekday]} {event_date}.")
+
+    def get_desired_events(self):
+        """Returns the bodies of the events that should be on the calendar from today on,
+        indexed by (template_name, date).
+        """
+        desired_events = {}
+
+        for event_date, datetype in self.get_scheduled_days():
+            desired_events.update(self.get_desired_events_for_day(event_date, datetype))
+
+        return desired_events
+
+
+    def get_desired_events_for_day(self, event_date, datetype):
+        "Returns the bodies of the events that should be on `event_date`, indexed by (template_name, date)"
+        color = self.date_types[datetype]['color']
+        matched, unmatched = self.get_templates_for_day(event_date.weekday(), datetype)
+        return {(event_tmpl.name, event_date): self.build_event_body(event_tmpl, event_date, color) for event_tmpl in matched}
+
+
+    def get_existing_events(self, scheduled_dates):
+        """Returns the prefetched events from known templates on `scheduled_dates`, which
+        are the ones managed, as (single events, instances of recurring events).
+        """
+        if not (self.is_prefetched(min(scheduled_dates)) and self.is_prefetched(max(scheduled_dates))):
+            self.prefetch_events(min(scheduled_dates), max(scheduled_dates))
+
+        # Only events from known templates on scheduled days are managed, others are left untouched
+        template_names = set(tmpl.name for tmpl in self.event_templates)
+        existing_events = {key: event for key, event in self.event_index.items()
+                           if key[0] in template_names and key[1] in scheduled_dates}
+        existing_singles = {key: event for key, event in existing_events.items() if 'recurringEventId' not in event}
+        existing_instances = {key: event for key, event in existing_events.items() if 'recurringEventId' in event}
+        return existing_singles, existing_instances
+
+
+    def plan_changes(self, recurrence=False):
+        """Compares the desired events with the events created from templates found
+        on the calendar, and returns a `ReconcilePlan` with the minimal inserts,
+        patches and deletes to apply. Events that already match are left alone.
+
+        With `recurrence`, occurrences of a template are written as a recurring
+        event (see `recurrence.compress_events`) instead of one event per date.
+        """
+        scheduled_dates = set(event_date for event_date, datetype in self.get_scheduled_days())
+        if not scheduled_dates:
+            return reconcile({}, {})
+
+        existing_singles, existing_instances = self.get_existing_events(scheduled_dates)
+        desired_events = self.get_desired_events()
+        series_list = []
+        existing_series_ids = set()
+        if recurrence:
+            series_list, desired_events = compress_events(desired_events, self.calendar_id, get_school_period_start(self.months))
+            existing_series_ids = self.get_existing_series(series_list, existing_instances, scheduled_dates)
+
+        plan = reconcile(desired_events, existing_singles, self.cancelled_ids)
+        operations, unchanged = reconcile_series(series_list, existing_instances, self.cancelled_ids, existing_series_ids)
+        plan.operations.extend(operations)
+        plan.unchanged += unchanged
+        return plan
+
+
+    def get_existing_series(self, series_list, existing_instances, scheduled_dates):
+        """Returns the ids of the recurring events of `series_list` already on the calendar,
+        reading those whose instances on `scheduled_dates` changed, and keeps on the series
+        their occurrences out of `scheduled_dates`, past ones included, so that patching
+        them does not drop those.
+        """
+        instances_by_series = group_instances(existing_instances)
+        existing_series_ids = set()
+        for series in series_list:
+            if series.matches(instances_by_series.get(series.series_id, {})):
+                continue
+            request = self.calendar_service.events().get(calendarId=self.calendar_id, eventId=series.series_id, fields=SERIES_FIELDS)
+            try:
+                series_event = execute_with_backoff(request, self.rate_limiter)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                continue
+            if series_event.get('status') == 'cancelled':
                 continue
+            existing_series_ids.add(series.series_id)
+            series.keep_dates(event_date for event_date in get_series_dates(series_event) if event_date not in scheduled_dates)
+        return existing_series_ids
+
+
+    def iter_day_plans(self, recurrence=False):
+        """Yields the plan of every scheduled day, in order, with the same operations
+        `plan_changes` returns altogether, so that writes can start before every day
+        is planned. Instances of recurring events no longer desired are planned last.
+
+        With `recurrence`, series span several days, so a single plan is yielded.
+        """
+        if recurrence:
+            yield self.plan_changes(recurrence)
+            return
+
+        scheduled_days = self.get_scheduled_days()
+        if not scheduled_days:
+            return
+
+        existing_singles, existing_instances = self.get_existing_events(set(event_date for event_date, datetype in scheduled_days))
+        existing_by_date = {}
+        for key, event in existing_singles.items():
+            existing_by_date.setdefault(key[1], {})[key] = event
+
+        for event_date, datetype in scheduled_days:
+            yield reconcile(self.get_desired_events_for_day(event_date, datetype), existing_by_date.get(event_date, {}), self.cancelled_ids)
+
+        if existing_instances:
+            yield ReconcilePlan(*reconcile_series([], existing_instances, self.cancelled_ids))
+
 
-            # Schedule events for templates that match current weekday and datetype
-            # and delete those that no longer match
-            for event_tmpl in self.event_templates:
-                if weekday in event_tmpl.weekdays and datetype in event_tmpl.datetypes:
-                    #print("DEBUG: {} matches weekday {}".format(event_tmpl.name, weekday))
-                    #print("DEBUG: {} matches datetype {}".format(event_tmpl.name, datetype))
-                    self.create_event(event_tmpl, event_date, color)
+    def build_request(self, op):
+        "Returns the Calendar API request for reconcile operation `op`"
+        if op.kind == Operation.INSERT:
+            return self.calendar_service.events().insert(calendarId=self.calendar_id, body=op.body, fields=WRITE_FIELDS)
+        elif op.kind == Operation.PATCH:
+            return self.calendar_service.events().patch(calendarId=self.calendar_id, eventId=op.event_id, body=op.body, fields=WRITE_FIELDS)
+        else:
+            return self.calendar_service.events().delete(calendarId=self.calendar_id, eventId=op.event_id)
+
+
+    def apply_plan(self, plan, batch_size=None, workers=1):
+        """Sends the operations of `plan` to Google Calendar.
+
+        When `batch_size` is given, calls are grouped in batch requests of up
+        to `batch_size` calls (max 50). When `workers` is greater than 1, calls
+        are sent concurrently from that many threads. In both cases a summary
+        with results and failures is printed and returned at the end.
+        """
+        if batch_size and workers > 1:
+            raise ValueError("Batched and concurrent modes can not be combined")
+
+        operations = self.get_pending_operations(plan.operations)
+        if len(operations) < len(plan.operations):
+            print(f"Resuming, {len(plan.operations) - len(operations)} operations were already confirmed.")
+            plan = ReconcilePlan(operations, plan.unchanged)
+
+        with profiler.phase('writes'):
+            if workers > 1:
+                summary = self.apply_plan_concurrently(plan, workers)
+            else:
+                summary = self.apply_plan_sequentially(plan, batch_size)
+        if summary is not None:
+            self.failed += len(summary.failures)
+        return summary
+
+
+    def get_pending_operations(self, operations):
+        "Returns `operations` except those confirmed on the journal when resuming"
+        if self.journal is None or not self.resume:
+            return list(operations)
+        return [op for op in operations if not self.journal.is_confirmed(self.calendar_id, op)]
+
+
+    def confirm_operation(self, op):
+        "Records operation `op` as confirmed on the journal, if any"
+        if self.journal is not None:
+            self.journal.record(self.calendar_id, op)
+
+
+    def compact_journal(self):
+        "Drops the operations of the calendar from the journal, once written without failures"
+        if self.journal is None:
+            return
+        if self.failed == 0:
+            self.journal.compact(self.calendar_id)
+        else:
+            print(f"Confirmed writes kept on {self.journal.journal_filename}, run again with --resume to skip them")
+
+
+    def apply_plan_sequentially(self, plan, batch_size=None):
+        "Sends the operations of `plan` one by one, or in batch requests of up to `batch_size` calls"
+
+        if batch_size:
+            self.batch_writer = BatchWriter(self.calendar_service, batch_size, self.rate_limiter)
+
+        try:
+            for op in plan.operations:
+                print(f"Applying {op} ...")
+                description = "'{}' on {}".format(op.template_name, op.event_date)
+                on_success = lambda response, op=op: self.confirm_operation(op)
+                if op.kind == Operation.INSERT:
+                    # ids of deleted events can not be inserted again
+                    self.upsert_event(op.body, description, on_success)
                 else:
-                    #print("DEBUG: {} does not match weekday {} or datetype {}".format(event_tmpl.name, weekday, datetype))
-                    self.delete_event(event_tmpl, event_date)
+                    self.execute_request(self.build_request(op), op.kind, description, on_success)
+        finally:
+            batch_writer = self.batch_writer
+            try:
+                if batch_writer is not None:
+                    # writes queued before an error are still sent and reported
+                    batch_writer.flush()
+                    batch_writer.summary.print_summary()
+            finally:
+                self.batch_writer = None
+                # calendar has changed, so prefetched events are no longer reliable
+                self.prefetched_range = None
+
+        return batch_writer.summary if batch_writer is not None else None
+
+
+    def apply_plan_concurrently(self, plan, workers):
+        """Sends the operations of `plan` from a pool of `workers` threads sharing
+        a rate limiter. Rate limit and server errors are retried with backoff, and
+        operations still failing are reported on the summary instead of aborting.
+        """
+        summary = BatchSummary()
+        self.mirror_synced = False
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # operations see the context of the caller, so that tenants still capture what they print
+                futures = {executor.submit(contextvars.copy_context().run, self.send_operation, op): op for op in plan.operations}
+                for future in as_completed(futures):
+                    op = futures[future]
+                    description = "'{}' on {}".format(op.template_name, op.event_date)
+                    try:
+                        summary.add_result(op.kind, description, future.result())
+                        self.confirm_operation(op)
+                    except Exception as e:
+                        summary.add_failure(op.kind, description, e)
+        finally:
+            # calendar has changed, so prefetched events are no longer reliable
+            self.prefetched_range = None
+
+        summary.print_summary()
+        return summary
+
+
+    def send_operation(self, op):
+        """Sends reconcile operation `op` with the HTTP client of the current thread, retrying
+        with backoff. Inserts are upserts, as in `upsert_event`.
+        """
+        print(f"Applying {op} ...")
+        http = self.get_thread_http()
+        try:
+            return execute_with_backoff(self.build_request(op), self.rate_limiter, http=http)
+        except HttpError as e:
+            if op.kind != Operation.INSERT or e.resp.status != 409:
+                raise
+            print("Updating existing event {} ...".format(op.body['id']))
+            request = self.calendar_service.events().patch(calendarId=self.calendar_id, eventId=op.body['id'],
+                                                           body=get_restore_body(op.body), fields=WRITE_FIELDS)
+            return execute_with_backoff(request, self.rate_limiter, http=http)
+
+
+    def schedule_events(self, batch_size=None, workers=1, recurrence=False):
+        """Schedules events for every day on event data from today on, and deletes
+        events for templates that no longer match.
+
+        Existing events are prefetched with a single query and reconciled with the
+        desired ones, so that only inserts, patches and deletes that actually
+        change something are sent. See `apply_plan` for `batch_size` and `workers`
+        and `plan_changes` for `recurrence`.
+        """
+        plan = self.plan_changes(recurrence)
+        plan.print_plan()
+        return self.apply_plan(plan, batch_size, workers)
 
-            print("-----------------------------------------------")
+
+    def sweep_stale_events(self, start_date=None, end_date=None, batch_size=None, workers=1):
+        """Deletes events created from templates (those with the template_name extended
+        property) between `start_date` and `end_date` that are not desired anymore,
+        including those from templates removed from the spreadsheet, as planned by
+        `plan_sweep`. Returns the number of deletes issued. See `apply_plan` for
+        `batch_size` and `workers`.
+        """
+        plan = self.plan_sweep(start_date, end_date)
+        if not plan.is_empty():
+            self.apply_plan(plan, batch_size, workers)
+        return len(plan.operations)
+
+
+    def plan_sweep(self, start_date=None, end_date=None):
+        """Returns a `ReconcilePlan` deleting events created from templates between
+        `start_date` and `end_date` that are not desired anymore. Events are listed
+        once for the whole range, and only scheduled days from today on are swept.
+        Dates default to the first and last scheduled days.
+        """
+        scheduled_dates = set(event_date for event_date, datetype in self.get_scheduled_days())
+        start_date = start_date or min(scheduled_dates, default=None)
+        end_date = end_date or max(scheduled_dates, default=None)
+        if start_date is None or end_date is None:
+            print("No scheduled days to sweep.")
+            return ReconcilePlan([], 0)
+
+        if not (self.is_prefetched(start_date) and self.is_prefetched(end_date)):
+            self.prefetch_events(start_date, end_date)
+
+        desired_keys = set(self.get_desired_events().keys())
+        operations = []
+        kept = 0
+        events = [(get_event_date(event), get_template_name(event), event) for event in self.template_events]
+        for event_date, template_name, event in sorted(events, key=lambda item: item[:2]):
+            if not start_date <= event_date <= end_date or event_date not in scheduled_dates:
+                continue
+            # only the event reconciled with the desired one is kept, duplicates are stale
+            if (template_name, event_date) in desired_keys and self.event_index.get((template_name, event_date)) is event:
+                kept += 1
+            else:
+                operations.append(Operation(Operation.DELETE, template_name, event_date, event_id=event['id']))
+
+        print(f"Sweeping {len(operations)} stale events, {kept} events kept.")
+        return ReconcilePlan(operations, kept)
 
 
     def list_upcoming_events(self, start_date=datetime.today().isoformat(), max_results=10): 
@@ -150,11 +758,15 @@ class EventScheduler():
         """
         start_datetime=datetime.fromisoformat(start_date).isoformat() + 'Z' # 'Z' indicates UTC time
         print(f"Getting (max {max_results}) upcoming events from {start_date} ...")
-        events_result = self.calendar_service.events().list(calendarId=self.calendar_id,
-                                            timeMin=start_datetime,
-                                            maxResults=max_results, singleEvents=True,
-                                            orderBy='startTime').execute()
-        events = events_result.get('items', [])
+        if max_results < 1:
+            events = []
+        elif self.mirror is not None:
+            self.sync_mirror()
+            events = self.mirror.get_upcoming_events(start_datetime, max_results)
+        else:
+            # pages are only requested until `max_results` events are listed
+            events = list(islice(iter_events(self.calendar_service, self.calendar_id, start_datetime, page_size=min(max_results, MAX_PAGE_SIZE),
+                                             rate_limiter=self.rate_limiter, singleEvents=True, orderBy='startTime'), max_results))
 
         if not events:
             print('No upcoming events found.')
@@ -168,23 +780,24 @@ class EventScheduler():
     def list_events_to_be_scheduled(self):
         """Lists events to be scheduled as per event data loaded when initialized.
         """
-        year = self.event_data['year']
-        month = self.event_data['month']
-
-        # Print calendar view for a general overview
         print(f"\nPreview of events to be scheduled:\n")
-        print(calendar.month(year, month))
 
-        for day, dtype in self.event_data['days'].items():
-            event_date = date(year, month, int(day))
-            weekday = event_date.weekday()
+        for month_data in self.months:
+            # Print calendar view for a general overview
+            print(calendar.month(month_data.year, month_data.month))
+
+            for day, dtype in month_data.iter_days():
+                event_date = date(month_data.year, month_data.month, day)
+                weekday = event_date.weekday()
 
-            if event_date >= get_today():
-                events = ", ".join(f"{tmpl.start_time} {tmpl.summary}" for tmpl in self.event_templates if weekday in tmpl.weekdays and dtype in tmpl.datetypes)
-                print(f"{calendar.day_abbr[weekday]} {event_date}: {events}")
+                if event_date >= get_today():
+                    matched, unmatched = self.get_templates_for_day(weekday, dtype)
+                    events = ", ".join(f"{tmpl.start_time} {tmpl.summary}" for tmpl in matched)
+                    print(f"{calendar.day_abbr[weekday]} {event_date}: {events}")
 
 
     def print_datetype_distribution(self):
         print(f"\nEvents distribution:\n")
         for datetype in self.date_types.keys():
-            print(f" * {self.date_types[datetype]['name']} got {self.event_data['caregivers'][datetype]} days")
\ No newline at end of file
+            days = sum(month_data.count_days(datetype) for month_data in self.months)
+            print(f" * {self.date_types[datetype]['name']} got {days} days")
\ No newline at end of file
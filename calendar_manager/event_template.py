@@ -1,13 +1,18 @@
+import sys
 from datetime import datetime
 
 class EventTemplate:
+    __slots__ = ('name', 'summary', 'description', 'datetypes', 'weekday_mask', 'datetype_set', 'start_time', 'end_time', 'all_day')
 
     def __init__(self, name, summary, description, datetypes, weekdays, start_time='', end_time=''):
         self.name = name
         self.summary = summary
         self.description = description
-        self.weekdays = [int(wk) for wk in weekdays]
-        self.datetypes = datetypes
+        # datetypes as interned codes, shared with month data, and set for fast matching
+        self.datetypes = tuple(sys.intern(datetype) for datetype in datetypes)
+        self.datetype_set = frozenset(self.datetypes)
+        # weekdays as bitmask, bit 0 for Monday
+        self.weekday_mask = sum(1 << wk for wk in set(int(wk) for wk in weekdays))
         if ":" in start_time:
             self.start_time = datetime.strptime(start_time, '%H:%M').time()
         else:
@@ -18,6 +23,15 @@ class EventTemplate:
             self.end_time = None
         self.all_day = not start_time or not end_time
 
+    @property
+    def weekdays(self):
+        "Weekdays the template applies to, 0 for Monday"
+        return [wk for wk in range(7) if self.weekday_mask & (1 << wk)]
+
+    def applies_to(self, weekday, datetype):
+        "Returns True if the template has to be scheduled on `weekday` for `datetype`"
+        return bool(self.weekday_mask & (1 << weekday)) and datetype in self.datetype_set
+
     def __str__(self):
         return "{}: summary='{}', description='{}', weekdays={}, datetypes={}, start={}, end={}, all_day={}".format(
             self.name,
@@ -0,0 +1,404 @@
+import re
+import copy
+import time
+import threading
+from collections import Counter
+from datetime import date, timedelta
+import httplib2
+from googleapiclient.errors import HttpError
+from gspread.utils import a1_to_rowcol
+
+
+# In-process stand-ins for the Google Calendar `events` resource and Google Sheets
+# values, used by tests and benchmarks. They keep count of every call made, and can
+# simulate network latency and quota errors.
+
+BYDAY = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def http_error(status, reason=''):
+    content = '{{"error": {{"code": {}, "errors": [{{"reason": "{}"}}]}}}}'.format(status, reason)
+    return HttpError(httplib2.Response({ 'status': status }), content.encode('utf-8'))
+
+
+class FakeBackend():
+    """Counts calls and HTTP requests, sleeping `latency` seconds on every HTTP request
+    and failing every `quota_error_every` calls with a 403 rateLimitExceeded. Calls are
+    also logged in order on `log`, as (operation, parameters), for tests to check.
+    """
+    def __init__(self, latency=0.0, quota_error_every=0):
+        self.latency = latency
+        self.quota_error_every = quota_error_every
+        self.calls = Counter()
+        self.log = []
+        self.http_requests = 0
+        self.lock = threading.RLock()
+
+    def http_request(self):
+        with self.lock:
+            self.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def count_call(self, operation, params=None):
+        with self.lock:
+            self.calls[operation] += 1
+            self.log.append((operation, params or {}))
+            total = sum(self.calls.values())
+        if self.quota_error_every and total % self.quota_error_every == 0:
+            raise http_error(403, 'rateLimitExceeded')
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls = Counter()
+            self.log = []
+            self.http_requests = 0
+
+
+class FakeRequest():
+    def __init__(self, backend, operation, handler, params=None, resource='calendar.events'):
+        self.backend = backend
+        self.operation = operation
+        self.methodId = f'{resource}.{operation}'
+        self.handler = handler
+        self.params = params
+
+    def run(self):
+        "Runs the request as part of an HTTP request already counted (batches)"
+        self.backend.count_call(self.operation, self.params)
+        with self.backend.lock:
+            return self.handler()
+
+    def execute(self, http=None, num_retries=0):
+        self.backend.http_request()
+        return self.run()
+
+
+class FakeBatch():
+    def __init__(self, backend, callback):
+        self.backend = backend
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self, http=None):
+        self.backend.http_request()
+        for request_id, request in self.requests:
+            try:
+                response, exception = request.run(), None
+            except HttpError as e:
+                response, exception = None, e
+            self.callback(request_id, response, exception)
+
+
+def get_params(arguments):
+    "Returns the parameters given to a resource method, from its `locals()`"
+    return {name: value for name, value in arguments.items() if name not in ('self', 'handler') and value is not None}
+
+
+def get_start_key(event):
+    "Returns the local start of an event as YYYY-MM-DDTHH:MM:SS, to sort and filter events"
+    start = event.get('start', {})
+    return start['dateTime'][:19] if 'dateTime' in start else start.get('date', '') + 'T00:00:00'
+
+
+def expand_recurrence(event):
+    """Returns the instances of a recurring event, supporting the weekly RRULEs with
+    COUNT and the EXDATEs written by calendar-manager.
+    """
+    rule = {}
+    exdates = set()
+    for line in event['recurrence']:
+        if line.startswith('RRULE:'):
+            rule = dict(part.split('=') for part in line[len('RRULE:'):].split(';'))
+        elif line.startswith('EXDATE'):
+            exdates.update(value[:8] for value in line.split(':', 1)[1].split(','))
+
+    weekdays = [BYDAY.index(day) for day in rule.get('BYDAY', '').split(',') if day]
+    first = date.fromisoformat(get_start_key(event)[:10])
+    count = int(rule.get('COUNT', 1))
+
+    instances = []
+    current = first
+    while count > 0:
+        if current.weekday() in weekdays or current == first:
+            count -= 1
+            if current.strftime('%Y%m%d') not in exdates:
+                instance = copy.deepcopy(event)
+                del instance['recurrence']
+                instance['id'] = "{}_{}".format(event['id'], current.strftime('%Y%m%d'))
+                instance['recurringEventId'] = event['id']
+                for field in ('start', 'end'):
+                    if 'date' in instance[field]:
+                        instance[field]['date'] = current.isoformat()
+                    else:
+                        instance[field]['dateTime'] = current.isoformat() + instance[field]['dateTime'][10:]
+                instances.append(instance)
+        current += timedelta(days=1)
+    return instances
+
+
+def parse_fields(fields):
+    """Parses partial response selector `fields` ('items(id,start/date),nextPageToken')
+    into a tree of dictionaries by field name, with None for fields selected whole.
+    """
+    root = {}
+    stack = []
+    node = root
+    name = ''
+    for char in fields + ',':
+        if char not in ',()':
+            name += char.strip()
+            continue
+        if name:
+            parts = name.split('/')
+            parent = node
+            for part in parts[:-1]:
+                parent = parent.setdefault(part, {})
+            if char == '(':
+                stack.append(node)
+                node = parent.setdefault(parts[-1], {})
+            else:
+                parent.setdefault(parts[-1], None)
+        if char == ')':
+            node = stack.pop()
+        name = ''
+    return root
+
+
+def select_fields(resource, fields):
+    "Returns `resource` with only the fields of selector `fields`, as partial responses of Google APIs"
+    def select(value, tree):
+        if tree is None:
+            return value
+        if isinstance(value, list):
+            return [select(item, tree) for item in value]
+        if not isinstance(value, dict):
+            return value
+        return {key: select(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+    return resource if not fields else select(resource, parse_fields(fields))
+
+
+class FakeEvents():
+    """Stand-in for the Google Calendar `events` resource of a single calendar
+    (`calendarId` is ignored). Deleted events are kept as cancelled, as Google
+    Calendar does, so their ids can not be inserted again.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.events = {}
+        self.changes = []
+        self.next_id = 0
+
+    def add_event(self, event):
+        "Stores `event` directly, without counting any call"
+        event = copy.deepcopy(event)
+        if 'id' not in event:
+            self.next_id += 1
+            event['id'] = "fake{}".format(self.next_id)
+        event.setdefault('status', 'confirmed')
+        self.events[event['id']] = event
+        self.changes.append(event['id'])
+        return copy.deepcopy(event)
+
+    def expand(self, single_events):
+        for event in list(self.events.values()):
+            if single_events and 'recurrence' in event:
+                for instance in expand_recurrence(event):
+                    # instances modified or deleted on their own are stored with their id
+                    if instance['id'] not in self.events:
+                        if event['status'] == 'cancelled':
+                            instance['status'] = 'cancelled'
+                        yield instance
+            else:
+                yield event
+
+    def list(self, calendarId=None, timeMin=None, timeMax=None, maxResults=250, singleEvents=False,
+             showDeleted=False, orderBy=None, pageToken=None, syncToken=None, privateExtendedProperty=None, fields=None):
+        def handler():
+            if syncToken is not None:
+                if not syncToken.isdigit() or int(syncToken) > len(self.changes):
+                    raise http_error(410, 'fullSyncRequired')
+                changed = set(self.changes[int(syncToken):])
+                events = [e for e in self.expand(singleEvents) if e['id'] in changed or e.get('recurringEventId') in changed]
+            else:
+                events = list(self.expand(singleEvents))
+                if not showDeleted:
+                    events = [e for e in events if e['status'] != 'cancelled']
+                if timeMin:
+                    events = [e for e in events if e['status'] == 'cancelled' or get_start_key(e) >= timeMin[:19]]
+                if timeMax:
+                    events = [e for e in events if e['status'] == 'cancelled' or get_start_key(e) < timeMax[:19]]
+                if privateExtendedProperty:
+                    name, value = privateExtendedProperty.split('=', 1)
+                    events = [e for e in events if e.get('extendedProperties', {}).get('private', {}).get(name) == value]
+                events.sort(key=get_start_key)
+
+            start = int(pageToken or 0)
+            result = { 'items': copy.deepcopy(events[start:start + maxResults]) }
+            if start + maxResults < len(events):
+                result['nextPageToken'] = str(start + maxResults)
+            else:
+                result['nextSyncToken'] = str(len(self.changes))
+            return select_fields(result, fields)
+        return FakeRequest(self.backend, 'list', handler, get_params(locals()))
+
+    def get(self, calendarId=None, eventId=None, fields=None):
+        def handler():
+            if eventId not in self.events:
+                raise http_error(404, 'notFound')
+            return select_fields(copy.deepcopy(self.events[eventId]), fields)
+        return FakeRequest(self.backend, 'get', handler, get_params(locals()))
+
+    def insert(self, calendarId=None, body=None, fields=None):
+        def handler():
+            if body.get('id') in self.events:
+                raise http_error(409, 'duplicate')
+            return select_fields(self.add_event(body), fields)
+        return FakeRequest(self.backend, 'insert', handler, get_params(locals()))
+
+    def update(self, calendarId=None, eventId=None, body=None, fields=None):
+        def handler():
+            if eventId not in self.events:
+                raise http_error(404, 'notFound')
+            return select_fields(self.add_event(dict(body, id=eventId, status=body.get('status', 'confirmed'))), fields)
+        return FakeRequest(self.backend, 'update', handler, get_params(locals()))
+
+    def patch(self, calendarId=None, eventId=None, body=None, fields=None):
+        def handler():
+            if eventId not in self.events:
+                raise http_error(404, 'notFound')
+            return select_fields(self.add_event(dict(self.events[eventId], **body)), fields)
+        return FakeRequest(self.backend, 'patch', handler, get_params(locals()))
+
+    def delete(self, calendarId=None, eventId=None):
+        def handler():
+            if eventId not in self.events:
+                master_id = eventId.rsplit('_', 1)[0]
+                if master_id not in self.events:
+                    raise http_error(404, 'notFound')
+                # deleting an instance of a recurring event cancels that instance only
+                self.add_event({ 'id': eventId, 'recurringEventId': master_id, 'status': 'cancelled' })
+                return ''
+            if self.events[eventId]['status'] == 'cancelled':
+                raise http_error(410, 'deleted')
+            self.add_event(dict(self.events[eventId], status='cancelled'))
+            return ''
+        return FakeRequest(self.backend, 'delete', handler, get_params(locals()))
+
+
+class FakeCalendarService(FakeBackend):
+    """Stand-in for a Google Calendar service built with `googleapiclient`, supporting
+    `events()` and `new_batch_http_request()`.
+    """
+    def __init__(self, latency=0.0, quota_error_every=0):
+        super().__init__(latency, quota_error_every)
+        self.fake_events = FakeEvents(self)
+
+    def events(self):
+        return self.fake_events
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+class FakeSpreadsheet(FakeBackend):
+    """Stand-in for a gspread spreadsheet with worksheets given as lists of rows
+    by name, supporting `worksheet()`, `get_all_values()` and `values_batch_get()`.
+    `modified_time` and `version` are the Google Drive metadata of the file.
+    """
+    def __init__(self, worksheets, latency=0.0, quota_error_every=0):
+        super().__init__(latency, quota_error_every)
+        self.worksheets = worksheets
+        self.modified_time = '2020-01-01T00:00:00.000Z'
+        self.version = '1'
+
+    def worksheet(self, name):
+        return FakeWorksheet(self, name)
+
+    def get_range(self, a1_range):
+        worksheet, cells_range = a1_range.rsplit('!', 1)
+        cells = self.worksheets[worksheet.strip("'")]
+        start, end = cells_range.split(':')
+        start_row, start_col = a1_to_rowcol(start)
+        if any(c.isdigit() for c in end):
+            end_row, end_col = a1_to_rowcol(end)
+        else:
+            end_row, end_col = len(cells), a1_to_rowcol(end + '1')[1]
+
+        values = [row[start_col - 1:end_col] for row in cells[start_row - 1:end_row]]
+        # Google Sheets leaves out trailing empty cells and rows
+        values = [row[:max([i + 1 for i, v in enumerate(row) if v != ''], default=0)] for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return { 'range': a1_range, 'values': values }
+
+    def values_batch_get(self, ranges, params=None):
+        self.http_request()
+        self.count_call('values.batchGet', { 'ranges': ranges })
+        return { 'valueRanges': [self.get_range(a1_range) for a1_range in ranges] }
+
+
+class FakeWorksheet():
+    def __init__(self, spreadsheet, name):
+        self.spreadsheet = spreadsheet
+        self.name = name
+
+    def get_all_values(self):
+        self.spreadsheet.http_request()
+        self.spreadsheet.count_call('values.get')
+        return copy.deepcopy(self.spreadsheet.worksheets[self.name])
+
+
+class FakeFiles():
+    """Stand-in for the Google Drive `files` resource, listing the metadata of the
+    spreadsheets of a `FakeSession` by name.
+    """
+    def __init__(self, backend, spreadsheets):
+        self.backend = backend
+        self.spreadsheets = spreadsheets
+
+    def list(self, q=None, fields=None, pageSize=100):
+        def handler():
+            name = re.search(r"name = '((?:[^'\\]|\\.)*)'", q or '').group(1).replace("\\'", "'").replace("\\\\", "\\")
+            files = [{ 'id': f'fake-{name}', 'name': name, 'modifiedTime': spreadsheet.modified_time, 'version': spreadsheet.version }
+                     for spreadsheet_name, spreadsheet in self.spreadsheets.items() if spreadsheet_name == name]
+            return { 'files': files[:pageSize] }
+        return FakeRequest(self.backend, 'files.list', handler, get_params(locals()), resource='drive')
+
+
+class FakeDriveService(FakeBackend):
+    "Stand-in for a Google Drive service built with `googleapiclient`, supporting `files().list()`"
+    def __init__(self, spreadsheets, latency=0.0):
+        super().__init__(latency)
+        self.fake_files = FakeFiles(self, spreadsheets)
+
+    def files(self):
+        return self.fake_files
+
+
+class FakeGspreadClient():
+    def __init__(self, spreadsheets):
+        self.spreadsheets = spreadsheets
+
+    def open(self, name):
+        return self.spreadsheets[name]
+
+
+class FakeSession():
+    """Stand-in for `session.Session`, serving `spreadsheets`, FakeSpreadsheets by file
+    name, through gspread and Google Drive, and `calendar_service` as Calendar API.
+    """
+    def __init__(self, spreadsheets, calendar_service=None, latency=0.0):
+        self.spreadsheets = spreadsheets
+        self.calendar_service = calendar_service or FakeCalendarService(latency)
+        self.drive_service = FakeDriveService(spreadsheets, latency)
+
+    def get_gspread_client(self):
+        return FakeGspreadClient(self.spreadsheets)
+
+    def build(self, service_name, version):
+        return { 'drive': self.drive_service, 'calendar': self.calendar_service }[service_name]
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import threading
+
+
+DEFAULT_JOURNAL_FILENAME = '.schedule_journal.jsonl'
+
+# Journals may be shared by tenants run concurrently
+journal_lock = threading.Lock()
+
+
+def get_operation_digest(op):
+    "Returns a digest of reconcile operation `op`, so that operations changed since confirmed are not skipped"
+    return hashlib.sha1(json.dumps(op.to_dict(), sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class Journal():
+    """Append-only journal of the Calendar operations confirmed by Google Calendar,
+    written to `journal_filename` as they are confirmed, one JSON line per operation
+    keyed by calendar, template, date and operation digest, so that a run which died
+    halfway can be resumed skipping them.
+
+    Once a run succeeds the entries of its calendar are not needed anymore and
+    `compact` drops them, removing the file when no entries are left.
+    """
+    def __init__(self, journal_filename=DEFAULT_JOURNAL_FILENAME):
+        self.journal_filename = journal_filename
+        self.confirmed = None
+
+    def read_entries(self):
+        "Returns the entries on the journal, skipping a last line left half written"
+        entries = []
+        try:
+            with open(self.journal_filename) as journal_file:
+                for line in journal_file:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def get_key(self, calendar_id, op):
+        return (calendar_id, op.template_name, op.event_date.isoformat(), get_operation_digest(op))
+
+    def is_confirmed(self, calendar_id, op):
+        with journal_lock:
+            if self.confirmed is None:
+                self.confirmed = set((entry['calendar'], entry['template'], entry['date'], entry['op']) for entry in self.read_entries())
+        return self.get_key(calendar_id, op) in self.confirmed
+
+    def record(self, calendar_id, op):
+        "Appends confirmed operation `op` on `calendar_id` to the journal"
+        calendar, template, event_date, digest = self.get_key(calendar_id, op)
+        line = json.dumps({ 'calendar': calendar, 'template': template, 'date': event_date, 'kind': op.kind, 'op': digest })
+        with journal_lock:
+            with open(self.journal_filename, 'a') as journal_file:
+                journal_file.write(line + "\n")
+            if self.confirmed is not None:
+                self.confirmed.add((calendar, template, event_date, digest))
+
+    def compact(self, calendar_id):
+        "Drops the entries of `calendar_id`, once its run succeeded"
+        with journal_lock:
+            entries = [entry for entry in self.read_entries() if entry['calendar'] != calendar_id]
+            if not entries:
+                if os.path.exists(self.journal_filename):
+                    os.remove(self.journal_filename)
+            else:
+                with open(self.journal_filename + '.tmp', 'w') as journal_file:
+                    journal_file.writelines(json.dumps(entry) + "\n" for entry in entries)
+                os.replace(self.journal_filename + '.tmp', self.journal_filename)
+            self.confirmed = None
@@ -0,0 +1,101 @@
+import sys
+
+
+class MonthData():
+    """Distribution of days of a month, as read from a worksheet, in a compact form.
+
+    `datetypes` holds the datetype code of every day, indexed by day number (None for
+    days not on the worksheet), with codes interned so that every month shares the
+    same strings. `weeks` holds (week_number, days) pairs and `caregivers` (code, days)
+    pairs. Instances are immutable.
+
+    The dictionary returned by `read_month` is still available, item by item, for
+    code using it: `month_data['days']`, `month_data.get('year')`...
+    """
+    __slots__ = ('year', 'month', 'datetypes', 'weeks', 'caregivers')
+
+    def __init__(self, year, month, datetypes, weeks=(), caregivers=()):
+        set_attribute = super().__setattr__
+        set_attribute('year', int(year))
+        set_attribute('month', int(month))
+        set_attribute('datetypes', tuple(None if code is None else sys.intern(code) for code in datetypes))
+        set_attribute('weeks', tuple((week_number, tuple(days)) for week_number, days in weeks))
+        set_attribute('caregivers', tuple((sys.intern(code), days) for code, days in caregivers))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, MonthData):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return f"MonthData(year={self.year}, month={self.month}, days={len(list(self.iter_days()))})"
+
+    @classmethod
+    def from_days(cls, year, month, days, weeks=(), caregivers=()):
+        "Returns month data for `days`, a list of (day number, datetype) pairs"
+        datetypes = [None] * (max((day for day, datetype in days), default=0) + 1)
+        for day, datetype in days:
+            datetypes[day] = datetype
+        return cls(year, month, datetypes, weeks, caregivers)
+
+    @classmethod
+    def from_dict(cls, month_dict):
+        "Returns month data for a dictionary as returned by `read_month`"
+        days = [(int(day), datetype) for day, datetype in month_dict['days'].items()]
+        weeks = [(week.get('week_number'), [int(day) for day in week if day != 'week_number']) for week in month_dict.get('weeks', [])]
+        return cls.from_days(month_dict['year'], month_dict['month'], days, weeks, month_dict.get('caregivers', {}).items())
+
+    def iter_days(self):
+        "Yields (day number, datetype) for every day on the worksheet, in order"
+        return ((day, datetype) for day, datetype in enumerate(self.datetypes) if datetype is not None)
+
+    def get_datetype(self, day):
+        "Returns the datetype of day number `day`, None if it is not on the worksheet"
+        return self.datetypes[day] if 0 <= day < len(self.datetypes) else None
+
+    def count_days(self, datetype):
+        "Returns the number of days of `datetype` on the month"
+        return dict(self.caregivers).get(datetype, 0)
+
+    def to_dict(self):
+        "Returns the month as the dictionary returned by `read_month`"
+        return { key: self[key] for key in self.keys() }
+
+    # Read only dictionary access, as returned by `read_month`
+
+    def keys(self):
+        return ['month', 'year', 'weeks', 'days', 'caregivers']
+
+    def __getitem__(self, key):
+        if key == 'month':
+            return self.month
+        if key == 'year':
+            return self.year
+        if key == 'days':
+            return { str(day): datetype for day, datetype in self.iter_days() }
+        if key == 'weeks':
+            return [dict({ 'week_number': week_number }, **{ str(day): self.datetypes[day] for day in days })
+                    for week_number, days in self.weeks]
+        if key == 'caregivers':
+            return dict(self.caregivers)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def get_month_data(month):
+    "Returns `month` as MonthData, converting it if it is a dictionary as returned by `read_month`"
+    return month if isinstance(month, MonthData) else MonthData.from_dict(month)
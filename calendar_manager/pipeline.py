@@ -0,0 +1,160 @@
+import asyncio
+import calendar
+import contextvars
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from calendar_manager.batch_writer import BatchSummary
+from calendar_manager.reconcile import ReconcilePlan
+from calendar_manager.read_gspread import get_month_number, get_year
+from calendar_manager.event_scheduler import get_today
+from calendar_manager import profiler
+
+
+# Operations planned ahead of the writers, so that planning does not run far ahead of them
+DEFAULT_QUEUE_SIZE = 100
+
+
+def get_months_range(calendar_school_period, month_names):
+    """Returns the first and last days of `month_names` on `calendar_school_period`
+    from today on, known before the spreadsheet is read, or None if they are past.
+    """
+    months = [(int(get_year(calendar_school_period, month_name)), get_month_number(month_name)) for month_name in month_names]
+    first_day = max(date(*min(months), 1), get_today())
+    last_year, last_month = max(months)
+    last_day = date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+    return (first_day, last_day) if first_day <= last_day else None
+
+
+class ThreadTransport():
+    """Runs blocking Google API client calls from asyncio code.
+
+    googleapiclient and gspread only come with blocking transports, so calls run on
+    threads and are awaited: one thread reads the spreadsheet, one reads the calendar,
+    keeping the SQLite connection of the calendar mirror on a single thread, and
+    `workers` threads write to the calendar, each with its own HTTP client. Calls see
+    the context of the caller, so that tenants still capture what they print.
+    """
+    def __init__(self, workers=1):
+        self.sheet_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sheet')
+        self.reader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='calendar-reader')
+        self.writer_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='calendar-writer')
+
+    async def call(self, executor, function, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, function, *args)
+
+    async def read_sheet(self, function, *args):
+        return await self.call(self.sheet_executor, function, *args)
+
+    async def read_calendar(self, function, *args):
+        return await self.call(self.reader_executor, function, *args)
+
+    async def write_calendar(self, function, *args):
+        return await self.call(self.writer_executor, function, *args)
+
+    def close(self):
+        for executor in (self.sheet_executor, self.reader_executor, self.writer_executor):
+            executor.shutdown(wait=True)
+
+
+async def timed(name, awaitable):
+    "Awaits `awaitable` timing it as profiler phase `name`"
+    with profiler.phase(name):
+        return await awaitable
+
+
+async def write_day_plans(scheduler, transport, recurrence=False, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+    """Plans every scheduled day with `scheduler.iter_day_plans` and streams the operations
+    of every day plan to `workers` writers through a queue of up to `queue_size` operations,
+    so that writes start as soon as the first day is planned. Failed writes are reported on
+    the summary, and operations confirmed on the journal are skipped when resuming. Returns
+    the whole plan and the summary.
+    """
+    queue = asyncio.Queue(queue_size)
+    plan = ReconcilePlan([], 0)
+    summary = BatchSummary()
+
+    async def write():
+        while True:
+            op = await queue.get()
+            if op is None:
+                return
+            description = "'{}' on {}".format(op.template_name, op.event_date)
+            try:
+                summary.add_result(op.kind, description, await transport.write_calendar(scheduler.send_operation, op))
+                scheduler.confirm_operation(op)
+            except Exception as e:
+                summary.add_failure(op.kind, description, e)
+
+    writers = [asyncio.ensure_future(write()) for i in range(workers)]
+    confirmed = 0
+    try:
+        for day_plan in scheduler.iter_day_plans(recurrence):
+            plan.operations.extend(day_plan.operations)
+            plan.unchanged += day_plan.unchanged
+            operations = scheduler.get_pending_operations(day_plan.operations)
+            confirmed += len(day_plan.operations) - len(operations)
+            for op in operations:
+                scheduler.mirror_synced = False
+                await queue.put(op)
+            # let writers pick operations up while next days are planned
+            await asyncio.sleep(0)
+        for writer in writers:
+            await queue.put(None)
+        await asyncio.gather(*writers)
+    finally:
+        for writer in writers:
+            writer.cancel()
+        if plan.operations:
+            # calendar has changed, so prefetched events are no longer reliable
+            scheduler.prefetched_range = None
+        scheduler.failed += len(summary.failures)
+
+    if confirmed:
+        print(f"Resuming, {confirmed} operations were already confirmed.")
+    return plan, summary
+
+
+async def export_events(scheduler, read_cells, parse_cells, prefetch_range, schedule=True, sweep=False, recurrence=False, workers=1,
+                        queue_size=DEFAULT_QUEUE_SIZE):
+    """Exports events with stages overlapping instead of running one after another:
+    existing events in `prefetch_range` are prefetched while `read_cells()` reads the
+    spreadsheet and `parse_cells(all_cells)` parses it into the (event_templates,
+    date_types, event_data) loaded on `scheduler`, and day plans are written as soon
+    as they are computed (see `write_day_plans`).
+
+    Returns the plan (None unless `schedule`), the write summary and the number of
+    events swept (None unless `sweep`).
+    """
+    transport = ThreadTransport(workers)
+    prefetch = None
+    try:
+        if prefetch_range is not None:
+            prefetch = asyncio.ensure_future(transport.read_calendar(scheduler.prefetch_events, *prefetch_range))
+
+        all_cells = await timed('sheet fetch', transport.read_sheet(read_cells))
+        event_templates, date_types, event_data = await timed('parse', transport.read_sheet(parse_cells, all_cells))
+        scheduler.load_data(event_templates, date_types, event_data)
+        if prefetch is not None:
+            await prefetch
+
+        plan, summary = None, None
+        if schedule:
+            plan, summary = await timed('writes', write_day_plans(scheduler, transport, recurrence, workers, queue_size))
+            plan.print_plan()
+            summary.print_summary()
+
+        swept = None
+        if sweep:
+            swept = await transport.read_calendar(scheduler.sweep_stale_events, None, None, None, workers)
+        return plan, summary, swept
+    finally:
+        if prefetch is not None and not prefetch.done():
+            prefetch.cancel()
+        transport.close()
+
+
+def run_export(scheduler, read_cells, parse_cells, prefetch_range, schedule=True, sweep=False, recurrence=False, workers=1,
+               queue_size=DEFAULT_QUEUE_SIZE):
+    "Runs `export_events` on a new event loop, see `export_events`"
+    return asyncio.run(export_events(scheduler, read_cells, parse_cells, prefetch_range, schedule, sweep, recurrence, workers, queue_size))
@@ -0,0 +1,64 @@
+import json
+from datetime import date, datetime
+from calendar_manager.reconcile import Operation, ReconcilePlan
+
+
+DEFAULT_PLAN_FILENAME = 'plan.json'
+
+# Increased whenever plan files written before can not be read anymore
+PLAN_FORMAT = 1
+
+
+class SavedPlan():
+    """A `ReconcilePlan` for calendar `calendar_id`, saved to be applied later, along
+    with what it was computed from: `sheet_hash`, the hash of the spreadsheet cells
+    read, and `calendar_version`, the version of the events on the calendar between
+    the first and last days of `calendar_range` (see `get_events_version`).
+    """
+    def __init__(self, plan, calendar_id, sheet_hash, calendar_range, calendar_version, created=None):
+        self.plan = plan
+        self.calendar_id = calendar_id
+        self.sheet_hash = sheet_hash
+        self.calendar_range = calendar_range
+        self.calendar_version = calendar_version
+        self.created = created or datetime.now().replace(microsecond=0)
+
+    def to_dict(self):
+        return {
+            'format': PLAN_FORMAT,
+            'created': self.created.isoformat(),
+            'calendar_id': self.calendar_id,
+            'sheet_hash': self.sheet_hash,
+            'calendar_range': [day.isoformat() for day in self.calendar_range] if self.calendar_range else None,
+            'calendar_version': self.calendar_version,
+            'unchanged': self.plan.unchanged,
+            'operations': [op.to_dict() for op in self.plan.operations],
+        }
+
+    @classmethod
+    def from_dict(cls, plan_dict):
+        if plan_dict.get('format') != PLAN_FORMAT:
+            raise ValueError(f"Plan format {plan_dict.get('format')} is not supported, plan it again")
+        plan = ReconcilePlan([Operation.from_dict(op_dict) for op_dict in plan_dict['operations']], plan_dict['unchanged'])
+        calendar_range = tuple(date.fromisoformat(day) for day in plan_dict['calendar_range']) if plan_dict['calendar_range'] else None
+        return cls(plan, plan_dict['calendar_id'], plan_dict['sheet_hash'], calendar_range, plan_dict['calendar_version'],
+                   datetime.fromisoformat(plan_dict['created']))
+
+
+def save_plan(plan_filename, saved_plan):
+    "Writes `saved_plan` to `plan_filename` as compact JSON, one operation per line so that it can be reviewed"
+    plan_dict = saved_plan.to_dict()
+    operations = plan_dict.pop('operations')
+    with open(plan_filename, 'w') as plan_file:
+        plan_file.write(json.dumps(plan_dict, separators=(',', ':'))[:-1] + ',"operations":[\n')
+        plan_file.write(",\n".join(json.dumps(op_dict, separators=(',', ':')) for op_dict in operations))
+        plan_file.write("\n]}\n")
+
+
+def load_plan(plan_filename):
+    "Reads the plan saved on `plan_filename`, raising ValueError if it is not a valid plan file"
+    try:
+        with open(plan_filename) as plan_file:
+            return SavedPlan.from_dict(json.load(plan_file))
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"{plan_filename} is not a valid plan file: {e}")
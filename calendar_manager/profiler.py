@@ -0,0 +1,188 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class CallRecord():
+    "A single Google API call: operation, latency in seconds, payload size in bytes, retries and HTTP status"
+    def __init__(self, operation, latency, payload_size, retries, status):
+        self.operation = operation
+        self.latency = latency
+        self.payload_size = payload_size
+        self.retries = retries
+        self.status = status
+
+
+def percentile(values, pct):
+    "Returns the `pct` percentile of `values` using the nearest rank method, None if there are no values"
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+
+class Profiler():
+    """Collects Google API calls and the time spent on every phase of a run (auth,
+    sheet fetch, parse, prefetch, writes...), and reports them. Thread safe, as
+    calendar writes may be sent from several threads.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.calls = []
+        self.phases = {}
+        self.started = clock()
+        self.lock = threading.Lock()
+
+    def record_call(self, operation, latency, payload_size=0, retries=0, status=200):
+        with self.lock:
+            self.calls.append(CallRecord(operation, latency, payload_size, retries, status))
+
+    @contextmanager
+    def phase(self, name):
+        "Times the enclosed block as phase `name`, adding up the time of phases run more than once"
+        start = self.clock()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + self.clock() - start
+
+    def get_report(self):
+        "Returns totals, per operation statistics and phase timings as a dictionary"
+        with self.lock:
+            calls = list(self.calls)
+            phases = dict(self.phases)
+
+        operations = {}
+        for operation in sorted(set(call.operation for call in calls)):
+            op_calls = [call for call in calls if call.operation == operation]
+            latencies = [call.latency for call in op_calls]
+            statuses = {}
+            for call in op_calls:
+                statuses[str(call.status)] = statuses.get(str(call.status), 0) + 1
+            operations[operation] = {
+                'calls': len(op_calls),
+                'total_latency': sum(latencies),
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies),
+                'payload_bytes': sum(call.payload_size for call in op_calls),
+                'retries': sum(call.retries for call in op_calls),
+                'statuses': statuses,
+            }
+
+        latencies = [call.latency for call in calls]
+        return {
+            'totals': {
+                'wall_time': self.clock() - self.started,
+                'calls': len(calls),
+                'api_time': sum(latencies),
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'payload_bytes': sum(call.payload_size for call in calls),
+                'retries': sum(call.retries for call in calls),
+                'errors': len([call for call in calls if not 200 <= call.status < 300]),
+            },
+            'phases': phases,
+            'operations': operations,
+        }
+
+    def format_report(self):
+        "Returns the report as text"
+        report = self.get_report()
+        totals = report['totals']
+
+        def ms(seconds):
+            return '-' if seconds is None else f"{seconds * 1000:.1f}"
+
+        lines = ["=== Profile ===", "",
+                 f"Wall time {totals['wall_time']:.3f}s, {totals['calls']} API calls taking {totals['api_time']:.3f}s "
+                 f"(p50 {ms(totals['p50'])} ms, p90 {ms(totals['p90'])} ms, p99 {ms(totals['p99'])} ms), "
+                 f"{totals['payload_bytes']} bytes, {totals['retries']} retries, {totals['errors']} errors", "",
+                 "Phases:"]
+        lines += [f" * {name:<16} {elapsed:.3f}s" for name, elapsed in report['phases'].items()]
+        lines += ["", "Operations:"]
+        lines += [" * {:<28} {:>5} calls {:>9.3f}s  p50 {:>7} ms  p90 {:>7} ms  p99 {:>7} ms  {:>9} bytes  {} retries  status {}".format(
+                    operation, stats['calls'], stats['total_latency'], ms(stats['p50']), ms(stats['p90']), ms(stats['p99']),
+                    stats['payload_bytes'], stats['retries'], stats['statuses'])
+                  for operation, stats in report['operations'].items()]
+        return "\n".join(lines)
+
+    def write_report(self, filename):
+        "Writes the report to `filename`, as JSON when it ends with .json or as text otherwise"
+        with open(filename, 'w') as report_file:
+            if filename.endswith('.json'):
+                json.dump(self.get_report(), report_file, indent=4)
+            else:
+                report_file.write(self.format_report() + "\n")
+
+
+# Profiler of the current run, None when not profiling
+active_profiler = None
+
+
+def start_profiling():
+    "Starts recording calls and phases on a new Profiler, which is returned"
+    global active_profiler
+    active_profiler = Profiler()
+    return active_profiler
+
+
+def stop_profiling():
+    global active_profiler
+    active_profiler = None
+
+
+def record_call(operation, latency, payload_size=0, retries=0, status=200):
+    "Records a Google API call on the active profiler, if any"
+    if active_profiler is not None:
+        active_profiler.record_call(operation, latency, payload_size, retries, status)
+
+
+@contextmanager
+def phase(name):
+    "Times the enclosed block as phase `name` on the active profiler, if any"
+    if active_profiler is None:
+        yield
+    else:
+        with active_profiler.phase(name):
+            yield
+
+
+def get_payload_size(*payloads):
+    "Returns the size in bytes of request bodies and responses, serializing them to JSON if needed"
+    size = 0
+    for payload in payloads:
+        if payload is None:
+            continue
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+        size += len(payload.encode('utf-8') if isinstance(payload, str) else payload)
+    return size
+
+
+def get_status(exception):
+    "Returns the HTTP status of an exception raised by a Google API client, 0 if unknown"
+    resp = getattr(exception, 'resp', None) or getattr(exception, 'response', None)
+    return int(getattr(resp, 'status', None) or getattr(resp, 'status_code', 0) or 0)
+
+
+def profile_call(operation, function, *args, **kwargs):
+    """Calls `function` recording it as Google API call `operation`, with the size
+    of its result as payload. Used for calls not going through `execute_with_backoff`.
+    """
+    if active_profiler is None:
+        return function(*args, **kwargs)
+
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except Exception as e:
+        record_call(operation, time.perf_counter() - start, status=get_status(e))
+        raise
+    record_call(operation, time.perf_counter() - start, get_payload_size(result) if isinstance(result, (list, dict)) else 0)
+    return result
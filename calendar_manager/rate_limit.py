@@ -0,0 +1,91 @@
+import time
+import random
+import threading
+from googleapiclient.errors import HttpError
+from calendar_manager import profiler
+
+
+# Google Calendar API allows 600 queries per minute per user by default,
+# which is 10 queries per second with short bursts
+DEFAULT_RATE = 10
+DEFAULT_BURST = 10
+
+# Reasons sent along 403 responses when quota is exceeded
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class TokenBucket():
+    """Thread safe token bucket limiting calls to `rate` per second, allowing
+    bursts of up to `capacity` calls.
+    """
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        "Blocks until a call is allowed"
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def is_retryable(exception):
+    "Returns True for errors due to rate limits (403 rateLimitExceeded, 429) or server errors (5xx)"
+    if not isinstance(exception, HttpError):
+        return False
+    status = exception.resp.status
+    if status == 403:
+        content = exception.content.decode('utf-8', 'replace') if isinstance(exception.content, bytes) else str(exception.content)
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return status == 429 or 500 <= status < 600
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=32.0):
+    "Returns a random delay for retry `attempt`, exponential backoff with full jitter"
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def get_operation(request):
+    "Returns the API method of a Google API `request`, such as calendar.events.insert"
+    return getattr(request, 'methodId', None) or type(request).__name__
+
+
+def execute_with_backoff(request, rate_limiter=None, http=None, max_retries=5, sleep=time.sleep):
+    """Executes a Google API `request`, waiting for `rate_limiter` before every
+    attempt, and retrying with exponential backoff on rate limit and server errors.
+
+    `http` allows passing a per thread HTTP client, as httplib2 is not thread safe.
+
+    When profiling, the call is recorded with the time spent on all its attempts.
+    """
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = request.execute(http=http) if http is not None else request.execute()
+            profiler.record_call(get_operation(request), time.perf_counter() - start,
+                                 profiler.get_payload_size(getattr(request, 'body', None), response), attempt)
+            return response
+        except HttpError as e:
+            if attempt >= max_retries or not is_retryable(e):
+                profiler.record_call(get_operation(request), time.perf_counter() - start,
+                                     profiler.get_payload_size(getattr(request, 'body', None)), attempt, e.resp.status)
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Request failed with status {e.resp.status}, retrying in {delay:.1f}s ...")
+            sleep(delay)
+            attempt += 1
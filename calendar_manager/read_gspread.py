@@ -1,8 +1,37 @@
+import os
 import json
-import gspread
+import hashlib
 import calendar
-from oauth2client.service_account import ServiceAccountCredentials
+import threading
 from calendar_manager.event_template import EventTemplate
+from calendar_manager.month_data import MonthData
+from calendar_manager import profiler
+from calendar_manager.session import get_session
+
+
+# Header cells of the event templates table
+TEMPLATE_HEADERS = ['Event templates', 'Summary', 'Description', 'Start', 'End', 'Apply to caregivers', 'Apply to weekdays']
+
+# Rows and columns of a month block: month name and weekdays, then 5 weeks of day numbers and datetypes
+MONTH_ROWS = 11
+MONTH_COLS = 8
+
+# Columns of the caregivers table: code, name and color
+CAREGIVERS_COLS = 3
+
+# Anchors files may be shared by tenants run concurrently
+anchors_lock = threading.Lock()
+
+
+def open_worksheet(credentials_filename, spreadsheet_filename, worksheet):
+    """Returns `worksheet` from spreadsheet file named `spreadsheet_filename`, using
+    credentials from local file `credentials_filename` to connect to Google APIs.
+    """
+    print(f"Authorizing access to Google Sheets with '{credentials_filename}' ...")
+    gc = get_session(credentials_filename).get_gspread_client()
+
+    spreadsheet = profiler.profile_call('sheets.open', gc.open, spreadsheet_filename)
+    return profiler.profile_call('sheets.worksheet', spreadsheet.worksheet, worksheet)
 
 
 def get_all_cells_from_spreadsheet(credentials_filename, spreadsheet_filename, worksheet):
@@ -12,18 +41,146 @@ def get_all_cells_from_spreadsheet(credentials_filename, spreadsheet_filename, w
 
     Opens `worksheet` from spreadsheet file named `spreadsheet_filename`.
     """
-    scope = ['https://spreadsheets.google.com/feeds',
-             'https://www.googleapis.com/auth/drive']
+    sheet = open_worksheet(credentials_filename, spreadsheet_filename, worksheet)
 
-    print(f"Authorizing access to Google Sheets with '{credentials_filename}' ...")
-    creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_filename, scope)
+    print(f"Getting all values from '{spreadsheet_filename}:{worksheet}' ...")
+    return profiler.profile_call('sheets.values.get', sheet.get_all_values)
 
-    gc = gspread.authorize(creds)
 
-    sheet = gc.open(spreadsheet_filename).worksheet(worksheet)
+def locate_anchors(all_cells, month_names):
+    """Returns the (row, col) position of the anchor cells needed to read `month_names`,
+    the event templates and the caregivers: month names and table headers.
+    Months not found on the worksheet get None as position.
+    """
+    sheet = get_sheet_index(all_cells)
+    anchors = {month_name: sheet.positions.get(month_name) for month_name in month_names}
+    anchors.update({keyword: sheet.find(keyword) for keyword in TEMPLATE_HEADERS + ['Caregivers']})
+    return anchors
 
-    print(f"Getting all values from '{spreadsheet_filename}:{worksheet}' ...")
-    return sheet.get_all_values()
+
+def get_anchor_ranges(anchors, month_names):
+    """Returns the A1 notation ranges of the month blocks for `month_names`, the event
+    templates table and the caregivers table. Tables are open ended, as their length
+    is only known once read.
+    """
+    from gspread.utils import rowcol_to_a1
+
+    def column(col_idx):
+        return rowcol_to_a1(1, col_idx + 1)[:-1]
+
+    def block(row_idx, col_idx, rows, cols):
+        return "{}:{}".format(rowcol_to_a1(row_idx + 1, col_idx + 1), rowcol_to_a1(row_idx + rows, col_idx + cols))
+
+    ranges = [block(*anchors[month_name], MONTH_ROWS, MONTH_COLS) for month_name in month_names if anchors[month_name]]
+
+    tmpl_row = anchors['Event templates'][0]
+    tmpl_cols = [anchors[header][1] for header in TEMPLATE_HEADERS]
+    ranges.append("{}:{}".format(rowcol_to_a1(tmpl_row + 1, min(tmpl_cols) + 1), column(max(tmpl_cols))))
+
+    cg_row, cg_col = anchors['Caregivers']
+    ranges.append("{}:{}".format(rowcol_to_a1(cg_row + 1, cg_col + 1), column(cg_col + CAREGIVERS_COLS - 1)))
+
+    return ranges
+
+
+def get_cell(all_cells, row_idx, col_idx):
+    "Returns the value of cell (row, col), empty if it is out of the cells read"
+    if row_idx < len(all_cells) and col_idx < len(all_cells[row_idx]):
+        return all_cells[row_idx][col_idx]
+    return ''
+
+
+def place_ranges(ranges, value_ranges):
+    """Returns a list of rows with the values read for every A1 notation range in
+    `ranges` placed at their position on the worksheet, and empty values elsewhere.
+
+    Google Sheets leaves out trailing empty cells and rows of every range, so ranges
+    are padded to their full size, and rows to the same length, as returned by
+    `get_all_values`.
+    """
+    from gspread.utils import a1_to_rowcol
+
+    all_cells = []
+
+    for a1_range, value_range in zip(ranges, value_ranges):
+        start, end = a1_range.split(':')
+        start_row, start_col = a1_to_rowcol(start)
+        values = value_range.get('values', [])
+        if any(c.isdigit() for c in end):
+            end_row, end_col = a1_to_rowcol(end)
+        else:
+            # open ended ranges end with the last row read
+            end_row, end_col = start_row - 1 + len(values), a1_to_rowcol(end + '1')[1]
+
+        while len(all_cells) < end_row:
+            all_cells.append([])
+        for row_offset in range(end_row - start_row + 1):
+            row = all_cells[start_row - 1 + row_offset]
+            row_values = values[row_offset] if row_offset < len(values) else []
+            if len(row) < end_col:
+                row.extend([''] * (end_col - len(row)))
+            row[start_col - 1:start_col - 1 + len(row_values)] = row_values
+
+    width = max((len(row) for row in all_cells), default=0)
+    for row in all_cells:
+        row.extend([''] * (width - len(row)))
+    return all_cells
+
+
+def get_cells_from_ranges(credentials_filename, spreadsheet_filename, worksheet, month_names, anchors=None):
+    """Returns the cells needed to read `month_names`, the event templates and the
+    caregivers from a Google spreadsheet worksheet, along with the anchors used.
+
+    Only the blocks around the `anchors` cells, as returned by `locate_anchors`, are
+    fetched with a single batch request. Cells are returned at their position on the
+    worksheet, with empty values elsewhere, so they can be parsed as usual.
+
+    Anchors are located reading all values from the worksheet when not given, when
+    they are not found at their position anymore, or when a previous run did not find
+    them, as months may have been added to the worksheet since.
+    """
+    sheet = open_worksheet(credentials_filename, spreadsheet_filename, worksheet)
+    keywords = list(month_names) + TEMPLATE_HEADERS + ['Caregivers']
+
+    if anchors is not None and all(anchors.get(keyword) is not None for keyword in keywords):
+        ranges = get_anchor_ranges(anchors, month_names)
+        print(f"Getting {len(ranges)} ranges from '{spreadsheet_filename}:{worksheet}' ...")
+        value_ranges = profiler.profile_call('sheets.values.batchGet', sheet.spreadsheet.values_batch_get,
+                                             [f"'{worksheet}'!{r}" for r in ranges]).get('valueRanges', [])
+
+        all_cells = place_ranges(ranges, value_ranges)
+        if all(get_cell(all_cells, *anchors[keyword]) == keyword for keyword in keywords):
+            return all_cells, anchors
+        print("Anchor cells have moved on the worksheet.")
+
+    print(f"Getting all values from '{spreadsheet_filename}:{worksheet}' to locate anchor cells ...")
+    all_cells = profiler.profile_call('sheets.values.get', sheet.get_all_values)
+    return all_cells, locate_anchors(all_cells, month_names)
+
+
+def load_anchors(anchors_filename, spreadsheet_filename, worksheet):
+    "Returns anchors saved for `worksheet` on local file `anchors_filename`, None if there are none"
+    try:
+        with anchors_lock, open(anchors_filename) as anchors_file:
+            saved = json.load(anchors_file).get(f"{spreadsheet_filename}:{worksheet}")
+    except (OSError, ValueError):
+        return None
+    return {keyword: tuple(position) if position else None for keyword, position in saved.items()} if saved else None
+
+
+def save_anchors(anchors_filename, spreadsheet_filename, worksheet, anchors):
+    "Saves anchors for `worksheet` on local file `anchors_filename`, keeping those of other worksheets"
+    with anchors_lock:
+        try:
+            with open(anchors_filename) as anchors_file:
+                saved = json.load(anchors_file)
+        except (OSError, ValueError):
+            saved = {}
+        saved[f"{spreadsheet_filename}:{worksheet}"] = anchors
+        # replaced at once, so that the file is never read half written
+        with open(anchors_filename + '.tmp', 'w') as anchors_file:
+            json.dump(saved, anchors_file, indent=4)
+        os.replace(anchors_filename + '.tmp', anchors_filename)
 
 
 def get_month_number(month_name):
@@ -34,6 +191,23 @@ def get_month_number(month_name):
     return 0
 
 
+def get_school_year_months(from_month=None, to_month=None):
+    """Returns the names of the months of a school period, from July to June, or
+    only those between `from_month` and `to_month` (both included) when given.
+    """
+    months = [calendar.month_name[i] for i in list(range(7, 13)) + list(range(1, 7))]
+
+    for month_name in (from_month, to_month):
+        if month_name is not None and month_name not in months:
+            raise ValueError(f"Unknown month '{month_name}'")
+
+    first = months.index(from_month) if from_month else 0
+    last = months.index(to_month) if to_month else len(months) - 1
+    if first > last:
+        raise ValueError(f"Month '{from_month}' comes after '{to_month}' on the school period")
+    return months[first:last + 1]
+
+
 def get_year(calendar_school_period, month_name):
     """Returns the year of the month according to a custom school period, where
     days from July and August are distributed at the beginning of the school
@@ -44,13 +218,42 @@ def get_year(calendar_school_period, month_name):
     return first_year if month_name in ['July','August','September','October','December','November'] else second_year
 
 
+class SheetIndex():
+    """Index of the cells read on a worksheet, built in a single pass over `all_cells`,
+    mapping every cell value to the (row, col) position of its first ocurrence.
+
+    Parsers accept a SheetIndex instead of `all_cells`, so that the sheet is only
+    scanned once however many cells are looked for.
+    """
+    def __init__(self, all_cells):
+        self.all_cells = all_cells
+        self.positions = {}
+
+        for row_idx, row in enumerate(all_cells):
+            for col_idx, value in enumerate(row):
+                self.positions.setdefault(value, (row_idx, col_idx))
+
+    def find(self, keyword):
+        try:
+            return self.positions[keyword]
+        except KeyError:
+            raise ValueError(f"Cell with value '{keyword}' not found on sheet")
+
+
+def get_sheet_index(all_cells):
+    "Returns `all_cells` as a SheetIndex, building it if needed"
+    return all_cells if isinstance(all_cells, SheetIndex) else SheetIndex(all_cells)
+
+
 def find_cell(all_cells, keyword):
     """Returns the (row, col) position of a cell which value matches keyword
     or raises ValueError
     """
-    for row in all_cells:
+    if isinstance(all_cells, SheetIndex):
+        return all_cells.find(keyword)
+
+    for row_idx, row in enumerate(all_cells):
         if keyword in row:
-            row_idx = all_cells.index(row)
             col_idx = row.index(keyword)
             #print(f"DEBUG Found {keyword} at row={row_idx}, column={col_idx}")
             return (row_idx, col_idx)
@@ -62,11 +265,12 @@ def get_table(all_cells, keyword, x_size, y_size):
     """Returns a (x_size * y_size) table starting from cell(x, y)
     """
     table = []
+    sheet = get_sheet_index(all_cells)
 
     # y = row_idx, x = col_idx 
-    y, x = find_cell(all_cells, keyword)
+    y, x = sheet.find(keyword)
 
-    for row in all_cells[y:y+y_size]:
+    for row in sheet.all_cells[y:y+y_size]:
         print(row)
         row_filtered = [c for c in row[x:x+x_size]]
         print(row_filtered)
@@ -80,56 +284,80 @@ def read_month(all_cells, calendar_school_period, month_name):
     """Reads info for a particular month from cells read on a worksheet and returns a
     dictionary with the distribution of days.
     """
+    return read_month_data(all_cells, calendar_school_period, month_name).to_dict()
+
+
+def read_month_data(all_cells, calendar_school_period, month_name):
+    """Reads info for a particular month from cells read on a worksheet and returns
+    the distribution of days as `MonthData`.
+    """
     month_number = get_month_number(month_name)
     year = int(get_year(calendar_school_period, month_name))
+    sheet = get_sheet_index(all_cells)
+    all_cells = sheet.all_cells
 
     # Informative
     #print("Getting {} custody days from spreadsheet ...".format(month_name))
     #print(calendar.month(year, month_number))
 
-    # Initiliaze data structure
-    month_dict = { 'month': month_number, 'year': year, 'weeks': [], 'days': {}, 'caregivers': {} }
-    month_row, month_col = find_cell(all_cells, month_name)
+    days = {}
+    weeks = []
+    month_row, month_col = sheet.find(month_name)
 
     for week_idx in range(0,5):
         week_row = month_row + week_idx*2 + 1
         week_number = all_cells[week_row][month_col]
-        week_dict = { 'week_number': week_number }
+        week_days = []
         for day_idx in range(1,8):
             day_number = all_cells[week_row][month_col + day_idx]
             if day_number != '' and day_number != ' ':
-                if day_number in month_dict['days']:
+                if int(day_number) in days:
                     raise ValueError(f"Day number {day_number} already defined.")
-                day_caregiver = all_cells[week_row + 1][month_col + day_idx]
-                week_dict[day_number] = day_caregiver
-                month_dict['days'][day_number] = day_caregiver
-        month_dict['weeks'].append(week_dict)
-
+                days[int(day_number)] = all_cells[week_row + 1][month_col + day_idx]
+                week_days.append(int(day_number))
+        weeks.append((week_number, week_days))
 
-    for caregiver in get_caregivers(all_cells).keys():
-        month_dict['caregivers'][caregiver] = 0
+    caregivers = { caregiver: 0 for caregiver in get_caregivers(sheet).keys() }
 
-    for day, caregiver in month_dict['days'].items():
-        if caregiver in month_dict['caregivers'].keys():
-            month_dict['caregivers'][caregiver] += 1
+    for day, caregiver in days.items():
+        if caregiver in caregivers:
+            caregivers[caregiver] += 1
         else:
             raise ValueError(f"Caregiver {caregiver} not declared.")
 
-    return month_dict
+    return MonthData.from_days(year, month_number, days.items(), weeks, caregivers.items())
+
+
+def read_months(all_cells, calendar_school_period, month_names, skip_missing=False):
+    """Reads info for several months from cells read on a worksheet, returning a list
+    with the `MonthData` of every month, as `read_month_data` does. The worksheet is
+    indexed once for all months.
+
+    With `skip_missing`, months not found on the worksheet are skipped instead of
+    raising ValueError.
+    """
+    sheet = get_sheet_index(all_cells)
+
+    if skip_missing:
+        month_names = [month_name for month_name in month_names if month_name in sheet.positions]
+
+    return [read_month_data(sheet, calendar_school_period, month_name) for month_name in month_names]
 
 
 def get_event_templates(all_cells):
     """Reads event configuration from worksheet `all_cells` and returns a list with event types.
     """
-    key_row, key_col = find_cell(all_cells, 'Event templates')
+    sheet = get_sheet_index(all_cells)
+    all_cells = sheet.all_cells
+    key_row, key_col = sheet.find('Event templates')
     events_list = []
 
-    dummy, name_col = find_cell(all_cells, 'Summary')
-    dummy, desc_col = find_cell(all_cells, 'Description')
-    dummy, start_col = find_cell(all_cells, 'Start')
-    dummy, end_col = find_cell(all_cells, 'End')
-    dummy, caregivers_col = find_cell(all_cells, 'Apply to caregivers')
-    dummy, weekdays_col = find_cell(all_cells, 'Apply to weekdays')
+    dummy, name_col = sheet.find('Summary')
+    dummy, desc_col = sheet.find('Description')
+    dummy, start_col = sheet.find('Start')
+    dummy, end_col = sheet.find('End')
+    dummy, caregivers_col = sheet.find('Apply to caregivers')
+    dummy, weekdays_col = sheet.find('Apply to weekdays')
 
     print("Looking for event templates on spreadsheet ...")
     for row in all_cells[key_row+1:]:
@@ -156,13 +384,55 @@ def get_event_templates(all_cells):
 def get_caregivers(all_cells):
     """Reads caregiver codes and names to use for custody days and events.
     """
-    row_cg, col_cg = find_cell(all_cells, 'Caregivers')
+    sheet = get_sheet_index(all_cells)
+    row_cg, col_cg = sheet.find('Caregivers')
     caregivers_dict = {}
 
-    for row in all_cells[row_cg+1:]:
+    for row in sheet.all_cells[row_cg+1:]:
         next_caregiver_code = row[col_cg]
         if next_caregiver_code == "":
             break
         caregivers_dict[next_caregiver_code] = { "name": row[col_cg + 1], "color": row[col_cg + 2]}
 
-    return caregivers_dict
\ No newline at end of file
+    return caregivers_dict
+
+
+def get_block(all_cells, row_idx, col_idx, rows, cols):
+    "Returns the values of the (rows * cols) block of cells starting at cell (row, col)"
+    return [[get_cell(all_cells, r, c) for c in range(col_idx, col_idx + cols)] for r in range(row_idx, row_idx + rows)]
+
+
+def get_table_rows(sheet, keyword, col_idx, cols):
+    "Returns the rows of the table with header `keyword`, from column `col_idx`, up to the first row without key"
+    row_idx, key_col = sheet.find(keyword)
+    rows = []
+    for r in range(row_idx + 1, len(sheet.all_cells)):
+        if get_cell(sheet.all_cells, r, key_col) == "":
+            break
+        rows.append(get_block(sheet.all_cells, r, col_idx, 1, cols)[0])
+    return rows
+
+
+def hash_cells(cells):
+    return hashlib.sha1(json.dumps(cells).encode('utf-8')).hexdigest()
+
+
+def get_block_hashes(all_cells, month_names):
+    """Returns a hash of the cells of every month block in `month_names`, None for months
+    not found on the worksheet, and of the event templates and caregivers tables, which
+    apply to every month, under 'tables'. Comparing hashes tells which months changed
+    without parsing them.
+    """
+    sheet = get_sheet_index(all_cells)
+    hashes = {}
+    for month_name in month_names:
+        position = sheet.positions.get(month_name)
+        hashes[month_name] = hash_cells(get_block(sheet.all_cells, *position, MONTH_ROWS, MONTH_COLS)) if position else None
+
+    tmpl_cols = [sheet.find(header)[1] for header in TEMPLATE_HEADERS]
+    cg_col = sheet.find('Caregivers')[1]
+    hashes['tables'] = hash_cells([
+        get_table_rows(sheet, 'Event templates', min(tmpl_cols), max(tmpl_cols) - min(tmpl_cols) + 1),
+        get_table_rows(sheet, 'Caregivers', cg_col, CAREGIVERS_COLS),
+    ])
+    return hashes
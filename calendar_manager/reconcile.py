@@ -0,0 +1,134 @@
+from datetime import date
+
+
+class Operation():
+    """A single change to apply on Google Calendar for event template `template_name`
+    on `event_date`: insert a new event, patch the fields in `body` of event `event_id`
+    or delete event `event_id`.
+    """
+    INSERT = 'insert'
+    PATCH = 'patch'
+    DELETE = 'delete'
+
+    def __init__(self, kind, template_name, event_date, event_id=None, body=None):
+        self.kind = kind
+        self.template_name = template_name
+        self.event_date = event_date
+        self.event_id = event_id
+        self.body = body
+
+    def to_dict(self):
+        "Returns the operation as a dictionary which can be serialized to JSON, without empty fields"
+        op_dict = { 'kind': self.kind, 'template': self.template_name, 'date': self.event_date.isoformat() }
+        if self.event_id:
+            op_dict['id'] = self.event_id
+        if self.body:
+            op_dict['body'] = self.body
+        return op_dict
+
+    @classmethod
+    def from_dict(cls, op_dict):
+        return cls(op_dict['kind'], op_dict['template'], date.fromisoformat(op_dict['date']), op_dict.get('id'), op_dict.get('body'))
+
+    def __str__(self):
+        changes = ", ".join(sorted(self.body.keys())) if self.kind == Operation.PATCH else ""
+        return "{} '{}' on {}{}{}".format(
+            self.kind,
+            self.template_name,
+            self.event_date,
+            f" (id {self.event_id})" if self.event_id else "",
+            f": {changes}" if changes else "",
+        )
+
+
+class ReconcilePlan():
+    """Minimal list of operations needed to turn the events found on a calendar
+    into the desired ones. Events which already match are only counted as `unchanged`.
+    """
+    def __init__(self, operations, unchanged):
+        self.operations = operations
+        self.unchanged = unchanged
+
+    def count(self, kind):
+        return len([op for op in self.operations if op.kind == kind])
+
+    def is_empty(self):
+        return not self.operations
+
+    def print_plan(self):
+        print(f"\nPlan: {self.count(Operation.INSERT)} to insert, {self.count(Operation.PATCH)} to patch, "
+              f"{self.count(Operation.DELETE)} to delete, {self.unchanged} unchanged.\n")
+        for op in self.operations:
+            print(f" * {op}")
+
+
+def same_time(desired, existing):
+    """Compares event start or end times. Google Calendar returns date times with
+    the UTC offset of the time zone (2020-04-21T17:00:00+02:00) while we send local
+    times (2020-04-21T17:00:00), so only the local part is compared.
+    """
+    if 'date' in desired:
+        return desired['date'] == existing.get('date')
+    if 'dateTime' not in existing:
+        return False
+    if existing.get('timeZone') and existing['timeZone'] != desired.get('timeZone'):
+        return False
+    return desired['dateTime'][:19] == existing['dateTime'][:19]
+
+
+def diff_event(desired, existing):
+    """Returns a dictionary with the managed fields of `desired` event body
+    which differ from `existing` event, empty if both events match.
+    """
+    changes = {}
+
+    for field in ('summary', 'description', 'colorId'):
+        # Google Calendar omits empty fields on responses
+        if (desired.get(field) or '') != (existing.get(field) or ''):
+            changes[field] = desired.get(field)
+
+    if not same_time(desired['start'], existing.get('start', {})) or not same_time(desired['end'], existing.get('end', {})):
+        # start and end always go together so that they are never inconsistent
+        changes['start'] = desired['start']
+        changes['end'] = desired['end']
+
+    return changes
+
+
+def reconcile(desired_events, existing_events, cancelled_ids=()):
+    """Compares `desired_events` with `existing_events`, both dictionaries of event
+    bodies indexed by (template_name, date), and returns a `ReconcilePlan` with the
+    inserts, patches and deletes needed. Nothing is planned for matching events.
+
+    Desired events with an `id` are expected to keep it: existing events with a
+    different id (created before ids were deterministic) are deleted and inserted
+    again with the expected id. Ids in `cancelled_ids` belong to deleted events,
+    which Google Calendar keeps, so those events are restored with a patch instead
+    of inserted again.
+    """
+    operations = []
+    unchanged = 0
+
+    for key in sorted(set(desired_events) | set(existing_events), key=lambda k: (k[1], k[0])):
+        template_name, event_date = key
+        desired = desired_events.get(key)
+        existing = existing_events.get(key)
+
+        if existing is None and desired.get('id') in cancelled_ids:
+            operations.append(Operation(Operation.PATCH, template_name, event_date, event_id=desired['id'],
+                                        body=dict(desired, status='confirmed')))
+        elif existing is None:
+            operations.append(Operation(Operation.INSERT, template_name, event_date, body=desired))
+        elif desired is None:
+            operations.append(Operation(Operation.DELETE, template_name, event_date, event_id=existing['id']))
+        elif desired.get('id') and desired['id'] != existing['id']:
+            operations.append(Operation(Operation.DELETE, template_name, event_date, event_id=existing['id']))
+            operations.append(Operation(Operation.INSERT, template_name, event_date, body=desired))
+        else:
+            changes = diff_event(desired, existing)
+            if changes:
+                operations.append(Operation(Operation.PATCH, template_name, event_date, event_id=existing['id'], body=changes))
+            else:
+                unchanged += 1
+
+    return ReconcilePlan(operations, unchanged)
@@ -0,0 +1,186 @@
+from datetime import date, timedelta
+from calendar_manager.reconcile import Operation, diff_event
+from calendar_manager.event_ids import make_event_id
+
+
+BYDAY = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+# Templates with fewer occurrences are kept as single events
+MIN_OCCURRENCES = 3
+
+
+class Series():
+    """Occurrences of template `template_name` written as a single recurring event
+    with id `series_id`. `events` holds the body of every occurrence by date.
+    """
+    def __init__(self, template_name, series_id, events):
+        self.template_name = template_name
+        self.series_id = series_id
+        self.events = events
+        self.dates = sorted(events.keys())
+        self.kept_dates = []
+        self.body = build_series_body(series_id, events)
+
+    def keep_dates(self, dates):
+        """Adds occurrences on `dates`, those of the recurring event already on the
+        calendar out of the scheduled range, so that writing the series does not
+        drop them.
+        """
+        self.kept_dates = sorted(set(dates) - set(self.events))
+        events = dict(self.events)
+        events.update((event_date, move_event(self.events[self.dates[0]], event_date)) for event_date in self.kept_dates)
+        self.body = build_series_body(self.series_id, events)
+
+    def matches(self, instances):
+        "Returns True when `instances` of the series, indexed by date, are the desired occurrences"
+        return set(instances) == set(self.dates) and not any(diff_event(self.events[d], instances[d]) for d in self.dates)
+
+    def __str__(self):
+        return "{}: {} occurrences from {} to {}, recurrence={}".format(
+            self.template_name, len(self.dates), self.dates[0], self.dates[-1], self.body['recurrence'])
+
+
+def build_series_body(series_id, events):
+    """Returns the body of a recurring event with the occurrences in `events`: the
+    body of the first occurrence with a weekly RRULE on the weekdays of the occurrences,
+    and an EXDATE for every matching weekday without occurrence.
+
+    COUNT is used instead of UNTIL, which would need to be converted to UTC.
+    """
+    dates = sorted(events.keys())
+    first_event = events[dates[0]]
+    weekdays = sorted(set(d.weekday() for d in dates))
+
+    expected = [dates[0] + timedelta(days=i) for i in range((dates[-1] - dates[0]).days + 1)]
+    expected = [d for d in expected if d.weekday() in weekdays]
+    exdates = [d for d in expected if d not in events]
+
+    recurrence = ["RRULE:FREQ=WEEKLY;BYDAY={};COUNT={}".format(",".join(BYDAY[wk] for wk in weekdays), len(expected))]
+    if exdates:
+        if 'date' in first_event['start']:
+            recurrence.append("EXDATE;VALUE=DATE:" + ",".join(d.strftime('%Y%m%d') for d in exdates))
+        else:
+            start_time = first_event['start']['dateTime'][11:19].replace(':', '')
+            recurrence.append("EXDATE;TZID={}:".format(first_event['start']['timeZone'])
+                              + ",".join(d.strftime('%Y%m%d') + 'T' + start_time for d in exdates))
+
+    return dict(first_event, id=series_id, recurrence=recurrence)
+
+
+def move_event(event_body, event_date):
+    "Returns a copy of `event_body` taking place on `event_date`, at the same time"
+    days = timedelta(days=(event_date - get_start_date(event_body)).days)
+    moved = dict(event_body)
+    for field in ('start', 'end'):
+        if 'date' in event_body[field]:
+            moved[field] = dict(event_body[field], date=(date.fromisoformat(event_body[field]['date']) + days).isoformat())
+        else:
+            moved[field] = dict(event_body[field], dateTime=(date.fromisoformat(event_body[field]['dateTime'][:10]) + days).isoformat()
+                                                            + event_body[field]['dateTime'][10:])
+    return moved
+
+
+def get_start_date(event):
+    start = event['start']
+    return date.fromisoformat(start['date'] if 'date' in start else start['dateTime'][:10])
+
+
+def get_series_dates(series_event):
+    """Returns the dates of the occurrences of recurring event `series_event`, as
+    written by `build_series_body`: a weekly RRULE with COUNT and EXDATEs.
+    """
+    rule = {}
+    exdates = set()
+    for line in series_event.get('recurrence', []):
+        if line.startswith('RRULE:'):
+            rule = dict(part.split('=', 1) for part in line[len('RRULE:'):].split(';'))
+        elif line.startswith('EXDATE'):
+            exdates.update(value[:8] for value in line.split(':', 1)[1].split(','))
+
+    weekdays = set(BYDAY.index(day) for day in rule.get('BYDAY', '').split(',') if day in BYDAY)
+    count = int(rule.get('COUNT', 0))
+    dates = []
+    current = get_start_date(series_event)
+    while count > 0 and weekdays:
+        if current.weekday() in weekdays:
+            count -= 1
+            if current.strftime('%Y%m%d') not in exdates:
+                dates.append(current)
+        current += timedelta(days=1)
+    return dates
+
+
+def get_school_period_start(months):
+    "Returns July 1st of the school period of the first of `months`, as school periods go from July to June"
+    return min(date(month_data.year if month_data.month >= 7 else month_data.year - 1, 7, 1) for month_data in months)
+
+
+def compress_events(desired_events, calendar_id, period_start, min_occurrences=MIN_OCCURRENCES):
+    """Groups `desired_events`, indexed by (template_name, date), into recurring series
+    of events sharing template and color. Returns the list of `Series` and the desired
+    events left as single events, because they have less than `min_occurrences`.
+
+    Series ids derive from calendar, template, color and `period_start`, the first
+    day of the school period, so they do not change from one run to the next, even
+    for runs scheduling different months.
+    """
+    groups = {}
+    for (template_name, event_date), body in desired_events.items():
+        groups.setdefault((template_name, body.get('colorId')), {})[event_date] = body
+
+    series_list = []
+    singles = {}
+    for (template_name, color), events in sorted(groups.items(), key=lambda g: (g[0][0], g[0][1] or '')):
+        if len(events) < min_occurrences:
+            singles.update(((template_name, event_date), body) for event_date, body in events.items())
+            continue
+        series_id = make_event_id(calendar_id, f"{template_name}@{color}", period_start)
+        series_list.append(Series(template_name, series_id, events))
+
+    return series_list, singles
+
+
+def group_instances(existing_instances):
+    "Returns `existing_instances`, indexed by (template_name, date), by recurring event id and date"
+    instances_by_series = {}
+    for (template_name, event_date), event in existing_instances.items():
+        instances_by_series.setdefault(event['recurringEventId'], {})[event_date] = event
+    return instances_by_series
+
+
+def reconcile_series(series_list, existing_instances, cancelled_ids=(), existing_series_ids=()):
+    """Compares desired `series_list` with `existing_instances`, instances of recurring
+    events indexed by (template_name, date), and returns the operations needed along
+    with the number of series left unchanged.
+
+    A series whose instances all match is left alone, otherwise its recurring event is
+    patched as a whole, when it has instances or its id is in `existing_series_ids`,
+    or inserted. Instances of recurring events not desired anymore are deleted one by
+    one, as deleting their recurring event would also delete the instances out of the
+    scheduled range.
+    """
+    operations = []
+    unchanged = 0
+    instances_by_series = group_instances(existing_instances)
+
+    for series in series_list:
+        series_id = series.body['id']
+        instances = instances_by_series.get(series_id, {})
+
+        if series.matches(instances):
+            unchanged += 1
+        elif instances or series_id in cancelled_ids or series_id in existing_series_ids:
+            operations.append(Operation(Operation.PATCH, series.template_name, series.dates[0], event_id=series_id,
+                                        body=dict(series.body, status='confirmed')))
+        else:
+            operations.append(Operation(Operation.INSERT, series.template_name, series.dates[0], body=series.body))
+
+    desired_ids = set(series.body['id'] for series in series_list)
+    for series_id, instances in instances_by_series.items():
+        if series_id in desired_ids:
+            continue
+        for event_date, event in sorted(instances.items()):
+            template_name = event['extendedProperties']['private']['template_name']
+            operations.append(Operation(Operation.DELETE, template_name, event_date, event_id=event['id']))
+
+    return operations, unchanged
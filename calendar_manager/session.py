@@ -0,0 +1,140 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from calendar_manager import profiler
+
+
+DEFAULT_TOKEN_CACHE_FILENAME = '.token_cache.json'
+
+# A single access token is requested for every API used by the tool
+SCOPES = [
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive.metadata.readonly',
+]
+
+# Cached tokens are not used when they expire in less than this
+EXPIRY_MARGIN = timedelta(minutes=5)
+
+
+class Session():
+    """Google APIs session for the service account key in `credentials_filename`.
+
+    The key is loaded once, and the access token, valid for every API used, is
+    shared by all clients and cached on `token_cache_filename` until it expires,
+    so that runs in a row do not fetch a new one. googleapiclient services share
+    one keep-alive HTTP client per thread, as httplib2 is not thread safe, and
+    gspread one pooled requests session.
+    """
+    def __init__(self, credentials_filename, token_cache_filename=DEFAULT_TOKEN_CACHE_FILENAME):
+        self.credentials_filename = credentials_filename
+        self.token_cache_filename = token_cache_filename
+        self.credentials = None
+        self.requests_session = None
+        self.thread_local = threading.local()
+        self.lock = threading.RLock()
+
+
+    def get_credentials(self):
+        "Returns the service account credentials, with a valid access token"
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import Request
+
+        with self.lock:
+            if self.credentials is None:
+                with profiler.phase('auth'):
+                    self.credentials = Credentials.from_service_account_file(self.credentials_filename, scopes=SCOPES)
+                    self.load_token()
+
+            if not self.credentials.valid or self.credentials.expiry - EXPIRY_MARGIN < datetime.utcnow():
+                print(f"Fetching access token for {self.credentials.service_account_email} ...")
+                with profiler.phase('auth'):
+                    profiler.profile_call('oauth2.token', self.credentials.refresh, Request())
+                self.save_token()
+
+            return self.credentials
+
+
+    def load_token(self):
+        "Sets the access token cached for the service account, if any"
+        try:
+            with open(self.token_cache_filename) as cache_file:
+                cached = json.load(cache_file).get(self.credentials.service_account_email)
+        except (OSError, ValueError):
+            return
+        if cached and cached.get('scopes') == SCOPES:
+            self.credentials.token = cached['token']
+            self.credentials.expiry = datetime.fromisoformat(cached['expiry'])
+
+
+    def save_token(self):
+        "Caches the access token of the service account, readable by the current user only"
+        try:
+            with open(self.token_cache_filename) as cache_file:
+                tokens = json.load(cache_file)
+        except (OSError, ValueError):
+            tokens = {}
+        tokens[self.credentials.service_account_email] = {
+            'token': self.credentials.token,
+            'expiry': self.credentials.expiry.isoformat(),
+            'scopes': SCOPES,
+        }
+
+        descriptor = os.open(self.token_cache_filename + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(tokens, cache_file)
+        os.replace(self.token_cache_filename + '.tmp', self.token_cache_filename)
+
+
+    def new_http(self):
+        "Returns a new authorized HTTP client, sharing the session credentials"
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        return AuthorizedHttp(self.get_credentials(), http=httplib2.Http())
+
+
+    def get_http(self):
+        "Returns the authorized HTTP client shared by googleapiclient services on the current thread"
+        if not hasattr(self.thread_local, 'http'):
+            self.thread_local.http = self.new_http()
+        return self.thread_local.http
+
+
+    def build(self, service_name, version):
+        """Returns googleapiclient service `service_name`, built once per thread from the
+        discovery document bundled with googleapiclient instead of fetching it from Google.
+        """
+        from googleapiclient.discovery import build
+
+        if not hasattr(self.thread_local, 'services'):
+            self.thread_local.services = {}
+        services = self.thread_local.services
+        if (service_name, version) not in services:
+            services[(service_name, version)] = profiler.profile_call(f'{service_name}.build', build, service_name, version,
+                                                                      http=self.get_http(), static_discovery=True, cache_discovery=False)
+        return services[(service_name, version)]
+
+
+    def get_gspread_client(self):
+        "Returns a gspread client sharing the session credentials and pooled requests session"
+        import gspread
+        from google.auth.transport.requests import AuthorizedSession
+
+        with self.lock:
+            if self.requests_session is None:
+                self.requests_session = AuthorizedSession(self.get_credentials())
+            return gspread.Client(auth=self.credentials, session=self.requests_session)
+
+
+# Sessions by credentials filename, shared by every module during a run
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(credentials_filename, token_cache_filename=DEFAULT_TOKEN_CACHE_FILENAME):
+    "Returns the session for `credentials_filename`, created on first call"
+    with sessions_lock:
+        if credentials_filename not in sessions:
+            sessions[credentials_filename] = Session(credentials_filename, token_cache_filename)
+        return sessions[credentials_filename]
@@ -0,0 +1,114 @@
+import os
+import re
+import json
+from calendar_manager.read_gspread import get_all_cells_from_spreadsheet
+from calendar_manager.rate_limit import execute_with_backoff
+from calendar_manager.session import get_session
+
+
+DEFAULT_CACHE_DIR = '.sheet_cache'
+
+
+def get_spreadsheet_metadata(credentials_filename, spreadsheet_filename):
+    """Returns id, name, modifiedTime and version of the spreadsheet file named
+    `spreadsheet_filename` with a single Google Drive metadata call.
+    """
+    drive_service = get_session(credentials_filename).build('drive', 'v3')
+
+    name = spreadsheet_filename.replace("\\", "\\\\").replace("'", "\\'")
+    files_result = execute_with_backoff(drive_service.files().list(
+        q=f"name = '{name}' and mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false",
+        fields='files(id, name, modifiedTime, version)',
+        pageSize=1))
+    files = files_result.get('files', [])
+
+    if not files:
+        raise ValueError(f"Spreadsheet '{spreadsheet_filename}' not found on Google Drive")
+    return files[0]
+
+
+class SheetCache():
+    """On disk cache of worksheet values, with one JSON snapshot per spreadsheet id
+    and worksheet stored in `cache_dir`.
+
+    Snapshots keep the spreadsheet modifiedTime and version, so that they can be
+    validated against Google Drive metadata before being used.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def get_snapshot_filename(self, spreadsheet_id, worksheet):
+        return os.path.join(self.cache_dir, "{}-{}.json".format(spreadsheet_id, re.sub(r'[^A-Za-z0-9_-]', '_', worksheet)))
+
+    def load(self, spreadsheet_id, worksheet):
+        "Returns the snapshot of `worksheet` from spreadsheet `spreadsheet_id`, None if not cached"
+        try:
+            with open(self.get_snapshot_filename(spreadsheet_id, worksheet)) as snapshot_file:
+                return json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None
+
+    def find(self, spreadsheet_filename, worksheet):
+        "Returns the latest snapshot of `worksheet` from spreadsheet named `spreadsheet_filename`, None if not cached"
+        snapshots = []
+        if os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                try:
+                    with open(os.path.join(self.cache_dir, filename)) as snapshot_file:
+                        snapshot = json.load(snapshot_file)
+                except (OSError, ValueError):
+                    continue
+                if snapshot.get('spreadsheet_filename') == spreadsheet_filename and snapshot.get('worksheet') == worksheet:
+                    snapshots.append(snapshot)
+        return max(snapshots, key=lambda s: s['modifiedTime']) if snapshots else None
+
+    def save(self, metadata, worksheet, cells):
+        "Saves `cells` read from `worksheet` of the spreadsheet described by Google Drive `metadata`"
+        snapshot = {
+            'spreadsheet_id': metadata['id'],
+            'spreadsheet_filename': metadata['name'],
+            'worksheet': worksheet,
+            'modifiedTime': metadata['modifiedTime'],
+            'version': metadata.get('version'),
+            'cells': cells,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        filename = self.get_snapshot_filename(metadata['id'], worksheet)
+        with open(filename + '.tmp', 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(filename + '.tmp', filename)
+        return snapshot
+
+
+def is_snapshot_current(snapshot, metadata):
+    "Returns True if `snapshot` was taken from the spreadsheet version described by `metadata`"
+    return (snapshot is not None
+            and snapshot['modifiedTime'] == metadata['modifiedTime']
+            and snapshot.get('version') == metadata.get('version'))
+
+
+def get_cached_cells(credentials_filename, spreadsheet_filename, worksheet, cache_dir=DEFAULT_CACHE_DIR, offline=False):
+    """Returns all cells from a Google spreadsheet worksheet like `get_all_cells_from_spreadsheet`,
+    using the local snapshot when the spreadsheet has not been modified since it was taken.
+
+    When `offline`, the latest snapshot is used without contacting Google at all.
+    """
+    cache = SheetCache(cache_dir)
+
+    if offline:
+        snapshot = cache.find(spreadsheet_filename, worksheet)
+        if snapshot is None:
+            raise ValueError(f"No cached snapshot of '{spreadsheet_filename}:{worksheet}' in '{cache_dir}'")
+        print(f"Using cached snapshot of '{spreadsheet_filename}:{worksheet}' modified at {snapshot['modifiedTime']} ...")
+        return snapshot['cells']
+
+    metadata = get_spreadsheet_metadata(credentials_filename, spreadsheet_filename)
+    snapshot = cache.load(metadata['id'], worksheet)
+
+    if is_snapshot_current(snapshot, metadata):
+        print(f"Spreadsheet '{spreadsheet_filename}' not modified since {metadata['modifiedTime']}, using cached snapshot ...")
+        return snapshot['cells']
+
+    cells = get_all_cells_from_spreadsheet(credentials_filename, spreadsheet_filename, worksheet)
+    cache.save(metadata, worksheet, cells)
+    return cells
@@ -0,0 +1,123 @@
+import io
+import os
+import sys
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_JOBS = 4
+
+
+class TenantResult():
+    """Outcome of running a tenant, one settings file: `counts` returned by the run
+    (inserts, deletes...) on success, or the `error` that made it fail, along with
+    what the run printed.
+    """
+    def __init__(self, settings_filename, counts=None, error=None, elapsed=0.0, output=''):
+        self.settings_filename = settings_filename
+        self.name = os.path.splitext(os.path.basename(settings_filename))[0]
+        self.counts = counts or {}
+        self.error = error
+        self.elapsed = elapsed
+        self.output = output
+
+    def succeeded(self):
+        return self.error is None
+
+
+class TenantOutput():
+    """Replacement for `sys.stdout` sending what every thread prints to the buffer
+    of the tenant it runs, so that the output of tenants run concurrently is not mixed.
+    The buffer is kept on a context variable, so that threads started with the context
+    of a tenant, as those of the export pipeline, print to its buffer too.
+    """
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.buffer = contextvars.ContextVar('tenant_buffer', default=None)
+
+    def write(self, text):
+        return (self.buffer.get() or self.stdout).write(text)
+
+    def flush(self):
+        (self.buffer.get() or self.stdout).flush()
+
+    def capture(self, buffer):
+        self.buffer.set(buffer)
+
+    def release(self):
+        self.buffer.set(None)
+
+
+def find_settings_files(path):
+    """Returns the settings files of the tenants in `path`: every .json file when it is
+    a directory, or the files listed on it, one per line, when it is a manifest.
+    Paths on a manifest are relative to it, and lines starting with # are ignored.
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, filename) for filename in sorted(os.listdir(path)) if filename.endswith('.json')]
+
+    with open(path) as manifest_file:
+        lines = [line.strip() for line in manifest_file]
+    return [os.path.join(os.path.dirname(path), line) for line in lines if line and not line.startswith('#')]
+
+
+def run_tenant(settings_filename, run, output):
+    "Runs `run(settings_filename)` capturing what it prints, turning any failure into an error result"
+    buffer = io.StringIO()
+    output.capture(buffer)
+    start = time.perf_counter()
+    try:
+        counts = run(settings_filename)
+        error = None
+    except (Exception, SystemExit) as e:
+        counts = None
+        error = str(e) or type(e).__name__
+        print(f"\nFailed: {error}")
+    finally:
+        output.release()
+    return TenantResult(settings_filename, counts, error, time.perf_counter() - start, buffer.getvalue())
+
+
+def run_tenants(settings_filenames, run, jobs=DEFAULT_JOBS, log_dir=None):
+    """Runs every tenant with `run`, up to `jobs` at a time, and returns their results.
+
+    A failing tenant does not stop the others. The output of every tenant is printed
+    as a block, in order, or written to `<log_dir>/<tenant>.log` when `log_dir` is given.
+    """
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    output = TenantOutput(sys.stdout)
+    sys.stdout = output
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_tenant, settings_filename, run, output) for settings_filename in settings_filenames]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                if log_dir:
+                    with open(os.path.join(log_dir, result.name + '.log'), 'w') as log_file:
+                        log_file.write(result.output)
+                else:
+                    print(f"\n=== {result.name} ({result.settings_filename}) ===\n")
+                    print(result.output)
+    finally:
+        sys.stdout = output.stdout
+
+    return results
+
+
+def print_tenants_summary(results):
+    print(f"\n=== Summary of {len(results)} tenants ===\n")
+    kinds = sorted(set(kind for result in results for kind in result.counts))
+    print("{:<24} {:>8} {:>8}".format('tenant', 'status', 'time (s)') + "".join(f" {kind:>9}" for kind in kinds))
+    for result in results:
+        print("{:<24} {:>8} {:>8.1f}".format(result.name, 'ok' if result.succeeded() else 'FAILED', result.elapsed)
+              + "".join(f" {result.counts.get(kind, '-'):>9}" for kind in kinds))
+
+    failed = [result for result in results if not result.succeeded()]
+    print(f"\n{len(results) - len(failed)} tenants succeeded, {len(failed)} failed.")
+    for result in failed:
+        print(f" * {result.name}: {result.error}")
@@ -0,0 +1,99 @@
+import mock
+import pytest
+from calendar_manager.batch_writer import BatchWriter, MAX_BATCH_SIZE
+from calendar_manager.fake_google import FakeCalendarService, FakeBatch, http_error
+
+
+def insert(service, event_id):
+    return service.events().insert(body={ 'id': event_id, 'summary': event_id, 'start': { 'date': '2020-04-01' }, 'end': { 'date': '2020-04-01' } })
+
+
+def test_batch_size_limits():
+    with pytest.raises(ValueError):
+        BatchWriter(FakeCalendarService(), 0)
+    with pytest.raises(ValueError):
+        BatchWriter(FakeCalendarService(), MAX_BATCH_SIZE + 1)
+
+def test_batches_are_split_and_flushed():
+    service = FakeCalendarService()
+    writer = BatchWriter(service, 50)
+    for i in range(120):
+        writer.add(insert(service, f"evt{i}"), 'insert', f"event {i}")
+    assert service.http_requests == 2 and service.calls['insert'] == 100
+    writer.flush()
+    assert service.http_requests == 3 and service.calls['insert'] == 120
+    assert writer.summary.count('insert') == 120
+    assert writer.summary.failures == []
+
+def test_failures_are_collected():
+    service = FakeCalendarService()
+    service.events().add_event({ 'id': 'evt0', 'summary': 'Event', 'start': { 'date': '2020-04-01' }, 'end': { 'date': '2020-04-01' } })
+    writer = BatchWriter(service)
+    writer.add(service.events().patch(eventId='evt0', body={ 'summary': 'Changed' }), 'patch', "event 0")
+    writer.add(service.events().delete(eventId='evt1'), 'delete', "event 1")
+    writer.flush()
+    assert writer.summary.count('patch') == 1
+    assert writer.summary.count('delete') == 0
+    assert [(kind, desc, e.resp.status) for kind, desc, e in writer.summary.failures] == [('delete', "event 1", 404)]
+
+def test_conflicts_are_sent_to_fallback():
+    service = FakeCalendarService()
+    service.events().add_event({ 'id': 'evt0', 'summary': 'Old', 'start': { 'date': '2020-04-01' }, 'end': { 'date': '2020-04-01' } })
+    writer = BatchWriter(service)
+    fallback = lambda: writer.add(service.events().patch(eventId='evt0', body={ 'summary': 'evt0' }), 'patch', "event 0")
+    writer.add(insert(service, 'evt0'), 'insert', "event 0", on_conflict=fallback)
+    writer.add(insert(service, 'evt1'), 'insert', "event 1", on_conflict=fallback)
+    writer.flush()
+    # the fallback is sent on a second batch
+    assert service.http_requests == 2
+    assert writer.summary.count('insert') == 1 and writer.summary.count('patch') == 1 and writer.summary.failures == []
+    assert service.events().get(eventId='evt0').execute()['summary'] == 'evt0'
+
+def test_rate_limited_requests_are_retried():
+    # every third call fails with 403 rateLimitExceeded
+    service = FakeCalendarService(quota_error_every=3)
+    rate_limiter = mock.Mock()
+    sleep = mock.Mock()
+    writer = BatchWriter(service, rate_limiter=rate_limiter, sleep=sleep)
+    for i in range(6):
+        writer.add(insert(service, f"evt{i}"), 'insert', f"event {i}")
+    writer.flush()
+    assert writer.summary.count('insert') == 6 and writer.summary.failures == []
+    # a token is taken for every call sent, retries included
+    assert rate_limiter.acquire.call_count == service.calls['insert'] == 8
+    assert sleep.call_count == 1
+
+def test_failed_batches_are_retried():
+    service = FakeCalendarService()
+    execute = FakeBatch.execute
+    attempts = []
+    def fail_first_attempt(batch, http=None):
+        attempts.append(len(batch.requests))
+        if len(attempts) == 1:
+            raise http_error(503, 'backendError')
+        return execute(batch, http)
+
+    writer = BatchWriter(service, sleep=mock.Mock())
+    with mock.patch.object(FakeBatch, 'execute', autospec=True, side_effect=fail_first_attempt):
+        writer.add(insert(service, 'evt0'), 'insert', "event 0")
+        writer.add(service.events().delete(eventId='evt1'), 'delete', "event 1")
+        writer.flush()
+    assert attempts == [2, 2]
+    assert writer.summary.count('insert') == 1
+    assert [(kind, e.resp.status) for kind, desc, e in writer.summary.failures] == [('delete', 404)]
+
+def test_retries_are_limited():
+    service = FakeCalendarService(quota_error_every=1)
+    writer = BatchWriter(service, max_retries=2, sleep=mock.Mock())
+    writer.add(insert(service, 'evt0'), 'insert', "event 0")
+    writer.flush()
+    assert service.calls['insert'] == 3
+    assert [(kind, e.resp.status) for kind, desc, e in writer.summary.failures] == [('insert', 403)]
+
+def test_missing_events_are_sent_to_fallback():
+    service = FakeCalendarService()
+    missing = []
+    writer = BatchWriter(service)
+    writer.add(service.events().delete(eventId='evt0'), 'delete', "event 0", on_missing=lambda: missing.append('evt0'))
+    writer.flush()
+    assert missing == ['evt0'] and writer.summary.failures == []
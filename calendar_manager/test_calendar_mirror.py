@@ -0,0 +1,50 @@
+import datetime
+from calendar_manager.calendar_mirror import CalendarMirror
+from calendar_manager.fake_google import FakeCalendarService
+
+
+def event(event_id, start, template_name=None):
+    body = { 'id': event_id, 'summary': event_id, 'start': start, 'end': start }
+    if template_name:
+        body['extendedProperties'] = { 'private': { 'template_name': template_name } }
+    return body
+
+
+def fake_service(events):
+    service = FakeCalendarService()
+    for body in events:
+        service.events().add_event(body)
+    return service
+
+
+def test_calendar_mirror_sync(tmp_path):
+    service = fake_service([
+        event('evt1', { 'date': '2020-04-20' }, 'all_weekdays'),
+        event('evt2', { 'dateTime': '2020-04-21T17:00:00+02:00' }, 'sport_activity'),
+        event('manual', { 'dateTime': '2020-04-22T10:00:00+02:00' }),
+    ])
+    mirror = CalendarMirror(service, 'cal', str(tmp_path / 'mirror.db'))
+    assert mirror.sync() == 3
+    assert 'syncToken' not in service.log[0][1]
+    assert mirror.find_template_event('sport_activity', datetime.date(2020, 4, 21))['id'] == 'evt2'
+    assert [e['id'] for e in mirror.get_events(datetime.date(2020, 4, 20), datetime.date(2020, 4, 21))] == ['evt1', 'evt2']
+    assert [e['id'] for e in mirror.get_upcoming_events('2020-04-21T00:00:00Z', 10)] == ['evt2', 'manual']
+
+    # only changes are listed on incremental syncs
+    sync_token = mirror.get_sync_token()
+    service.events().delete(eventId='evt2').execute()
+    service.events().insert(body=event('evt3', { 'date': '2020-04-23' }, 'all_weekdays')).execute()
+    assert mirror.sync() == 2
+    assert service.log[-1][1]['syncToken'] == sync_token
+    assert mirror.find_template_event('sport_activity', datetime.date(2020, 4, 21)) is None
+    cancelled = mirror.get_events(datetime.date(2020, 4, 20), datetime.date(2020, 4, 23), include_cancelled=True)
+    assert [(e['id'], e['status']) for e in cancelled] == [('evt1', 'confirmed'), ('evt2', 'cancelled'), ('manual', 'confirmed'), ('evt3', 'confirmed')]
+
+def test_calendar_mirror_full_resync_on_410(tmp_path):
+    service = fake_service([event('evt1', { 'date': '2020-04-20' }, 'all_weekdays')])
+    mirror = CalendarMirror(service, 'cal', str(tmp_path / 'mirror.db'))
+    mirror.connection.execute("INSERT INTO sync_state VALUES ('cal', 'expired')")
+    mirror.connection.execute("INSERT INTO events VALUES ('cal', 'stale', NULL, NULL, '2020-04-20', '2020-04-20', '{}')")
+    assert mirror.sync() == 1
+    assert [e['id'] for e in mirror.get_events(datetime.date(2020, 4, 20), datetime.date(2020, 4, 20))] == ['evt1']
+    assert service.calls['list'] == 2 and mirror.get_sync_token() == '1'
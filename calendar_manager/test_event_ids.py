@@ -0,0 +1,17 @@
+import re
+import datetime
+from calendar_manager.event_ids import make_event_id
+
+
+def test_make_event_id():
+    event_id = make_event_id('cal@group.calendar.google.com', 'piano', datetime.date(2020, 4, 21))
+    # base32hex characters only, as required by Google Calendar
+    assert re.fullmatch('[a-v0-9]{5,1024}', event_id)
+    assert event_id == make_event_id('cal@group.calendar.google.com', 'piano', datetime.date(2020, 4, 21))
+    assert event_id != make_event_id('cal@group.calendar.google.com', 'piano', datetime.date(2020, 4, 22))
+    assert event_id != make_event_id('cal@group.calendar.google.com', 'sports', datetime.date(2020, 4, 21))
+    assert event_id != make_event_id('other@group.calendar.google.com', 'piano', datetime.date(2020, 4, 21))
+
+def test_make_event_id_is_stable():
+    # ids of events already on calendars must not change across Python versions
+    assert make_event_id('cal@group.calendar.google.com', 'piano', datetime.date(2020, 4, 21)) == 'q3i4i9jf28spo1nujopid08fih1rknlp'
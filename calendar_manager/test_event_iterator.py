@@ -0,0 +1,53 @@
+import json
+import mock
+import pytest
+import datetime
+from itertools import islice
+from click.testing import CliRunner
+from calendar_manager.cli import cli
+from calendar_manager.event_iterator import iter_events, get_time_min, get_time_max
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.fake_google import FakeCalendarService
+
+
+def create_service(days):
+    service = FakeCalendarService()
+    for day in range(1, days + 1):
+        event_date = datetime.date(2020, 4, day).isoformat()
+        service.events().add_event({ 'id': f'evt{day}', 'summary': f'Event {day}', 'start': { 'date': event_date }, 'end': { 'date': event_date } })
+    return service
+
+def test_iter_events_lists_pages_lazily():
+    service = create_service(10)
+    events = iter_events(service, 'cal', get_time_min(datetime.date(2020, 4, 1)), page_size=3, singleEvents=True, orderBy='startTime')
+    assert service.calls['list'] == 0
+    assert [e['id'] for e in islice(events, 2)] == ['evt1', 'evt2']
+    assert service.calls['list'] == 1
+
+    events = iter_events(service, 'cal', get_time_min(datetime.date(2020, 4, 2)), get_time_max(datetime.date(2020, 4, 9)), page_size=3)
+    assert [e['id'] for e in events] == [f'evt{day}' for day in range(2, 10)]
+    assert service.calls['list'] == 1 + 3
+
+    with pytest.raises(ValueError):
+        next(iter_events(service, 'cal', page_size=0))
+
+def test_list_upcoming_events_stops_at_max_results():
+    service = create_service(10)
+    scheduler = EventScheduler(None, 'cal', 'Europe/Madrid', [], {}, [], calendar_service=service)
+    events = scheduler.list_upcoming_events('2020-04-03', max_results=4)
+    assert [e['id'] for e in events] == ['evt3', 'evt4', 'evt5', 'evt6']
+    assert service.calls['list'] == 1
+    assert scheduler.list_upcoming_events('2020-04-03', max_results=0) == []
+    assert service.calls['list'] == 1
+
+def test_events_command(tmp_path):
+    service = create_service(10)
+    (tmp_path / 'settings.json').write_text(json.dumps({ 'calendar_id': 'cal', 'calendar_timezone': 'Europe/Madrid' }))
+    with mock.patch('calendar_manager.event_scheduler.EventScheduler.build_calendar_service', return_value=service):
+        result = CliRunner().invoke(cli, ['-f', str(tmp_path / 'settings.json'), 'events', '--start', '2020-04-04', '--end', '2020-04-06',
+                                          '--page-size', '2', '--format', 'json', '-o', str(tmp_path / 'events.jsonl')])
+    assert result.exit_code == 0 and "3 events listed." in result.output
+    lines = (tmp_path / 'events.jsonl').read_text().splitlines()
+    assert [json.loads(line)['id'] for line in lines] == ['evt4', 'evt5', 'evt6']
+    assert service.calls['list'] == 2
+    assert all(params['orderBy'] == 'startTime' for operation, params in service.log)
@@ -3,6 +3,10 @@ import mock
 import datetime
 from calendar_manager.event_template import EventTemplate
 from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.event_ids import make_event_id
+from calendar_manager.batch_writer import BatchWriter
+from calendar_manager.fake_google import FakeCalendarService
+from calendar_manager.reconcile import Operation, ReconcilePlan
 
 
 # Define test data common for all tests
@@ -111,8 +115,13 @@ test_event_data = {
     "year": 2020
 }
 
-# NOTE: these tests will only work if you have credentials set, as they involve Google API calls
-test_scheduler = EventScheduler('test_creds.json', test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data)
+# Events on the calendar listed by the tests below, served by the fake Google backend
+test_calendar_service = FakeCalendarService()
+for event_date in ['2020-04-30', '2020-05-04', '2020-05-05', '2020-05-06']:
+    test_calendar_service.events().add_event({ 'id': f'work{event_date[5:7]}{event_date[8:]}', 'summary': 'Work',
+                                               'start': { 'date': event_date }, 'end': { 'date': event_date } })
+test_scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data,
+                                calendar_service=test_calendar_service)
 
 def test_list_upcoming_events_from_today():
     # No upcoming events should be returned when testing from future
@@ -120,7 +129,6 @@ def test_list_upcoming_events_from_today():
 
 def test_list_upcoming_events_from_date():
     # At least 1 result should be listed
-    # FIXME 4 according to current events on calendar!
     assert len(test_scheduler.list_upcoming_events(start_date='2020-04-30')) == 4
 
 def test_list_events_to_be_scheduled(capsys):
@@ -137,4 +145,236 @@ def test_list_events_to_be_scheduled(capsys):
         assert "Tue 2020-04-14: All day Work day, 17:00:00 Sports" in captured.out
 
 
-# TODO: add more tests!
\ No newline at end of file
+# TODO: add more tests!
+
+def fake_service(events=()):
+    "Returns a fake calendar holding `events`"
+    service = FakeCalendarService()
+    for event in events:
+        service.events().add_event(event)
+    return service
+
+
+def fake_scheduler(service, event_data=test_event_data):
+    return EventScheduler(None, test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, event_data,
+                          calendar_service=service)
+
+
+def get_calls(service):
+    "Returns the (operation, event id) of the calls made to `service`, in order"
+    return [(operation, params.get('eventId')) for operation, params in service.log]
+
+
+def template_event(event_id, template_name, start):
+    return {
+        'id': event_id,
+        'summary': template_name,
+        'start': start,
+        'end': start,
+        'creator': { 'email': 'test@example.com' },
+        'extendedProperties': { 'private': { 'template_name': template_name } },
+    }
+
+
+def test_prefetch_events():
+    service = fake_service([
+        template_event('evt1', 'all_weekdays', { 'date': '2020-04-20' }),
+        { 'id': 'manual', 'summary': 'Manual', 'start': { 'date': '2020-04-20' } },
+        template_event('evt2', 'sport_activity', { 'dateTime': '2020-04-21T17:00:00+02:00' }),
+    ])
+    scheduler = fake_scheduler(service)
+    index = scheduler.prefetch_events(datetime.date(2020, 4, 19), datetime.date(2020, 4, 30))
+    assert sorted(index.keys()) == [('all_weekdays', datetime.date(2020, 4, 20)), ('sport_activity', datetime.date(2020, 4, 21))]
+    assert get_calls(service) == [('list', None)]
+    assert scheduler.get_event_id(test_event_templates[1], datetime.date(2020, 4, 21)) == 'evt2'
+    assert scheduler.get_event_id(test_event_templates[1], datetime.date(2020, 4, 23)) is None
+    assert len(service.log) == 1
+
+def test_schedule_events_reconciles_prefetched_events():
+    work_day_id = make_event_id(test_calendar_id, 'all_weekdays', datetime.date(2020, 4, 30))
+    service = fake_service([
+        template_event(work_day_id, 'all_weekdays', { 'date': '2020-04-30' }),
+        template_event('legacy1', 'sport_activity', { 'dateTime': '2020-04-30T17:00:00+02:00' }),
+        template_event('legacy2', 'sunday_service', { 'date': '2020-04-30' }),
+    ])
+    scheduler = fake_scheduler(service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 29)):
+        scheduler.schedule_events()
+    # prefetch, then Work day on Wed 29, Work day and Sports on Thu 30
+    assert get_calls(service) == [('list', None), ('insert', None), ('patch', work_day_id),
+                                  ('delete', 'legacy1'), ('insert', None), ('delete', 'legacy2')]
+    patch_body = service.log[2][1]['body']
+    assert sorted(patch_body.keys()) == ['colorId', 'summary']
+    insert_body = service.log[4][1]['body']
+    assert insert_body['id'] == make_event_id(test_calendar_id, 'sport_activity', datetime.date(2020, 4, 30))
+
+def test_schedule_unchanged_month_makes_no_writes():
+    service = fake_service()
+    scheduler = fake_scheduler(service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 29)):
+        desired = scheduler.get_desired_events()
+        for body in desired.values():
+            event = dict(body)
+            # Google Calendar returns date times with UTC offset
+            if 'dateTime' in event['start']:
+                event['start'] = dict(event['start'], dateTime=event['start']['dateTime'] + '+02:00')
+            service.events().add_event(event)
+        scheduler.schedule_events()
+    assert get_calls(service) == [('list', None)]
+
+def test_create_event_does_not_look_up_existing_events():
+    service = fake_service()
+    scheduler = fake_scheduler(service)
+    scheduler.create_event(test_event_templates[1], datetime.date(2020, 4, 21), "3")
+    assert get_calls(service) == [('insert', None)]
+    assert service.log[0][1]['body']['id'] == make_event_id(test_calendar_id, 'sport_activity', datetime.date(2020, 4, 21))
+
+@pytest.mark.parametrize('batch_size', [None, 50])
+def test_delete_event_already_deleted_or_legacy(batch_size):
+    service = fake_service([template_event('legacy1', 'all_weekdays', { 'date': '2020-04-21' })])
+    scheduler = fake_scheduler(service)
+    if batch_size:
+        scheduler.batch_writer = BatchWriter(service, batch_size)
+    scheduler.delete_event(test_event_templates[0], datetime.date(2020, 4, 21))
+    scheduler.delete_event(test_event_templates[0], datetime.date(2020, 4, 22))
+    if batch_size:
+        scheduler.batch_writer.flush()
+        assert scheduler.batch_writer.summary.failures == []
+    # events missing by their deterministic id are looked up, in case they were created before
+    assert ('delete', 'legacy1') in get_calls(service)
+    assert service.calls['delete'] == 3 and service.calls['list'] == 2
+
+def test_create_event_patches_changed_fields_only():
+    event_id = make_event_id(test_calendar_id, 'all_weekdays', datetime.date(2020, 4, 21))
+    service = fake_service([template_event(event_id, 'all_weekdays', { 'date': '2020-04-21' })])
+    scheduler = fake_scheduler(service)
+    scheduler.prefetch_events(datetime.date(2020, 4, 21), datetime.date(2020, 4, 21))
+    event = scheduler.create_event(test_event_templates[0], datetime.date(2020, 4, 21), "3")
+    assert get_calls(service) == [('list', None), ('patch', event_id)]
+    assert service.log[0][1]['fields'].startswith('items(id,etag,')
+    assert service.log[1][1]['body'] == { 'summary': 'Work day', 'colorId': '3' }
+    assert event['id'] == event_id and event['summary'] == 'Work day'
+
+def test_schedule_events_concurrently():
+    service = fake_service([template_event('legacy1', 'sunday_service', { 'date': '2020-04-30' })])
+    scheduler = fake_scheduler(service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 20)):
+        summary = scheduler.schedule_events(workers=4)
+    assert summary.count('insert') == 14
+    assert summary.count('delete') == 1
+    assert summary.failures == []
+
+def test_schedule_several_months_with_single_prefetch():
+    service = fake_service()
+    may_data = { "year": 2020, "month": 5, "days": { "1": "A", "2": "AWE", "3": "AWE" }, "caregivers": { "A": 1, "AWE": 2, "B": 0, "BWE": 0 } }
+    scheduler = fake_scheduler(service, [test_event_data, may_data])
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 30)):
+        scheduler.schedule_events()
+    calls = service.log
+    assert [c[0] for c in calls] == ['list', 'insert', 'insert', 'insert', 'insert']
+    assert calls[0][1]['timeMin'].startswith('2020-04-30') and calls[0][1]['timeMax'].startswith('2020-05-03')
+
+def test_get_templates_for_day():
+    matched, unmatched = test_scheduler.get_templates_for_day(1, "B")
+    assert [tmpl.name for tmpl in matched] == ['all_weekdays', 'sport_activity']
+    assert [tmpl.name for tmpl in unmatched] == ['sunday_service']
+    matched, unmatched = test_scheduler.get_templates_for_day(6, "AWE")
+    assert [tmpl.name for tmpl in matched] == ['sunday_service']
+    # datetypes not declared are matched on first lookup
+    matched, unmatched = test_scheduler.get_templates_for_day(6, "X")
+    assert matched == () and len(unmatched) == 3
+
+def test_schedule_events_with_recurrence():
+    service = FakeCalendarService()
+    scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data,
+                               calendar_service=service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 1)):
+        scheduler.schedule_events(recurrence=True)
+    # one recurring event per template and color instead of one event per day
+    assert service.calls['insert'] == 5 and service.calls['get'] == 5
+    series = list(service.fake_events.events.values())
+    assert len(series) == 5 and all('recurrence' in body for body in series)
+
+def test_schedule_events_with_recurrence_keeps_past_instances():
+    service = FakeCalendarService()
+    scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data,
+                               calendar_service=service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 1)):
+        scheduler.schedule_events(recurrence=True)
+    instances = service.events().list(singleEvents=True).execute()['items']
+    work_day = next(e for e in instances if e['start']['date'] == '2020-04-01' and e['summary'] == 'Work day')
+    service.events().patch(eventId=work_day['recurringEventId'], body={ 'summary': 'Changed' }).execute()
+    service.reset_counters()
+
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 20)):
+        scheduler.schedule_events(recurrence=True)
+    # the series changed is patched, with the same id, keeping instances before the 20th
+    assert service.calls['patch'] == 1 and service.calls['get'] == 1
+    def past(events):
+        return [e for e in events if (e['start'].get('date') or e['start']['dateTime'][:10]) < '2020-04-20']
+    assert past(service.events().list(singleEvents=True).execute()['items']) == past(instances)
+
+def test_sweep_stale_events():
+    service = fake_service([
+        template_event('evt1', 'all_weekdays', { 'date': '2020-04-29' }),
+        template_event('evt2', 'sunday_service', { 'date': '2020-04-29' }),
+        template_event('evt3', 'removed_template', { 'date': '2020-04-30' }),
+        template_event('evt4', 'sunday_service', { 'date': '2020-04-28' }),
+        # duplicate of a desired event
+        template_event('evt5', 'all_weekdays', { 'date': '2020-04-29' }),
+    ])
+    scheduler = fake_scheduler(service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 29)):
+        assert scheduler.sweep_stale_events() == 3
+    assert get_calls(service) == [('list', None), ('delete', 'evt5'), ('delete', 'evt2'), ('delete', 'evt3')]
+
+def test_schedule_events_twice_with_fake_calendar():
+    service = FakeCalendarService()
+    scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data,
+                               calendar_service=service)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 20)):
+        scheduler.schedule_events(batch_size=50)
+        assert service.calls['insert'] == 14
+        service.reset_counters()
+        scheduler.schedule_events(recurrence=True)
+        # work days are replaced by recurring events, then nothing changes anymore
+        assert service.calls['delete'] == 9 and service.calls['insert'] == 2
+        service.reset_counters()
+        scheduler.schedule_events(recurrence=True)
+    assert dict(service.calls) == { 'list': 1 }
+
+def test_preview_does_not_build_calendar_service(capsys):
+    scheduler = EventScheduler('missing_creds.json', test_calendar_id, test_calendar_timezone, test_event_templates, test_date_types, test_event_data)
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 19)):
+        scheduler.list_events_to_be_scheduled()
+        scheduler.print_datetype_distribution()
+    assert scheduler.service is None and scheduler.session is None
+
+@pytest.mark.parametrize('batch_size, workers', [(None, 1), (50, 1), (None, 2)])
+def test_insert_conflicts_fall_back_to_patch(batch_size, workers):
+    service = FakeCalendarService()
+    body = { 'id': 'work1', 'summary': 'Work', 'start': { 'date': '2020-04-01' }, 'end': { 'date': '2020-04-01' } }
+    service.events().insert(body=dict(body, summary='Old')).execute()
+    service.events().delete(eventId='work1').execute()
+    service.reset_counters()
+
+    scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, [], {}, [], calendar_service=service)
+    plan = ReconcilePlan([Operation(Operation.INSERT, 'work', datetime.date(2020, 4, 1), body=body)], 0)
+    summary = scheduler.apply_plan(plan, batch_size, workers)
+    assert summary is None or summary.failures == []
+    assert service.calls['insert'] == 1 and service.calls['patch'] == 1
+    event = service.events().get(eventId='work1').execute()
+    assert event['summary'] == 'Work' and event['status'] == 'confirmed'
+
+def test_queued_writes_are_sent_when_apply_plan_fails(capsys):
+    service = FakeCalendarService()
+    scheduler = EventScheduler(None, test_calendar_id, test_calendar_timezone, [], {}, [], calendar_service=service)
+    operations = [Operation(Operation.INSERT, 'work', datetime.date(2020, 4, day),
+                            body={ 'id': f'work{day}', 'summary': 'Work', 'start': { 'date': f'2020-04-0{day}' }, 'end': { 'date': f'2020-04-0{day}' } })
+                  for day in (1, 2)]
+    operations.append(Operation(Operation.DELETE, 'work', datetime.date(2020, 4, 3), event_id='work3'))
+    with mock.patch.object(scheduler, 'build_request', side_effect=RuntimeError("connection lost")):
+        with pytest.raises(RuntimeError):
+            scheduler.apply_plan(ReconcilePlan(operations, 0), batch_size=50)
+    assert service.calls['insert'] == 2 and scheduler.batch_writer is None
+    assert " * 2 insert operations succeeded" in capsys.readouterr().out
@@ -0,0 +1,89 @@
+import pytest
+from googleapiclient.errors import HttpError
+from calendar_manager.fake_google import FakeCalendarService, FakeSpreadsheet, FakeSession, expand_recurrence, select_fields
+from calendar_manager.sheet_cache import get_cached_cells
+from calendar_manager import session
+
+
+def all_day_event(event_id, day):
+    return { 'id': event_id, 'summary': event_id, 'start': { 'date': day }, 'end': { 'date': day } }
+
+
+def test_list_filters_and_pages():
+    service = FakeCalendarService()
+    for i, day in enumerate(['2020-04-03', '2020-04-01', '2020-04-02', '2020-05-01']):
+        service.events().add_event(all_day_event(f"evt{i}", day))
+    service.events().delete(eventId='evt2').execute()
+
+    result = service.events().list(timeMin='2020-04-01T00:00:00Z', timeMax='2020-04-30T23:59:00Z', maxResults=1).execute()
+    assert [e['id'] for e in result['items']] == ['evt1'] and result['nextPageToken'] == '1'
+    result = service.events().list(timeMin='2020-04-01T00:00:00Z', timeMax='2020-04-30T23:59:00Z', pageToken='1').execute()
+    assert [e['id'] for e in result['items']] == ['evt0'] and 'nextSyncToken' in result
+    result = service.events().list(showDeleted=True, maxResults=10).execute()
+    assert [e['status'] for e in result['items']] == ['confirmed', 'cancelled', 'confirmed', 'confirmed']
+    assert service.calls['list'] == 3 and service.calls['delete'] == 1
+    assert service.log[-1] == ('list', { 'maxResults': 10, 'singleEvents': False, 'showDeleted': True })
+
+def test_sync_token_returns_changes():
+    service = FakeCalendarService()
+    service.events().insert(body=all_day_event('evt1', '2020-04-01')).execute()
+    sync_token = service.events().list().execute()['nextSyncToken']
+    service.events().patch(eventId='evt1', body={ 'summary': 'Changed' }).execute()
+    result = service.events().list(syncToken=sync_token).execute()
+    assert [e['summary'] for e in result['items']] == ['Changed']
+    with pytest.raises(HttpError) as e:
+        service.events().list(syncToken='999').execute()
+    assert e.value.resp.status == 410
+
+def test_partial_responses():
+    event = dict(all_day_event('evt1', '2020-04-01'), extendedProperties={ 'private': { 'template_name': 'work', 'other': 'x' } })
+    assert select_fields({ 'items': [event], 'nextPageToken': '2' }, 'items(id,start/date,extendedProperties/private/template_name)') == {
+        'items': [{ 'id': 'evt1', 'start': { 'date': '2020-04-01' }, 'extendedProperties': { 'private': { 'template_name': 'work' } } }]
+    }
+    service = FakeCalendarService()
+    assert service.events().insert(body=event, fields='id').execute() == { 'id': 'evt1' }
+    assert service.events().get(eventId='evt1').execute()['extendedProperties']['private']['other'] == 'x'
+
+def test_write_errors():
+    service = FakeCalendarService()
+    service.events().insert(body=all_day_event('evt1', '2020-04-01')).execute()
+    for request, status in [(service.events().insert(body=all_day_event('evt1', '2020-04-01')), 409),
+                            (service.events().update(eventId='missing', body={}), 404)]:
+        with pytest.raises(HttpError) as e:
+            request.execute()
+        assert e.value.resp.status == status
+    service.events().delete(eventId='evt1').execute()
+    with pytest.raises(HttpError) as e:
+        service.events().delete(eventId='evt1').execute()
+    assert e.value.resp.status == 410
+
+def test_batch_counts_one_http_request_and_quota_errors():
+    service = FakeCalendarService(quota_error_every=3)
+    responses = []
+    batch = service.new_batch_http_request(callback=lambda request_id, response, exception: responses.append(exception))
+    for i in range(4):
+        batch.add(service.events().insert(body=all_day_event(f"evt{i}", '2020-04-01')))
+    batch.execute()
+    assert service.http_requests == 1
+    assert [e.resp.status if e else None for e in responses] == [None, None, 403, None]
+
+def test_expand_recurrence():
+    event = dict(all_day_event('series', '2020-04-06'), recurrence=["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4", "EXDATE;VALUE=DATE:20200408"])
+    instances = expand_recurrence(event)
+    assert [i['start']['date'] for i in instances] == ['2020-04-06', '2020-04-13', '2020-04-15']
+    assert instances[0]['id'] == 'series_20200406' and instances[0]['recurringEventId'] == 'series'
+
+def test_values_batch_get():
+    spreadsheet = FakeSpreadsheet({ 'Sheet1': [['a', 'b', ''], ['c', '', ''], ['', '', '']] })
+    assert spreadsheet.worksheet('Sheet1').get_all_values()[0] == ['a', 'b', '']
+    result = spreadsheet.values_batch_get(["'Sheet1'!A1:C3", "'Sheet1'!B1:C"])
+    assert [r['values'] for r in result['valueRanges']] == [[['a', 'b'], ['c']], [['b']]]
+    assert spreadsheet.http_requests == 2
+
+def test_fake_session_serves_readers(tmp_path, monkeypatch):
+    spreadsheet = FakeSpreadsheet({ 'Sheet1': [['a', 'b'], ['c', '']] })
+    fake_session = FakeSession({ "Dad's sheet": spreadsheet })
+    monkeypatch.setitem(session.sessions, 'fake.json', fake_session)
+    for i in range(2):
+        assert get_cached_cells('fake.json', "Dad's sheet", 'Sheet1', str(tmp_path)) == [['a', 'b'], ['c', '']]
+    assert spreadsheet.calls['values.get'] == 1 and fake_session.drive_service.calls['files.list'] == 2
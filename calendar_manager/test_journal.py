@@ -0,0 +1,69 @@
+import os
+import pytest
+import datetime
+from googleapiclient.errors import HttpError
+from calendar_manager.cli import create_scheduler
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.fake_google import FakeCalendarService
+from calendar_manager.journal import Journal
+from calendar_manager.reconcile import Operation, ReconcilePlan
+
+
+def insert(template_name, day):
+    event_date = datetime.date(2020, 4, day)
+    return Operation(Operation.INSERT, template_name, event_date, body={ 'id': f'{template_name}{day}', 'summary': template_name,
+                                                                        'start': { 'date': event_date.isoformat() }, 'end': { 'date': event_date.isoformat() } })
+
+def test_journal(tmp_path):
+    journal_filename = str(tmp_path / 'journal.jsonl')
+    journal = Journal(journal_filename)
+    journal.record('cal1', insert('work', 1))
+    journal.record('cal2', insert('work', 1))
+    with open(journal_filename, 'a') as journal_file:
+        journal_file.write('{"calendar": "cal1", "templ')
+
+    journal = Journal(journal_filename)
+    assert journal.is_confirmed('cal1', insert('work', 1))
+    assert not journal.is_confirmed('cal1', insert('work', 2))
+    # operations changed since confirmed are not skipped
+    changed = insert('work', 1)
+    changed.body['summary'] = 'Holidays'
+    assert not journal.is_confirmed('cal1', changed)
+
+    journal.compact('cal1')
+    assert not journal.is_confirmed('cal1', insert('work', 1)) and journal.is_confirmed('cal2', insert('work', 1))
+    journal.compact('cal2')
+    assert not os.path.exists(journal_filename)
+
+def test_resume_after_failure(tmp_path):
+    service = FakeCalendarService()
+    scheduler = EventScheduler(None, 'cal', 'Europe/Madrid', [], {}, [], calendar_service=service)
+    scheduler.journal = Journal(str(tmp_path / 'journal.jsonl'))
+    operations = [insert('work', 1), insert('work', 2), insert('work', 3)]
+
+    # run dies on the delete of an event which does not exist
+    with pytest.raises(HttpError):
+        scheduler.apply_plan(ReconcilePlan(operations[:2] + [Operation(Operation.DELETE, 'work', datetime.date(2020, 4, 2), event_id='missing')], 0))
+    assert service.calls['insert'] == 2
+
+    scheduler.resume = True
+    scheduler.apply_plan(ReconcilePlan(operations, 0), batch_size=50)
+    assert service.calls['insert'] == 3
+    scheduler.compact_journal()
+    assert not os.path.exists(tmp_path / 'journal.jsonl')
+
+def test_journal_is_written_on_every_run(capsys, tmp_path):
+    settings = { 'calendar_id': 'cal', 'calendar_timezone': 'Europe/Madrid' }
+    journal_filename = str(tmp_path / 'journal.jsonl')
+    scheduler = create_scheduler(settings, None, [], {}, [], False, None, resume=False, journal_filename=journal_filename)
+    scheduler.calendar_service = FakeCalendarService()
+    scheduler.apply_plan(ReconcilePlan([insert('work', 1)], 0))
+    assert os.path.exists(journal_filename)
+    scheduler.compact_journal()
+    assert not os.path.exists(journal_filename)
+
+    scheduler.journal.record('cal', insert('work', 1))
+    scheduler.failed = 1
+    scheduler.compact_journal()
+    assert os.path.exists(journal_filename)
+    assert f"Confirmed writes kept on {journal_filename}, run again with --resume" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import pytest
+from calendar_manager.month_data import MonthData, get_month_data
+from calendar_manager.event_template import EventTemplate
+
+april_dict = {
+    'month': 4,
+    'year': 2020,
+    'weeks': [{ 'week_number': '14', '1': 'D', '2': 'D', '3': 'M' }, { 'week_number': '15', '4': 'M', '5': 'M' }],
+    'days': { '1': 'D', '2': 'D', '3': 'M', '4': 'M', '5': 'M' },
+    'caregivers': { 'D': 2, 'M': 3, 'X': 0 },
+}
+
+def test_month_data_from_dict():
+    month_data = MonthData.from_dict(april_dict)
+    assert (month_data.year, month_data.month) == (2020, 4)
+    assert month_data.datetypes == (None, 'D', 'D', 'M', 'M', 'M')
+    assert list(month_data.iter_days()) == [(1, 'D'), (2, 'D'), (3, 'M'), (4, 'M'), (5, 'M')]
+    assert month_data.get_datetype(3) == 'M' and month_data.get_datetype(6) is None
+    assert month_data.count_days('M') == 3 and month_data.count_days('X') == 0
+    assert month_data.to_dict() == april_dict
+    assert get_month_data(month_data) is month_data
+    assert get_month_data(april_dict) == month_data
+
+def test_month_data_dict_access():
+    month_data = MonthData.from_dict(april_dict)
+    assert month_data['days'] == april_dict['days']
+    assert month_data.get('weeks')[0].get('week_number') == '14'
+    assert month_data.get('other') is None
+    with pytest.raises(KeyError):
+        month_data['other']
+
+def test_month_data_is_compact():
+    first = MonthData.from_days(2020, 4, [(1, ''.join(['D', 'M']))])
+    second = MonthData.from_days(2020, 5, [(1, ''.join(['D', 'M']))])
+    # datetype codes are shared by all months
+    assert first.datetypes[1] is second.datetypes[1]
+    assert not hasattr(first, '__dict__')
+    with pytest.raises(AttributeError):
+        first.year = 2021
+
+def test_event_template_weekdays():
+    template = EventTemplate('sports', 'Sports', '', ['A', 'B'], ['3', '1', '1'], '17:00', '19:00')
+    assert template.weekday_mask == 0b1010
+    assert template.weekdays == [1, 3]
+    assert template.datetypes == ('A', 'B')
+    assert template.applies_to(1, 'A') and not template.applies_to(2, 'A') and not template.applies_to(1, 'C')
+    assert not hasattr(template, '__dict__')
@@ -0,0 +1,59 @@
+import time
+import mock
+import datetime
+from calendar_manager.event_template import EventTemplate
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.fake_google import FakeCalendarService
+from calendar_manager.month_data import MonthData
+from calendar_manager.pipeline import get_months_range, run_export
+
+
+test_templates = [
+    EventTemplate('work', 'Work day', '', ["A", "B"], [0, 1, 2, 3, 4]),
+    EventTemplate('sports', 'Sports', '', ["A"], [1, 3], '17:00', '19:00'),
+]
+test_date_types = {
+    "A" : { "name": "Weekday A", "color": "1" },
+    "B" : { "name": "Weekday B", "color": "3" },
+}
+# April 2020, A on first half and B on second half
+test_month = MonthData.from_days(2020, 4, [(day, "A" if day <= 15 else "B") for day in range(1, 31)], caregivers=[("A", 15), ("B", 15)])
+april = (datetime.date(2020, 4, 1), datetime.date(2020, 4, 30))
+
+
+def wait_for_prefetch(service):
+    "Returns cells once existing events are being listed, as the sheet read does not wait for prefetch to start"
+    for i in range(100):
+        if service.calls['list']:
+            return 'cells'
+        time.sleep(0.01)
+    raise AssertionError("events were not prefetched while reading the spreadsheet")
+
+
+def test_get_months_range():
+    with mock.patch('calendar_manager.pipeline.get_today', return_value=datetime.date(2020, 3, 10)):
+        assert get_months_range('2019-2020', ['February', 'March', 'April']) == (datetime.date(2020, 3, 10), datetime.date(2020, 4, 30))
+        assert get_months_range('2019-2020', ['October', 'November']) is None
+
+
+def test_run_export():
+    service = FakeCalendarService(latency=0.001)
+    scheduler = EventScheduler(None, 'cal', 'Europe/Madrid', [], {}, [], calendar_service=service)
+    parsed = []
+
+    def parse_cells(all_cells):
+        parsed.append(all_cells)
+        return test_templates, test_date_types, test_month
+
+    with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 1)):
+        plan, summary, swept = run_export(scheduler, lambda: wait_for_prefetch(service), parse_cells, april, workers=4, queue_size=2)
+        assert parsed == ['cells']
+        # 22 work days and 4 days of sports on A weeks
+        assert plan.count('insert') == 26 and summary.count('insert') == 26 and not summary.failures
+        assert swept is None
+        assert service.calls['list'] == 1
+
+        service.reset_counters()
+        plan, summary, swept = run_export(scheduler, lambda: wait_for_prefetch(service), parse_cells, april, workers=4, sweep=True)
+    assert plan.is_empty() and plan.unchanged == 26 and swept == 0
+    assert dict(service.calls) == { 'list': 1 }
@@ -0,0 +1,85 @@
+import json
+import mock
+import datetime
+from click.testing import CliRunner
+from calendar_manager.cli import cli
+from calendar_manager.fake_google import FakeCalendarService, http_error
+from calendar_manager.plan_file import SavedPlan, save_plan, load_plan
+from calendar_manager.reconcile import Operation, ReconcilePlan
+
+
+all_cells = [
+    ['Caregivers','Name','Color','','','','',''],
+    ['D','Dad','3','','','','',''],
+    ['M','Mum','5','','','','',''],
+    ['','','','','','','',''],
+    ['Event templates','Summary','Description','Start','End','Apply to caregivers','Apply to weekdays',''],
+    ['school','School','','','','D,M','0,1,2,3,4',''],
+    ['','','','','','','',''],
+    ['April','Mo','Tu','We','Th','Fr','Sa','Su'],
+    ['14','1','2','3','4','5','6','7'],
+    [' ','D','D','M','M','M','D','D'],
+] + [['','','','','','','','']] * 8
+
+
+def test_save_and_load_plan(tmp_path):
+    plan = ReconcilePlan([
+        Operation(Operation.INSERT, 'school', datetime.date(2002, 4, 1), body={ 'id': 'abc', 'summary': 'School' }),
+        Operation(Operation.DELETE, 'school', datetime.date(2002, 4, 2), event_id='def'),
+    ], 3)
+    saved_plan = SavedPlan(plan, 'cal', 'f00', (datetime.date(2002, 4, 1), datetime.date(2002, 4, 30)), 'ba5')
+    save_plan(str(tmp_path / 'plan.json'), saved_plan)
+
+    # one operation per line
+    lines = (tmp_path / 'plan.json').read_text().splitlines()
+    assert len(lines) == 4 and json.loads(lines[2].rstrip(',')) == { 'kind': 'delete', 'template': 'school', 'date': '2002-04-02', 'id': 'def' }
+
+    loaded = load_plan(str(tmp_path / 'plan.json'))
+    assert loaded.to_dict() == saved_plan.to_dict()
+    assert [str(op) for op in loaded.plan.operations] == [str(op) for op in plan.operations]
+
+def run_cli(tmp_path, service, *args):
+    (tmp_path / 'settings.json').write_text(json.dumps({ 'calendar_id': 'cal', 'calendar_timezone': 'Europe/Madrid',
+                                                          'spreadsheet_filename': 'Custody', 'spreadsheet_tab': '2001-2002' }))
+    with mock.patch('calendar_manager.cli.read_spreadsheet', return_value=all_cells), \
+         mock.patch('calendar_manager.event_scheduler.EventScheduler.build_calendar_service', return_value=service), \
+         mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2002, 3, 1)):
+        return CliRunner().invoke(cli, ['-f', str(tmp_path / 'settings.json')] + list(args))
+
+def test_plan_and_apply(tmp_path):
+    service = FakeCalendarService()
+    plan_filename = str(tmp_path / 'plan.json')
+    result = run_cli(tmp_path, service, '--month', 'April', 'plan', '-p', plan_filename)
+    assert result.exit_code == 0 and "Plan: 5 to insert" in result.output
+    assert dict(service.calls) == { 'list': 1 }
+
+    result = run_cli(tmp_path, service, 'apply', '-p', plan_filename)
+    assert result.exit_code == 0
+    assert service.calls['insert'] == 5
+
+    # calendar changed since the plan was made
+    result = run_cli(tmp_path, service, 'apply', '-p', plan_filename)
+    assert result.exit_code == 1 and "changed since the plan was made" in result.output
+    assert service.calls['insert'] == 5
+
+def test_apply_failed_halfway_is_resumed(tmp_path):
+    service = FakeCalendarService()
+    plan_filename = str(tmp_path / 'plan.json')
+    journal_options = ['--journal-filename', str(tmp_path / 'journal.jsonl')]
+    run_cli(tmp_path, service, '--month', 'April', 'plan', '-p', plan_filename)
+
+    insert = service.events().insert
+    def fail_third_insert(**params):
+        if service.calls['insert'] == 2:
+            raise http_error(400, 'invalid')
+        return insert(**params)
+
+    # run dies without --resume, after two inserts
+    with mock.patch.object(service.events(), 'insert', side_effect=fail_third_insert):
+        result = run_cli(tmp_path, service, *journal_options, 'apply', '-p', plan_filename)
+    assert result.exit_code != 0 and service.calls['insert'] == 2
+
+    result = run_cli(tmp_path, service, *journal_options, '--resume', 'apply', '-p', plan_filename)
+    assert result.exit_code == 0 and "Resuming, 2 operations were already confirmed." in result.output
+    assert service.calls['insert'] == 5
+    assert not (tmp_path / 'journal.jsonl').exists()
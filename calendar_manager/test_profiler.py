@@ -0,0 +1,48 @@
+import json
+import datetime
+import mock
+from calendar_manager import profiler
+from calendar_manager.profiler import Profiler, percentile
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.event_template import EventTemplate
+from calendar_manager.fake_google import FakeCalendarService
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 90) == 4
+    assert percentile([5], 99) == 5
+
+def test_report():
+    ticks = iter([0.0, 1.0, 3.0, 10.0])
+    run_profiler = Profiler(clock=lambda: next(ticks))
+    with run_profiler.phase('parse'):
+        run_profiler.record_call('calendar.events.insert', 0.2, 100)
+        run_profiler.record_call('calendar.events.insert', 0.4, 50, retries=2, status=403)
+    report = run_profiler.get_report()
+    assert report['phases'] == { 'parse': 2.0 }
+    assert report['totals']['calls'] == 2 and report['totals']['errors'] == 1 and report['totals']['wall_time'] == 10.0
+    insert = report['operations']['calendar.events.insert']
+    assert insert['payload_bytes'] == 150 and insert['retries'] == 2 and insert['statuses'] == { '200': 1, '403': 1 }
+    assert insert['p50'] == 0.2 and insert['max'] == 0.4
+
+def test_profile_scheduling(tmp_path):
+    templates = [EventTemplate('work', 'Work day', '', ["A"], [0, 1, 2, 3, 4])]
+    event_data = { "year": 2020, "month": 4, "days": { "20": "A", "21": "A" }, "caregivers": { "A": 2 } }
+    scheduler = EventScheduler(None, 'calendar', 'Europe/Madrid', templates, { "A": { "color": "1" } }, event_data,
+                               calendar_service=FakeCalendarService())
+    run_profiler = profiler.start_profiling()
+    try:
+        with mock.patch('calendar_manager.event_scheduler.get_today', return_value=datetime.date(2020, 4, 20)):
+            scheduler.schedule_events(batch_size=50)
+    finally:
+        profiler.stop_profiling()
+    report = run_profiler.get_report()
+    assert sorted(report['operations'].keys()) == ['calendar.batch', 'calendar.events.list']
+    assert sorted(report['phases'].keys()) == ['prefetch', 'writes']
+
+    run_profiler.write_report(str(tmp_path / 'profile.json'))
+    assert json.load(open(tmp_path / 'profile.json'))['totals']['calls'] == 2
+    run_profiler.write_report(str(tmp_path / 'profile.txt'))
+    assert "calendar.batch" in open(tmp_path / 'profile.txt').read()
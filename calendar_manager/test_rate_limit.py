@@ -0,0 +1,66 @@
+import pytest
+import httplib2
+from googleapiclient.errors import HttpError
+from calendar_manager.rate_limit import TokenBucket, is_retryable, execute_with_backoff
+
+
+def http_error(status, content=b''):
+    return HttpError(httplib2.Response({ 'status': status }), content)
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FlakyRequest():
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return { 'id': 'evt1' }
+
+
+def test_token_bucket():
+    fake = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=fake.clock, sleep=fake.sleep)
+    for i in range(6):
+        bucket.acquire()
+    # 2 calls as a burst, then one every 0.5 seconds
+    assert fake.now == pytest.approx(2.0)
+
+def test_is_retryable():
+    assert is_retryable(http_error(429))
+    assert is_retryable(http_error(503))
+    assert is_retryable(http_error(403, b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}'))
+    assert not is_retryable(http_error(403, b'{"error": {"errors": [{"reason": "forbidden"}]}}'))
+    assert not is_retryable(http_error(404))
+    assert not is_retryable(ValueError())
+
+def test_execute_with_backoff():
+    fake = FakeClock()
+    request = FlakyRequest([http_error(429), http_error(500)])
+    assert execute_with_backoff(request, sleep=fake.sleep) == { 'id': 'evt1' }
+    assert request.calls == 3
+    assert len(fake.sleeps) == 2
+
+    request = FlakyRequest([http_error(429)] * 3)
+    with pytest.raises(HttpError):
+        execute_with_backoff(request, max_retries=2, sleep=fake.sleep)
+
+    request = FlakyRequest([http_error(409)])
+    with pytest.raises(HttpError):
+        execute_with_backoff(request, sleep=fake.sleep)
+    assert request.calls == 1
@@ -1,6 +1,11 @@
+import os
+import mock
 import pytest
-from calendar_manager.read_gspread import get_month_number, get_year, get_all_cells_from_spreadsheet, find_cell, get_table, read_month, get_event_templates, get_caregivers
+from concurrent.futures import ThreadPoolExecutor
+from calendar_manager.read_gspread import get_month_number, get_year, get_all_cells_from_spreadsheet, SheetIndex, find_cell, get_table, read_month, get_event_templates, get_caregivers
+from calendar_manager.read_gspread import locate_anchors, get_anchor_ranges, place_ranges, get_cell, get_school_year_months, read_months, get_cells_from_ranges, load_anchors, save_anchors
 from calendar_manager.event_template import EventTemplate
+from calendar_manager.fake_google import FakeSpreadsheet
 
 def test_get_month_number():
     assert get_month_number('Foo') == 0
@@ -20,6 +25,31 @@ def test_find_cell():
     with pytest.raises(ValueError):
         find_cell(all_cells, 'Foo')
 
+def test_get_school_year_months():
+    assert len(get_school_year_months()) == 12
+    assert get_school_year_months()[0] == 'July'
+    assert get_school_year_months('November', 'February') == ['November', 'December', 'January', 'February']
+    with pytest.raises(ValueError):
+        get_school_year_months('February', 'November')
+    with pytest.raises(ValueError):
+        get_school_year_months('Foo')
+
+def test_sheet_index():
+    all_cells = [
+        ['Caregivers','Name','Color'],
+        ['D','Dad','3'],
+        ['M','Mum','5'],
+        ['March','Mo','Tu','We','Th','Fr','Sa','Su'],
+        ['9','','','','','','','M'],
+    ]
+    sheet = SheetIndex(all_cells)
+    assert sheet.find('March') == (3, 0)
+    assert sheet.find('M') == (2, 0)
+    assert find_cell(sheet, 'Mum') == find_cell(all_cells, 'Mum') == (2, 1)
+    with pytest.raises(ValueError):
+        sheet.find('Foo')
+    assert get_caregivers(sheet) == get_caregivers(all_cells)
+
 def test_get_table():
     all_cells = get_all_cells_from_spreadsheet('creds.json', 'Calendario de custodia compartida Elena', '2019-2020')
     assert get_table(all_cells, 'March', 3, 2) == [['March','L','M'],['9',' ',' ']]
@@ -108,4 +138,118 @@ def test_get_caregivers():
     ]
     assert type(get_caregivers(all_cells)) == dict
     assert get_caregivers(all_cells).get('D').get('name') == 'Dad'
-    assert get_caregivers(all_cells).get('M').get('color') == '5'
\ No newline at end of file
+    assert get_caregivers(all_cells).get('M').get('color') == '5'
+
+def test_get_anchor_ranges():
+    all_cells = [
+        ['','Caregivers','Name','Color'],
+        ['','D','Dad','3'],
+        ['Event templates','Summary','Description','Start','End','Apply to caregivers','Apply to weekdays'],
+        ['piano','Piano lesson','Piano lesson at school (Tue,Thu)','17:00','18:00','D','1,3'],
+        ['','','','March','Mo','Tu','We','Th','Fr','Sa','Su'],
+    ]
+    anchors = locate_anchors(all_cells, ['March'])
+    assert anchors['March'] == (4, 3)
+    assert get_anchor_ranges(anchors, ['March']) == ['D5:K15', 'A3:G', 'B1:D']
+
+def test_place_ranges():
+    value_ranges = [{ 'values': [['March','Mo'],[],['9','1']] }, { 'values': [['Caregivers','Name','Color']] }]
+    all_cells = place_ranges(['C2:J12', 'A1:C'], value_ranges)
+    assert len(all_cells) == 12 and all(len(row) == 10 for row in all_cells)
+    assert all_cells[0][:4] == ['Caregivers','Name','Color',''] and all_cells[1][:5] == ['','','March','Mo','']
+    assert all_cells[3][:5] == ['','','9','1',''] and all_cells[11] == [''] * 10
+    assert get_cell(all_cells, 1, 2) == 'March'
+    assert get_cell(all_cells, 2, 2) == ''
+    assert find_cell(all_cells, '9') == (3, 2)
+
+def test_read_months():
+    all_cells = [
+        ['Caregivers','Name','Color'],
+        ['D','Dad','3'],
+        ['M','Mum','5'],
+        ['March','Mo','Tu','We','Th','Fr','Sa','Su','April','Mo','Tu','We','Th','Fr','Sa','Su'],
+        ['9','','','','','','','1','14','','','1','2','3','4','5'],
+        [' ','','','','','','','M',' ','','','D','D','M','M','M'],
+    ] + [['','','','','','','','','','','','','','','','']] * 8
+    months = read_months(all_cells, '2001-2002', ['March', 'April'])
+    assert [m['month'] for m in months] == [3, 4]
+    assert months[1]['days'] == { '1': 'D', '2': 'D', '3': 'M', '4': 'M', '5': 'M' }
+    with pytest.raises(ValueError):
+        read_months(all_cells, '2001-2002', ['February', 'March'])
+    assert [m['month'] for m in read_months(all_cells, '2001-2002', get_school_year_months(), skip_missing=True)] == [3, 4]
+
+def test_read_months_from_trimmed_ranges():
+    # February 2002 ends on a Thursday, and its last week rows are empty
+    cells = [
+        ['Caregivers','Name','Color','','','','',''],
+        ['D','Dad','','','','','',''],
+        ['M','Mum','5','','','','',''],
+        ['','','','','','','',''],
+        ['Event templates','Summary','Description','Start','End','Apply to caregivers','Apply to weekdays',''],
+        ['school','School','','','','D,M','0,1,2,3,4',''],
+        ['','','','','','','',''],
+        ['February','Mo','Tu','We','Th','Fr','Sa','Su'],
+        ['5','','','','','1','2','3'],
+        [' ','','','','','D','D','M'],
+        ['6','4','5','6','7','8','9','10'],
+        [' ','M','M','D','D','D','M','M'],
+        ['7','11','12','13','14','15','16','17'],
+        [' ','D','D','M','M','M','D','D'],
+        ['8','18','19','20','21','22','23','24'],
+        [' ','M','M','D','D','D','M','M'],
+        ['9','25','26','27','28','',' ',''],
+        [' ','D','D','M','M','','',''],
+        ['','','','','','','',''],
+    ]
+    spreadsheet = FakeSpreadsheet({ '2001-2002': cells })
+    anchors = locate_anchors(cells, ['February'])
+    with mock.patch('calendar_manager.read_gspread.open_worksheet', return_value=spreadsheet.worksheet('2001-2002')):
+        all_cells, _ = get_cells_from_ranges('creds.json', 'Custody', '2001-2002', ['February'], anchors)
+    assert spreadsheet.calls['values.batchGet'] == 1 and 'values.get' not in spreadsheet.calls
+    assert get_caregivers(all_cells)['D'] == { 'name': 'Dad', 'color': '' }
+    months = read_months(all_cells, '2001-2002', ['February'])
+    assert len(months[0]['days']) == 28
+
+def test_month_added_after_anchors_were_saved(tmp_path):
+    cells = [
+        ['Caregivers','Name','Color','','','','',''],
+        ['D','Dad','3','','','','',''],
+        ['','','','','','','',''],
+        ['Event templates','Summary','Description','Start','End','Apply to caregivers','Apply to weekdays',''],
+        ['school','School','','','','D','0,1,2,3,4',''],
+        ['','','','','','','',''],
+    ]
+    spreadsheet = FakeSpreadsheet({ '2001-2002': cells })
+    anchors_filename = str(tmp_path / 'anchors.json')
+
+    def read_march():
+        anchors = load_anchors(anchors_filename, 'Custody', '2001-2002')
+        with mock.patch('calendar_manager.read_gspread.open_worksheet', return_value=spreadsheet.worksheet('2001-2002')):
+            all_cells, anchors = get_cells_from_ranges('creds.json', 'Custody', '2001-2002', ['March'], anchors)
+        save_anchors(anchors_filename, 'Custody', '2001-2002', anchors)
+        return all_cells
+
+    read_march()
+    assert load_anchors(anchors_filename, 'Custody', '2001-2002')['March'] is None
+
+    # March is added to the worksheet after the first run
+    cells.append(['March','Mo','Tu','We','Th','Fr','Sa','Su'])
+    cells.append(['9','','','','','','','1'])
+    cells.append([' ','','','','','','','D'])
+    cells.extend([['','','','','','','','']] * 8)
+    spreadsheet.reset_counters()
+    assert [m['month'] for m in read_months(read_march(), '2001-2002', ['March'])] == [3]
+    assert spreadsheet.calls['values.get'] == 1
+    assert load_anchors(anchors_filename, 'Custody', '2001-2002')['March'] == (6, 0)
+
+    spreadsheet.reset_counters()
+    assert [m['month'] for m in read_months(read_march(), '2001-2002', ['March'])] == [3]
+    assert dict(spreadsheet.calls) == { 'values.batchGet': 1 }
+
+def test_save_anchors_concurrently(tmp_path):
+    anchors_filename = str(tmp_path / 'anchors.json')
+    tabs = [f'tab{idx}' for idx in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda tab: save_anchors(anchors_filename, 'Custody', tab, { 'Caregivers': (0, 0) }), tabs))
+    assert all(load_anchors(anchors_filename, 'Custody', tab) == { 'Caregivers': (0, 0) } for tab in tabs)
+    assert os.listdir(tmp_path) == ['anchors.json']
@@ -0,0 +1,36 @@
+import datetime
+from calendar_manager.reconcile import Operation, diff_event, reconcile
+
+
+desired_body = {
+    "summary": "Sports",
+    "description": "",
+    "start": { "dateTime": "2020-04-21T17:00:00", "timeZone": "Europe/Madrid" },
+    "end": { "dateTime": "2020-04-21T19:00:00", "timeZone": "Europe/Madrid" },
+    "colorId": "1",
+}
+existing_event = {
+    "id": "evt1",
+    "summary": "Sports",
+    "start": { "dateTime": "2020-04-21T17:00:00+02:00", "timeZone": "Europe/Madrid" },
+    "end": { "dateTime": "2020-04-21T19:00:00+02:00", "timeZone": "Europe/Madrid" },
+    "colorId": "1",
+}
+
+def test_diff_event():
+    assert diff_event(desired_body, existing_event) == {}
+    assert diff_event(desired_body, dict(existing_event, colorId="3")) == { "colorId": "1" }
+    moved = dict(existing_event, end={ "dateTime": "2020-04-21T20:00:00+02:00", "timeZone": "Europe/Madrid" })
+    assert sorted(diff_event(desired_body, moved).keys()) == ['end', 'start']
+
+def test_reconcile():
+    day = datetime.date(2020, 4, 21)
+    plan = reconcile(
+        { ('sports', day): desired_body, ('new', day): desired_body, ('renamed', day): dict(desired_body, summary="Tennis") },
+        { ('sports', day): existing_event, ('old', day): dict(existing_event, id="evt2"), ('renamed', day): dict(existing_event, id="evt3") },
+    )
+    assert plan.unchanged == 1
+    assert [(op.kind, op.template_name) for op in plan.operations] == [
+        (Operation.INSERT, 'new'), (Operation.DELETE, 'old'), (Operation.PATCH, 'renamed')]
+    assert plan.operations[1].event_id == "evt2"
+    assert plan.operations[2].body == { "summary": "Tennis" }
@@ -0,0 +1,72 @@
+import datetime
+from calendar_manager.reconcile import Operation
+from calendar_manager.month_data import MonthData
+from calendar_manager.recurrence import compress_events, reconcile_series, get_series_dates, get_school_period_start
+
+
+def sports_body(event_date, color="1"):
+    return {
+        "id": f"single{event_date.day}",
+        "summary": "Sports",
+        "start": { "dateTime": f"{event_date.isoformat()}T17:00:00", "timeZone": "Europe/Madrid" },
+        "end": { "dateTime": f"{event_date.isoformat()}T19:00:00", "timeZone": "Europe/Madrid" },
+        "colorId": color,
+    }
+
+# Tue and Thu of April 2020, except Thu 16 (datetype without sports) and Tue 21 (other color)
+sports_dates = [datetime.date(2020, 4, d) for d in (7, 9, 14, 23, 28, 30)]
+desired_events = dict((('sports', d), sports_body(d)) for d in sports_dates)
+desired_events[('sports', datetime.date(2020, 4, 21))] = sports_body(datetime.date(2020, 4, 21), color="3")
+
+def test_compress_events():
+    series_list, singles = compress_events(desired_events, 'cal', datetime.date(2020, 4, 1))
+    assert list(singles.keys()) == [('sports', datetime.date(2020, 4, 21))]
+    assert len(series_list) == 1
+    body = series_list[0].body
+    assert body['start']['dateTime'] == '2020-04-07T17:00:00'
+    assert body['recurrence'] == [
+        "RRULE:FREQ=WEEKLY;BYDAY=TU,TH;COUNT=8",
+        "EXDATE;TZID=Europe/Madrid:20200416T170000,20200421T170000",
+    ]
+    # series ids do not change from one run to the next
+    assert body['id'] == compress_events(desired_events, 'cal', datetime.date(2020, 4, 1))[0][0].body['id']
+    assert get_series_dates(body) == sports_dates
+
+def test_school_period_start():
+    months = [MonthData.from_days(2020, month, [], [], []) for month in (4, 5)]
+    assert get_school_period_start(months) == datetime.date(2019, 7, 1)
+    assert get_school_period_start([MonthData.from_days(2019, 9, [], [], [])] + months) == datetime.date(2019, 7, 1)
+
+def test_keep_dates():
+    series = compress_events(desired_events, 'cal', datetime.date(2019, 7, 1))[0][0]
+    series.keep_dates([datetime.date(2020, 3, 31), datetime.date(2020, 4, 9)])
+    assert series.kept_dates == [datetime.date(2020, 3, 31)]
+    assert series.body['start'] == { "dateTime": "2020-03-31T17:00:00", "timeZone": "Europe/Madrid" }
+    assert series.body['end']['dateTime'] == "2020-03-31T19:00:00"
+    assert get_series_dates(series.body) == [datetime.date(2020, 3, 31)] + sports_dates
+    # only desired occurrences are compared with the instances on scheduled days
+    assert series.dates == sports_dates
+
+def test_reconcile_series():
+    series_list, singles = compress_events(desired_events, 'cal', datetime.date(2020, 4, 1))
+    series_id = series_list[0].body['id']
+    operations, unchanged = reconcile_series(series_list, {})
+    assert [op.kind for op in operations] == [Operation.INSERT]
+    operations, unchanged = reconcile_series(series_list, {}, existing_series_ids={series_id})
+    assert [(op.kind, op.event_id) for op in operations] == [(Operation.PATCH, series_id)]
+
+    def instance(event_date, series_id):
+        return dict(sports_body(event_date), id=f"{series_id}_{event_date:%Y%m%d}", recurringEventId=series_id,
+                    extendedProperties={ "private": { "template_name": "sports" } })
+
+    instances = dict((('sports', d), instance(d, series_id)) for d in sports_dates)
+    assert reconcile_series(series_list, instances) == ([], 1)
+
+    instances[('sports', datetime.date(2020, 4, 30))]['summary'] = "Tennis"
+    operations, unchanged = reconcile_series(series_list, instances)
+    assert [(op.kind, op.event_id) for op in operations] == [(Operation.PATCH, series_id)]
+
+    old_instances = dict((('sports', d), instance(d, 'oldseries')) for d in sports_dates[:2])
+    operations, unchanged = reconcile_series([], old_instances)
+    assert [(op.kind, op.event_id) for op in operations] == [
+        (Operation.DELETE, 'oldseries_20200407'), (Operation.DELETE, 'oldseries_20200409')]
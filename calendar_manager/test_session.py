@@ -0,0 +1,60 @@
+import json
+import mock
+import pytest
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from calendar_manager.session import Session, SCOPES
+
+
+@pytest.fixture
+def credentials_filename(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    filename = tmp_path / 'creds.json'
+    filename.write_text(json.dumps({
+        'type': 'service_account',
+        'project_id': 'test',
+        'private_key_id': '1',
+        'private_key': pem.decode('utf-8'),
+        'client_email': 'test@test.iam.gserviceaccount.com',
+        'client_id': '1',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    }))
+    return str(filename)
+
+
+def fake_refresh(credentials, request):
+    credentials.token = 'fresh'
+    credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+def test_token_is_fetched_once_and_cached(credentials_filename, tmp_path):
+    cache_filename = str(tmp_path / 'tokens.json')
+    with mock.patch('google.oauth2.service_account.Credentials.refresh', autospec=True, side_effect=fake_refresh) as refresh:
+        session = Session(credentials_filename, cache_filename)
+        assert session.get_credentials().token == 'fresh'
+        session.get_credentials()
+        # a new run uses the cached token
+        assert Session(credentials_filename, cache_filename).get_credentials().token == 'fresh'
+    assert refresh.call_count == 1
+    assert json.load(open(cache_filename))['test@test.iam.gserviceaccount.com']['scopes'] == SCOPES
+
+def test_expired_token_is_refreshed(credentials_filename, tmp_path):
+    cache_filename = str(tmp_path / 'tokens.json')
+    expiry = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+    with open(cache_filename, 'w') as cache_file:
+        json.dump({ 'test@test.iam.gserviceaccount.com': { 'token': 'old', 'expiry': expiry, 'scopes': SCOPES } }, cache_file)
+    with mock.patch('google.oauth2.service_account.Credentials.refresh', autospec=True, side_effect=fake_refresh):
+        assert Session(credentials_filename, cache_filename).get_credentials().token == 'fresh'
+
+def test_clients_share_credentials_and_transport(credentials_filename, tmp_path):
+    with mock.patch('google.oauth2.service_account.Credentials.refresh', autospec=True, side_effect=fake_refresh):
+        session = Session(credentials_filename, str(tmp_path / 'tokens.json'))
+        calendar_service = session.build('calendar', 'v3')
+        drive_service = session.build('drive', 'v3')
+        gspread_client = session.get_gspread_client()
+    assert session.build('calendar', 'v3') is calendar_service
+    assert calendar_service._http is drive_service._http is session.get_http()
+    assert session.get_http().credentials is session.credentials
+    assert gspread_client is not None and session.requests_session.credentials is session.credentials
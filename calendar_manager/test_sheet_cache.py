@@ -0,0 +1,28 @@
+import mock
+from calendar_manager.sheet_cache import SheetCache, is_snapshot_current, get_cached_cells
+
+
+metadata = { 'id': 'sheet1', 'name': 'Custody calendar', 'modifiedTime': '2020-04-01T10:00:00.000Z', 'version': '42' }
+cells = [['Caregivers','Name','Color'], ['D','Dad','3']]
+
+def test_sheet_cache(tmp_path):
+    cache = SheetCache(str(tmp_path))
+    assert cache.load('sheet1', '2019-2020') is None
+    cache.save(metadata, '2019-2020', cells)
+    assert cache.load('sheet1', '2019-2020')['cells'] == cells
+    assert cache.find('Custody calendar', '2019-2020')['cells'] == cells
+    assert cache.find('Custody calendar', '2020-2021') is None
+
+def test_is_snapshot_current(tmp_path):
+    snapshot = SheetCache(str(tmp_path)).save(metadata, '2019-2020', cells)
+    assert is_snapshot_current(snapshot, metadata)
+    assert not is_snapshot_current(snapshot, dict(metadata, version='43', modifiedTime='2020-04-02T10:00:00.000Z'))
+    assert not is_snapshot_current(None, metadata)
+
+def test_get_cached_cells(tmp_path):
+    with mock.patch('calendar_manager.sheet_cache.get_spreadsheet_metadata', return_value=metadata), \
+         mock.patch('calendar_manager.sheet_cache.get_all_cells_from_spreadsheet', return_value=cells) as download:
+        assert get_cached_cells('creds.json', 'Custody calendar', '2019-2020', str(tmp_path)) == cells
+        assert get_cached_cells('creds.json', 'Custody calendar', '2019-2020', str(tmp_path)) == cells
+        assert download.call_count == 1
+    assert get_cached_cells('creds.json', 'Custody calendar', '2019-2020', str(tmp_path), offline=True) == cells
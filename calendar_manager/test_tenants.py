@@ -0,0 +1,58 @@
+import mock
+import datetime
+from click.testing import CliRunner
+from calendar_manager.tenants import find_settings_files, run_tenants, print_tenants_summary
+from calendar_manager.cli import cli
+from calendar_manager.event_scheduler import EventScheduler
+from calendar_manager.fake_google import FakeCalendarService
+from calendar_manager.reconcile import Operation, ReconcilePlan
+
+
+def fake_run(settings_filename):
+    print(f"Scheduling {settings_filename} ...")
+    if 'broken' in settings_filename:
+        raise ValueError("Caregiver X not declared.")
+    return { 'months': 1, 'insert': 3 }
+
+
+def test_find_settings_files(tmp_path):
+    for name in ['b.json', 'a.json', 'notes.txt']:
+        (tmp_path / name).write_text('{}')
+    assert find_settings_files(str(tmp_path)) == [str(tmp_path / 'a.json'), str(tmp_path / 'b.json')]
+    (tmp_path / 'manifest').write_text("# households\nb.json\n\nother/c.json\n")
+    assert find_settings_files(str(tmp_path / 'manifest')) == [str(tmp_path / 'b.json'), str(tmp_path / 'other/c.json')]
+
+def test_run_tenants_isolates_failures(capsys, tmp_path):
+    results = run_tenants(['first.json', 'broken.json', 'last.json'], fake_run, jobs=2)
+    assert [result.succeeded() for result in results] == [True, False, True]
+    assert results[1].error == "Caregiver X not declared."
+    assert results[2].counts == { 'months': 1, 'insert': 3 }
+    assert "Scheduling last.json" in results[2].output and "first.json" not in results[2].output
+    print_tenants_summary(results)
+    out = capsys.readouterr().out
+    assert "=== broken (broken.json) ===" in out
+    assert "2 tenants succeeded, 1 failed." in out
+
+    run_tenants(['first.json'], fake_run, log_dir=str(tmp_path / 'logs'))
+    assert (tmp_path / 'logs' / 'first.log').read_text() == "Scheduling first.json ...\n"
+
+def test_tenants_command(tmp_path):
+    for name in ['home.json', 'broken.json']:
+        (tmp_path / name).write_text('{}')
+    with mock.patch('calendar_manager.cli.run', side_effect=lambda settings_filename, **options: fake_run(settings_filename)) as run:
+        result = CliRunner().invoke(cli, ['--month', 'April', '--schedule', 'tenants', str(tmp_path), '-j', '2'])
+    assert result.exit_code == 1
+    assert "1 tenants succeeded, 1 failed." in result.output
+    assert run.call_args.kwargs['month_names'] == ['April'] and run.call_args.kwargs['schedule']
+    # tenants share the rate limiter
+    assert run.call_args_list[0].kwargs['rate_limiter'] is run.call_args_list[1].kwargs['rate_limiter']
+
+def test_run_tenants_captures_worker_threads(tmp_path):
+    def run(settings_filename):
+        scheduler = EventScheduler(None, 'cal', 'Europe/Madrid', [], {}, [], calendar_service=FakeCalendarService())
+        operations = [Operation(Operation.INSERT, 'work', datetime.date(2020, 4, day),
+                                body={ 'id': f'work{day}', 'start': { 'date': '2020-04-01' }, 'end': { 'date': '2020-04-01' } }) for day in range(1, 4)]
+        scheduler.apply_plan(ReconcilePlan(operations, 0), workers=3)
+
+    run_tenants(['home.json'], run, log_dir=str(tmp_path / 'logs'))
+    assert (tmp_path / 'logs' / 'home.log').read_text().count("Applying insert") == 3
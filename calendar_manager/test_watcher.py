@@ -0,0 +1,50 @@
+import copy
+import mock
+import urllib.request
+from calendar_manager.watcher import SheetWatcher, start_webhook
+
+
+all_cells = [
+    ['Caregivers','Name','Color','','','','','','','','','','','','',''],
+    ['D','Dad','3','','','','','','','','','','','','',''],
+    ['M','Mum','5','','','','','','','','','','','','',''],
+    ['','','','','','','','','','','','','','','',''],
+    ['Event templates','Summary','Description','Start','End','Apply to caregivers','Apply to weekdays','','','','','','','','',''],
+    ['school','School','','','','D,M','0,1,2,3,4','','','','','','','','',''],
+    ['','','','','','','','','','','','','','','',''],
+    ['March','Mo','Tu','We','Th','Fr','Sa','Su','April','Mo','Tu','We','Th','Fr','Sa','Su'],
+    ['9','','','','','','','1','14','','','1','2','3','4','5'],
+    [' ','','','','','','','M',' ','','','D','D','M','M','M'],
+] + [['','','','','','','','','','','','','','','','']] * 8
+
+
+def watch_changes(sheets):
+    "Runs a check per sheet version in `sheets`, returning the months changed on each"
+    on_change = mock.Mock()
+    watcher = SheetWatcher('creds.json', 'Custody', '2001-2002', ['March', 'April', 'May'], on_change)
+    versions = [{ 'modifiedTime': f"2021-01-0{i + 1}T00:00:00Z" if cells is not None else "2021-01-01T00:00:00Z" }
+                for i, cells in enumerate(sheets)]
+    with mock.patch('calendar_manager.watcher.get_spreadsheet_metadata', side_effect=versions), \
+         mock.patch('calendar_manager.watcher.get_all_cells_from_spreadsheet', side_effect=[cells for cells in sheets if cells is not None]) as get_cells:
+        changes = [watcher.check() for cells in sheets]
+    return changes, get_cells.call_count
+
+def test_only_changed_months_are_reported():
+    april_changed = copy.deepcopy(all_cells)
+    april_changed[9][11] = 'M'
+    template_changed = copy.deepcopy(april_changed)
+    template_changed[5][6] = '0,1,2,3'
+    # None stands for a check where the spreadsheet was not modified
+    changes, reads = watch_changes([all_cells, None, april_changed, template_changed])
+    assert changes == [['March', 'April'], [], ['April'], ['March', 'April']]
+    assert reads == 3
+
+def test_webhook_notifies_watcher():
+    watcher = SheetWatcher('creds.json', 'Custody', '2001-2002', ['March'], mock.Mock())
+    server = start_webhook(watcher, 0)
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/notify", method='POST', data=b'')
+        assert urllib.request.urlopen(request).status == 204
+        assert watcher.notified.is_set()
+    finally:
+        server.shutdown()
@@ -0,0 +1,102 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from calendar_manager.read_gspread import get_all_cells_from_spreadsheet, get_block_hashes
+from calendar_manager.sheet_cache import get_spreadsheet_metadata
+
+
+DEFAULT_INTERVAL = 60
+
+
+class SheetWatcher():
+    """Watches `worksheet` of spreadsheet `spreadsheet_filename`, calling
+    `on_change(all_cells, month_names)` with the months of `month_names` whose block
+    changed since last check, or all of them when event templates or caregivers changed.
+
+    Every check costs a single Google Drive metadata call while the spreadsheet is not
+    modified. When it is, the worksheet is read and the blocks are compared by hash,
+    so that only changed months are parsed and reconciled. The first check reports
+    every month found on the worksheet.
+    """
+    def __init__(self, credentials_filename, spreadsheet_filename, worksheet, month_names, on_change, interval=DEFAULT_INTERVAL):
+        self.credentials_filename = credentials_filename
+        self.spreadsheet_filename = spreadsheet_filename
+        self.worksheet = worksheet
+        self.month_names = month_names
+        self.on_change = on_change
+        self.interval = interval
+        self.version = None
+        self.hashes = {}
+        self.notified = threading.Event()
+
+
+    def notify(self):
+        "Makes the watcher check right away instead of waiting for the interval to end"
+        self.notified.set()
+
+
+    def check(self):
+        "Checks the spreadsheet once, returning the months reported as changed"
+        metadata = get_spreadsheet_metadata(self.credentials_filename, self.spreadsheet_filename)
+        version = (metadata['modifiedTime'], metadata.get('version'))
+        if version == self.version:
+            return []
+
+        print(f"Spreadsheet '{self.spreadsheet_filename}' modified at {metadata['modifiedTime']} ...")
+        all_cells = get_all_cells_from_spreadsheet(self.credentials_filename, self.spreadsheet_filename, self.worksheet)
+        hashes = get_block_hashes(all_cells, self.month_names)
+
+        if hashes['tables'] != self.hashes.get('tables'):
+            changed = [month_name for month_name in self.month_names if hashes[month_name] is not None]
+        else:
+            changed = [month_name for month_name in self.month_names
+                       if hashes[month_name] is not None and hashes[month_name] != self.hashes.get(month_name)]
+
+        if changed:
+            print(f"Months changed: {', '.join(changed)}")
+            self.on_change(all_cells, changed)
+        else:
+            print("No changes on the months watched.")
+
+        # only remembered once changes are applied, so that failed ones are retried on next check
+        self.version = version
+        self.hashes = hashes
+        return changed
+
+
+    def watch(self, max_checks=None):
+        """Checks the spreadsheet every `interval` seconds, or when notified, until
+        interrupted or `max_checks` checks are done. A failing check is reported and
+        retried on next check, so that the watcher keeps running.
+        """
+        checks = 0
+        while max_checks is None or checks < max_checks:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Check failed: {e}")
+            checks += 1
+            if max_checks is None or checks < max_checks:
+                self.notified.wait(self.interval)
+                self.notified.clear()
+
+
+def start_webhook(watcher, port, host='127.0.0.1'):
+    """Starts a local HTTP endpoint notifying `watcher` on every POST request, as a stand-in
+    for Google Drive push notifications, which could be relayed to it. Returns the server,
+    which serves requests on a daemon thread.
+    """
+    class NotificationHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            state = self.headers.get('X-Goog-Resource-State', 'notification')
+            print(f"Received {state} on {self.path}, checking spreadsheet ...")
+            watcher.notify()
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), NotificationHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Listening for change notifications on http://{host}:{server.server_address[1]}/ ...")
+    return server
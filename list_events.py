@@ -1,5 +1,7 @@
 import datetime
+from itertools import islice
 from calendar_manager.cal_setup import get_calendar_service
+from calendar_manager.event_iterator import iter_events
 
 # FIXME change to variable
 CALENDAR = '0nv7r8l3d0h9vp2av45nudjj5s@group.calendar.google.com'
@@ -9,16 +11,15 @@ def main():
     # Call the Calendar API
     now = datetime.datetime.utcnow().isoformat() + 'Z' # 'Z' indicates UTC time
     print('Getting List of 10 events')
-    events_result = service.events().list(calendarId=CALENDAR, timeMin=now,
-                                        maxResults=10, singleEvents=True,
-                                        orderBy='startTime').execute()
-    events = events_result.get('items', [])
+    events = islice(iter_events(service, CALENDAR, now, page_size=10, singleEvents=True, orderBy='startTime'), 10)
 
-    if not events:
-        print('No upcoming events found.')
+    listed = 0
     for event in events:
         start = event['start'].get('dateTime', event['start'].get('date'))
         print(start, event['summary'])
+        listed += 1
+    if not listed:
+        print('No upcoming events found.')
 
 if __name__ == '__main__':
     main()
@@ -21,7 +21,7 @@ REQUIRES_PYTHON = ">=3.7.0"
 VERSION = "0.2.0"
 
 # What packages are required for this module to be executed?
-REQUIRED = ["click", "requests", "gspread", "oauth2client", "PyOpenSSL", "google-api-python-client"]
+REQUIRED = ["click", "requests", "gspread", "google-auth", "google-auth-httplib2", "PyOpenSSL", "google-api-python-client"]
 
 # What packages are optional?
 EXTRAS = {